@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import uvicorn
+from a2wsgi import WSGIMiddleware
+
+# Рабочие потоки для блокирующих вызовов базы: столько запросов выполняется
+# одновременно, остальные ждут в цикле событий, не занимая потоков
+DEFAULT_WORKERS = 32
+# Сколько ждать завершения начатых запросов при остановке, секунд
+GRACEFUL_TIMEOUT = 30
+
+
+class KnowledgeBaseASGI:
+    # ASGI-приложение с маршрутами search.py. Соединения и ожидание тела
+    # запроса обслуживает цикл событий, сами обработчики Flask (чтение и
+    # запись базы, сериализация) выполняются в ограниченном пуле потоков.
+    # При остановке (lifespan.shutdown) пул дожидается начатых запросов,
+    # после чего база дописывает очередь мутаций, журнал и индексы.
+    # Процесс с базой один: у неё единственный поток записи. Чтение
+    # масштабируется процессами-репликами (--replicas, replica.ReadReplica).
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        # search открывает базу при импорте, поэтому импортируется здесь, в
+        # процессе, который будет обслуживать запросы
+        import search
+        self.search = search
+        self.workers = workers
+        self.wsgi = WSGIMiddleware(search.app, workers=workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                logging.info(f"ASGI-сервер запущен, потоков для запросов: {self.workers}.")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                except Exception as e:
+                    logging.error(f"Ошибка при остановке сервера: {e}")
+                    await send({"type": "lifespan.shutdown.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def shutdown(self):
+        self.wsgi.executor.shutdown(wait=True)
+        self.search.db.close()
+        logging.info("ASGI-сервер остановлен, база закрыта.")
+
+
+def __getattr__(name):
+    # Для запуска внешним сервером: uvicorn asgi_server:app (число потоков —
+    # KB_WORKERS). Приложение создаётся при первом обращении, чтобы процесс,
+    # запускающий реплики, сам базу не открывал.
+    global app
+    if name != 'app':
+        raise AttributeError(name)
+    app = KnowledgeBaseASGI(int(os.environ.get('KB_WORKERS', DEFAULT_WORKERS)))
+    return app
+
+
+def wait_for_port(port, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_replicas(args):
+    # Основной процесс (база в режиме 'journal') слушает writer-port на
+    # localhost, реплики делят внешний порт (uvicorn с несколькими
+    # процессами): чтение обслуживают сами, изменения пересылают основному.
+    writer_env = dict(os.environ, KB_STORAGE='journal')
+    writer = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), '--host', '127.0.0.1', '--port', str(args.writer_port),
+        '--workers', str(args.workers), '--graceful-timeout', str(args.graceful_timeout)
+    ], env=writer_env)
+    try:
+        if not wait_for_port(args.writer_port):
+            raise RuntimeError(f"Основной процесс не открыл порт {args.writer_port}")
+        os.environ.update(
+            KB_ROLE='replica', KB_WRITER_URL=f"http://127.0.0.1:{args.writer_port}", KB_WORKERS=str(args.workers)
+        )
+        uvicorn.run(
+            'asgi_server:app', host=args.host, port=args.port, workers=args.replicas, lifespan='on',
+            timeout_graceful_shutdown=args.graceful_timeout, log_level='warning'
+        )
+    finally:
+        # Реплики остановлены; основной процесс дописывает журнал и индексы
+        writer.terminate()
+        writer.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="REST API базы знаний на ASGI (uvicorn)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('KB_WORKERS', DEFAULT_WORKERS)),
+                        help="потоков для обработчиков запросов")
+    parser.add_argument('--graceful-timeout', type=int, default=GRACEFUL_TIMEOUT)
+    parser.add_argument('--replicas', type=int, default=0, help="процессов-реплик для чтения (0 — один процесс)")
+    parser.add_argument('--writer-port', type=int, default=5001, help="порт основного процесса при --replicas")
+    args = parser.parse_args()
+    if args.replicas:
+        run_replicas(args)
+        return
+    # SIGINT и SIGTERM uvicorn обрабатывает сам: перестаёт принимать
+    # соединения, ждёт начатые запросы и вызывает lifespan.shutdown
+    uvicorn.run(
+        KnowledgeBaseASGI(args.workers), host=args.host, port=args.port, lifespan='on',
+        timeout_graceful_shutdown=args.graceful_timeout, log_level='warning'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,725 @@
+import codecs
+import json
+import mmap
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+import zlib
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from xml.parsers import expat
+from textextract import TextExtractor
+
+try:
+    import resource
+except ImportError:
+    # Нет в Windows: там память рабочего процесса не ограничивается
+    resource = None
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    # pypdf — необязательная зависимость; без неё текст PDF извлекается
+    # простым разбором потоков содержимого (шрифты с однобайтовой кодировкой)
+    PdfReader = None
+
+# Извлечение текста вложений для поиска. Файлы разбираются в рабочих
+# процессах (этот же файл, запущенный как скрипт): раздувшийся или зависший
+# разбор не задевает процесс базы, и его можно убить. Извлечённый текст
+# хранится на диске по digest блоба, поэтому одинаковые файлы разбираются
+# один раз.
+
+# Больше этого числа символов из одного файла не извлекается
+MAX_TEXT_CHARS = 1000000
+# Через столько секунд разбор файла останавливается и отдаёт уже
+# извлечённый текст
+TIME_LIMIT = 20
+# Рабочий процесс, не ответивший через столько секунд сверх TIME_LIMIT,
+# убивается (разбор застрял внутри C-кода и не проверяет время); в них
+# входит и запуск нового процесса
+KILL_GRACE = 10
+# Предел адресного пространства рабочего процесса (только POSIX)
+MEMORY_LIMIT = 512 * 1024 * 1024
+# Порция чтения файла и распакованного XML
+READ_CHUNK = 64 * 1024
+# Больше этого не распаковывается из одного потока содержимого PDF
+MAX_PDF_STREAM = 16 * 1024 * 1024
+# Сколько извлечённых текстов держать в памяти для фрагментов выдачи
+TEXT_MEMORY_ENTRIES = 64
+
+# Формат по расширению имени файла
+KINDS = {
+    '.txt': 'text', '.md': 'text', '.csv': 'text', '.tsv': 'text', '.log': 'text',
+    '.json': 'text', '.ini': 'text', '.rst': 'text', '.sql': 'text',
+    '.html': 'html', '.htm': 'html',
+    '.docx': 'docx', '.docm': 'docx',
+    '.xlsx': 'xlsx', '.xlsm': 'xlsx',
+    '.pptx': 'pptx',
+    '.odt': 'odf', '.ods': 'odf', '.odp': 'odf',
+    '.pdf': 'pdf'
+}
+
+
+def extract_kind(file_name):
+    # Формат вложения или None, если текст из него не извлекается
+    return KINDS.get(os.path.splitext(file_name)[1].lower())
+
+
+class TextCache:
+    # Извлечённые тексты: <folder>/<первые 2 символа>/<digest>, сжатые zlib.
+    # Пустой текст тоже записывается: файл без текста не разбирается повторно.
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def path(self, digest):
+        return os.path.join(self.folder, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def get(self, digest):
+        try:
+            with open(self.path(digest), 'rb') as f:
+                return zlib.decompress(f.read()).decode('utf-8')
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, UnicodeDecodeError) as e:
+            logging.error(f"Не удалось прочитать текст вложения '{digest}': {e}")
+            return None
+
+    def put(self, digest, text):
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(text.encode('utf-8'), 6))
+        os.replace(tmp_path, path)
+
+    def collect_garbage(self, live_digests, older_than):
+        # Удаляет тексты блобов, которых больше нет
+        removed = 0
+        if not os.path.isdir(self.folder):
+            return removed
+        for prefix in os.listdir(self.folder):
+            folder = os.path.join(self.folder, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for digest in os.listdir(folder):
+                path = os.path.join(folder, digest)
+                if digest in live_digests or os.path.getmtime(path) >= older_than:
+                    continue
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    logging.error(f"Не удалось удалить текст вложения '{path}': {e}")
+        if removed:
+            logging.info(f"Удалено текстов неиспользуемых вложений: {removed}.")
+        return removed
+
+
+class AttachmentExtractor:
+    # Пул рабочих процессов. submit() возвращает Future с текстом вложения
+    # (None — формат не поддерживается); одновременные запросы одного digest
+    # делят одну задачу, уже извлечённый текст читается из кэша. Всё, включая
+    # чтение кэша, идёт в потоках пула: обратные вызовы Future приходят оттуда.
+    # extract=False — только кэш, без рабочих процессов (реплики базы).
+
+    def __init__(self, cache_folder, workers=None, extract=True, max_chars=MAX_TEXT_CHARS,
+                 time_limit=TIME_LIMIT, memory_limit=MEMORY_LIMIT):
+        self.cache = TextCache(cache_folder)
+        # Не меньше двух процессов, чтобы файл, разбираемый до предела
+        # времени, не задерживал остальные
+        self.workers = min(max((os.cpu_count() or 2) - 1, 2), 4) if workers is None else workers
+        self.extract = extract
+        self.max_chars = max_chars
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.running = {}          # digest -> Future
+        self.texts = OrderedDict()  # digest -> текст, последние прочитанные
+        self.threads = []
+        self.processes = set()
+        self.closed = False
+        # Сколько файлов разобрано рабочими процессами (не из кэша)
+        self.extracted = 0
+
+    def submit(self, digest, path, file_name):
+        future = Future()
+        kind = extract_kind(file_name)
+        with self.lock:
+            if kind is None or self.closed:
+                future.set_result(None)
+                return future
+            running = self.running.get(digest)
+            if running is not None:
+                return running
+            self.running[digest] = future
+            self.jobs.put((digest, path, kind))
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._run, name='attachment-text', daemon=True)
+                self.threads.append(thread)
+                thread.start()
+        return future
+
+    def text(self, digest):
+        # Извлечённый текст из памяти или кэша; None, если его ещё нет
+        with self.lock:
+            text = self.texts.get(digest)
+            if text is not None:
+                self.texts.move_to_end(digest)
+                return text
+        text = self.cache.get(digest)
+        if text is not None:
+            with self.lock:
+                self.texts[digest] = text
+                while len(self.texts) > TEXT_MEMORY_ENTRIES:
+                    self.texts.popitem(last=False)
+        return text
+
+    def pending(self):
+        with self.lock:
+            return len(self.running)
+
+    def close(self):
+        # Невыполненные задачи отменяются, рабочие процессы завершаются;
+        # прерванный разбор повторится при следующем запуске
+        with self.lock:
+            self.closed = True
+            threads = list(self.threads)
+            for process in self.processes:
+                process.kill()
+        for _ in threads:
+            self.jobs.put(None)
+        for thread in threads:
+            thread.join()
+        with self.lock:
+            futures = list(self.running.values())
+            self.running.clear()
+        for future in futures:
+            future.cancel()
+
+    def _run(self):
+        worker = None
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None or self.closed:
+                    return
+                digest, path, kind = job
+                try:
+                    text = self.cache.get(digest)
+                    if text is None and self.extract:
+                        worker, text = self._extract(worker, digest, path, kind)
+                except Exception as e:
+                    logging.error(f"Ошибка извлечения текста вложения '{digest}': {e}")
+                    text = None
+                with self.lock:
+                    future = self.running.pop(digest, None)
+                if future is not None and not self.closed:
+                    future.set_result(text)
+        finally:
+            if worker is not None:
+                self._stop(worker)
+
+    def _start(self):
+        # Рабочий процесс с пониженным приоритетом: разбор не отнимает
+        # процессор у интерфейса и сервера
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(self.memory_limit)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding='utf-8',
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        )
+        with self.lock:
+            if self.closed:
+                process.kill()
+            self.processes.add(process)
+        return process
+
+    def _stop(self, process):
+        with self.lock:
+            self.processes.discard(process)
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def _extract(self, worker, digest, path, kind):
+        # Разбор в рабочем процессе; возвращает (процесс для следующих
+        # задач или None, текст). Процесс, не ответивший за time_limit +
+        # KILL_GRACE, убивается, и файл считается файлом без текста.
+        if worker is None or worker.poll() is not None:
+            worker = self._start()
+        started = time.monotonic()
+        job = {
+            'path': path, 'kind': kind, 'cache': self.cache.folder, 'digest': digest,
+            'max_chars': self.max_chars, 'time_limit': self.time_limit
+        }
+        killer = threading.Timer(self.time_limit + KILL_GRACE, worker.kill)
+        killer.start()
+        try:
+            worker.stdin.write(json.dumps(job, ensure_ascii=False) + '\n')
+            worker.stdin.flush()
+            line = worker.stdout.readline()
+        except OSError:
+            line = ''
+        finally:
+            killer.cancel()
+        elapsed = time.monotonic() - started
+        if not line:
+            code = worker.wait()
+            with self.lock:
+                self.processes.discard(worker)
+            if self.closed:
+                return None, None
+            logging.warning(f"Разбор вложения '{digest}' прерван через {elapsed:.1f} с (код {code}), текст не извлечён.")
+            self.cache.put(digest, '')
+            return None, ''
+        reply = json.loads(line)
+        self.extracted += 1
+        if reply['error']:
+            logging.warning(f"Ошибка разбора вложения '{digest}' ({kind}): {reply['error']}")
+        elif reply['stopped']:
+            logging.warning(f"Разбор вложения '{digest}' ({kind}) остановлен по пределу ({reply['stopped']}): "
+                            f"извлечено {reply['chars']} символов.")
+        else:
+            logging.info(f"Извлечён текст вложения '{digest}' ({kind}): {reply['chars']} символов за {elapsed:.2f} с.")
+        return worker, self.cache.get(digest) or ''
+
+
+# Рабочий процесс
+
+
+class TextLimit(Exception):
+    # Достигнут предел объёма или времени; извлечённое до него сохраняется
+    pass
+
+
+class TextSink:
+    # Извлекаемый текст с пределами объёма и времени
+
+    def __init__(self, max_chars, deadline):
+        self.parts = []
+        self.size = 0
+        self.max_chars = max_chars
+        self.deadline = deadline
+
+    def write(self, text):
+        room = self.max_chars - self.size
+        if len(text) > room:
+            self.parts.append(text[:room])
+            self.size = self.max_chars
+            raise TextLimit('объём')
+        self.parts.append(text)
+        self.size += len(text)
+
+    def check_time(self):
+        if time.monotonic() > self.deadline:
+            raise TextLimit('время')
+
+    def text(self):
+        return ''.join(self.parts)
+
+
+def read_chunks(stream, sink):
+    while True:
+        sink.check_time()
+        chunk = stream.read(READ_CHUNK)
+        if not chunk:
+            return
+        yield chunk
+
+
+def detect_encoding(head):
+    # UTF-16 с BOM, UTF-8 (с BOM или без), иначе cp1251
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        codecs.getincrementaldecoder('utf-8-sig')().decode(head, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'cp1251'
+
+
+def decoded_chunks(path, sink):
+    with open(path, 'rb') as f:
+        decoder = None
+        for chunk in read_chunks(f, sink):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(detect_encoding(chunk))(errors='replace')
+            yield decoder.decode(chunk)
+
+
+def extract_plain(path, sink):
+    for text in decoded_chunks(path, sink):
+        sink.write(text)
+
+
+def extract_html(path, sink):
+    # Разметка занимает больше текста: разбирается не больше четырёх
+    # пределов текста исходника
+    extractor = TextExtractor()
+    fed = 0
+    for text in decoded_chunks(path, sink):
+        extractor.feed(text)
+        fed += len(text)
+        if fed > 4 * sink.max_chars:
+            break
+    extractor.close()
+    sink.write(extractor.text())
+
+
+class XmlText:
+    # Текст XML-части документа потоком через expat: символы внутри
+    # элементов text_tags, перевод строки после break_tags, marks — символы
+    # на месте пустых элементов (табуляция, разрыв строки). Пространства
+    # имён не различаются: сравнивается только локальное имя.
+
+    def __init__(self, sink, text_tags, break_tags, marks=None):
+        self.sink = sink
+        self.text_tags = text_tags
+        self.break_tags = break_tags
+        self.marks = marks or {}
+        self.depth = 0
+        self.parser = expat.ParserCreate(namespace_separator=' ')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.data
+
+    def start(self, name, attrs):
+        tag = name.rpartition(' ')[2]
+        if tag in self.text_tags:
+            self.depth += 1
+        elif tag in self.marks:
+            self.sink.write(self.marks[tag])
+
+    def end(self, name):
+        tag = name.rpartition(' ')[2]
+        if tag in self.text_tags:
+            self.depth -= 1
+        if tag in self.break_tags:
+            self.sink.write('\n')
+
+    def data(self, text):
+        if self.depth:
+            self.sink.write(text)
+
+    def parse(self, stream):
+        for chunk in read_chunks(stream, self.sink):
+            self.parser.Parse(chunk, False)
+        self.parser.Parse(b'', True)
+
+
+def numbered(names, pattern):
+    # Части документа по номеру в имени: slide2.xml раньше slide10.xml
+    regex = re.compile(pattern)
+    found = [(int(match.group(1) or 0), name) for name in names for match in [regex.fullmatch(name)] if match]
+    return [name for _, name in sorted(found)]
+
+
+def extract_xml_parts(path, sink, parts, text_tags, break_tags, marks):
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        for name in parts(names):
+            with archive.open(name) as stream:
+                XmlText(sink, text_tags, break_tags, marks).parse(stream)
+
+
+def extract_docx(path, sink):
+    extract_xml_parts(
+        path, sink,
+        lambda names: ['word/document.xml'] + numbered(names, r'word/(?:header|footer|footnotes|endnotes)(\d*)\.xml'),
+        {'t'}, {'p'}, {'tab': '\t', 'br': '\n', 'cr': '\n'}
+    )
+
+
+def extract_pptx(path, sink):
+    extract_xml_parts(
+        path, sink, lambda names: numbered(names, r'ppt/slides/slide(\d+)\.xml'),
+        {'t'}, {'p'}, {'br': '\n'}
+    )
+
+
+def extract_odf(path, sink):
+    extract_xml_parts(
+        path, sink, lambda names: ['content.xml'],
+        {'p', 'h'}, {'p', 'h'}, {'tab': '\t', 'line-break': '\n', 's': ' '}
+    )
+
+
+class SharedStrings:
+    # Общие строки книги XLSX (xl/sharedStrings.xml) — на них ссылаются
+    # ячейки. Собирается не больше max_chars символов: ячейки с более
+    # дальними строками остаются без текста.
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.strings = []
+        self.current = None
+        self.depth = 0
+        self.size = 0
+        self.parser = expat.ParserCreate(namespace_separator=' ')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.data
+
+    def start(self, name, attrs):
+        tag = name.rpartition(' ')[2]
+        if tag == 'si':
+            self.current = []
+        elif tag == 't':
+            self.depth += 1
+
+    def end(self, name):
+        tag = name.rpartition(' ')[2]
+        if tag == 'si':
+            text = ''.join(self.current)
+            self.strings.append(text)
+            self.size += len(text)
+            if self.size > self.sink.max_chars:
+                raise TextLimit('объём')
+        elif tag == 't':
+            self.depth -= 1
+
+    def data(self, text):
+        if self.depth and self.current is not None:
+            self.current.append(text)
+
+    def parse(self, stream):
+        try:
+            for chunk in read_chunks(stream, self.sink):
+                self.parser.Parse(chunk, False)
+            self.parser.Parse(b'', True)
+        except TextLimit as e:
+            if str(e) == 'время':
+                raise
+        return self.strings
+
+
+class SheetText:
+    # Ячейки листа XLSX построчно: значения через табуляцию
+
+    def __init__(self, sink, strings):
+        self.sink = sink
+        self.strings = strings
+        self.kind = None
+        self.value = None
+        self.parser = expat.ParserCreate(namespace_separator=' ')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.data
+
+    def start(self, name, attrs):
+        tag = name.rpartition(' ')[2]
+        if tag == 'c':
+            self.kind = attrs.get('t', 'n')
+        elif tag in ('v', 't') and self.kind is not None:
+            self.value = []
+
+    def end(self, name):
+        tag = name.rpartition(' ')[2]
+        if tag == 'c':
+            self.kind = None
+        elif tag in ('v', 't') and self.value is not None:
+            value = ''.join(self.value)
+            self.value = None
+            if self.kind == 's':
+                index = int(value) if value.isdigit() else len(self.strings)
+                value = self.strings[index] if index < len(self.strings) else ''
+            elif self.kind == 'b':
+                value = ''
+            if value:
+                self.sink.write(value)
+                self.sink.write('\t')
+        elif tag == 'row':
+            self.sink.write('\n')
+
+    def data(self, text):
+        if self.value is not None:
+            self.value.append(text)
+
+    def parse(self, stream):
+        for chunk in read_chunks(stream, self.sink):
+            self.parser.Parse(chunk, False)
+        self.parser.Parse(b'', True)
+
+
+def extract_xlsx(path, sink):
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        strings = []
+        if 'xl/sharedStrings.xml' in names:
+            with archive.open('xl/sharedStrings.xml') as stream:
+                strings = SharedStrings(sink).parse(stream)
+        for name in numbered(names, r'xl/worksheets/sheet(\d+)\.xml'):
+            with archive.open(name) as stream:
+                SheetText(sink, strings).parse(stream)
+
+
+_PDF_STREAM = re.compile(rb'stream\r?\n')
+_PDF_BLOCK = re.compile(rb'\bBT\b(.*?)\bET\b', re.DOTALL)
+_PDF_LITERAL = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.DOTALL)
+_PDF_NEWLINE = re.compile(rb"T\*|\bT[dDm]\b|'|\"")
+# Сдвиг в массиве TJ, который означает пробел между словами
+_PDF_GAP = re.compile(rb'-[1-9]\d{2,}')
+_PDF_ESCAPE = re.compile(rb'\\([nrtbf()\\]|[0-7]{1,3}|\r?\n)')
+_PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+_PDF_CONTROL = re.compile(rb'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def pdf_string(raw):
+    # Литеральная строка PDF; строки с управляющими байтами — коды глифов
+    # составных шрифтов, без таблицы ToUnicode их не расшифровать
+    def unescape(match):
+        escape = match.group(1)
+        if escape[:1].isdigit():
+            return bytes([int(escape, 8) & 0xFF])
+        if escape in (b'\n', b'\r\n'):
+            return b''
+        return _PDF_ESCAPES.get(escape, escape)
+
+    data = _PDF_ESCAPE.sub(unescape, raw)
+    if data.startswith(codecs.BOM_UTF16_BE):
+        return data[2:].decode('utf-16-be', errors='replace')
+    if _PDF_CONTROL.search(data):
+        return ''
+    return data.decode('cp1252', errors='replace')
+
+
+def pdf_content_text(content, sink):
+    # Текст из операторов Tj/TJ/'/" блоков BT ... ET
+    for block in _PDF_BLOCK.finditer(content):
+        block = block.group(1)
+        last = None
+        for match in _PDF_LITERAL.finditer(block):
+            if last is not None:
+                between = block[last:match.start()]
+                if _PDF_NEWLINE.search(between):
+                    sink.write('\n')
+                elif _PDF_GAP.search(between):
+                    sink.write(' ')
+            text = pdf_string(match.group(1))
+            if text:
+                sink.write(text)
+            last = match.end()
+        sink.write('\n')
+
+
+def extract_pdf(path, sink):
+    if PdfReader is not None:
+        for page in PdfReader(path).pages:
+            sink.check_time()
+            sink.write(page.extract_text() or '')
+            sink.write('\n')
+        return
+    # Файл отображается в память, а не читается целиком
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pdf_streams(data, sink)
+
+
+def pdf_streams(data, sink):
+    for match in _PDF_STREAM.finditer(data):
+        sink.check_time()
+        header = data[max(match.start() - 512, 0):match.start()]
+        header = header[header.rfind(b'<<'):]
+        if re.search(rb'/Subtype\s*/Image|/Length[123]\b', header):
+            continue
+        start = match.end()
+        if b'/FlateDecode' in header:
+            decompressor = zlib.decompressobj()
+            parts = []
+            size = 0
+            try:
+                while not decompressor.eof and size < MAX_PDF_STREAM:
+                    sink.check_time()
+                    chunk = data[start:start + READ_CHUNK]
+                    if not chunk:
+                        break
+                    start += len(chunk)
+                    part = decompressor.decompress(chunk, MAX_PDF_STREAM - size)
+                    parts.append(part)
+                    size += len(part)
+                    if decompressor.unconsumed_tail:
+                        break
+            except zlib.error:
+                continue
+            content = b''.join(parts)
+        elif b'/Filter' in header:
+            continue
+        else:
+            end = data.find(b'endstream', start, start + MAX_PDF_STREAM)
+            if end < 0:
+                continue
+            content = data[start:end]
+        pdf_content_text(content, sink)
+
+
+EXTRACTORS = {
+    'text': extract_plain,
+    'html': extract_html,
+    'docx': extract_docx,
+    'xlsx': extract_xlsx,
+    'pptx': extract_pptx,
+    'odf': extract_odf,
+    'pdf': extract_pdf
+}
+
+
+def run_job(job):
+    # Разбирает файл и записывает текст в кэш. Текст, извлечённый до
+    # предела объёма или времени, сохраняется; при ошибке разбора — тоже.
+    sink = TextSink(job['max_chars'], time.monotonic() + job['time_limit'])
+    stopped = error = None
+    try:
+        EXTRACTORS[job['kind']](job['path'], sink)
+    except TextLimit as e:
+        stopped = str(e)
+    except MemoryError:
+        # Память занята в основном самим текстом: он не сохраняется
+        sink.parts = []
+        error = 'не хватило памяти'
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    text = sink.text()
+    TextCache(job['cache']).put(job['digest'], text)
+    return {'chars': len(text), 'stopped': stopped, 'error': error}
+
+
+def serve(memory_limit):
+    # Рабочий процесс: задания — строки JSON на stdin, ответы — на stdout
+    if resource is not None and memory_limit:
+        hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+        if hard != resource.RLIM_INFINITY:
+            memory_limit = min(memory_limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+    if hasattr(os, 'nice'):
+        os.nice(10)
+    sys.stdin.reconfigure(encoding='utf-8')
+    sys.stdout.reconfigure(encoding='utf-8')
+    for line in sys.stdin:
+        reply = run_job(json.loads(line))
+        sys.stdout.write(json.dumps(reply, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else MEMORY_LIMIT)
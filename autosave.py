@@ -0,0 +1,73 @@
+import threading
+import logging
+
+
+class AutosaveScheduler:
+    # Отложенное автосохранение: правки только помечают ключ изменённым,
+    # повторные правки одного ключа объединяются, а запись в базу выполняет
+    # отдельный поток. Когда снимать содержимое (простой, смена фокуса,
+    # навигация, закрытие окна), решает вызывающая сторона через submit().
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.edits = {}      # ключ -> число правок с момента последней записи
+        self.pending = {}    # ключ -> (содержимое, число объединённых правок)
+        self.busy = False
+        self.closed = False
+        self.saves = 0
+        self.coalesced = 0
+        self.worker = threading.Thread(target=self._run, name='autosave', daemon=True)
+        self.worker.start()
+
+    def mark_dirty(self, key):
+        with self.lock:
+            self.edits[key] = self.edits.get(key, 0) + 1
+
+    def is_dirty(self, key):
+        with self.lock:
+            return key in self.edits
+
+    def submit(self, key, content):
+        # Ставит содержимое ключа в очередь записи. Если предыдущая версия
+        # ещё не записана, она заменяется новой.
+        with self.lock:
+            count = self.edits.pop(key, 0)
+            if key in self.pending:
+                count += self.pending[key][1]
+            self.pending[key] = (content, count)
+            self.changed.notify_all()
+
+    def wait(self):
+        # Блокирует до записи всего, что уже поставлено в очередь
+        with self.lock:
+            while self.pending or self.busy:
+                self.changed.wait()
+
+    def close(self):
+        self.wait()
+        with self.lock:
+            self.closed = True
+            self.changed.notify_all()
+        self.worker.join()
+        logging.info(f"Автосохранение: записей {self.saves}, объединено правок {self.coalesced}.")
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.changed.wait()
+                if not self.pending:
+                    return
+                key, (content, count) = self.pending.popitem()
+                self.busy = True
+            try:
+                self.db.save_content(key, content)
+            except Exception as e:
+                logging.error(f"Ошибка автосохранения для '{key}': {e}")
+            with self.lock:
+                self.busy = False
+                self.saves += 1
+                self.coalesced += max(count - 1, 0)
+                self.changed.notify_all()
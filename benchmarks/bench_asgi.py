@@ -0,0 +1,119 @@
+import argparse
+import logging
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.WARNING)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import WORDS, make_corpus
+
+# Пропускная способность и задержки REST API при множестве одновременных
+# клиентов: встроенный сервер Flask (поток на соединение) против ASGI
+# (uvicorn, цикл событий и ограниченный пул потоков для обработчиков).
+# Смесь запросов: /api/content, /api/sections и /api/search.
+SERVERS = {
+    'flask': [sys.executable, '-c', "import search; search.app.run(port={port}, threaded=True)"],
+    'asgi': [sys.executable, os.path.join(ROOT, 'asgi_server.py'), '--port', '{port}', '--workers', '{workers}'],
+}
+
+
+def populate(folder, pages):
+    from database import Database
+    db = Database(os.path.join(folder, 'data.db'))
+    keys = []
+    with db.transaction():
+        for key, html in make_corpus(pages):
+            db.save_content(key, html)
+            keys.append(key)
+    db.close()
+    return keys
+
+
+def make_requests(keys, count, seed=1):
+    rnd = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        kind = rnd.random()
+        if kind < 0.7:
+            requests.append('/api/content?' + urllib.parse.urlencode({'key': rnd.choice(keys)}))
+        elif kind < 0.8:
+            requests.append('/api/sections')
+        else:
+            requests.append('/api/search?' + urllib.parse.urlencode({'q': rnd.choice(WORDS)}))
+    return requests
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Сервер не открыл порт {port}")
+
+
+def load(port, requests, clients):
+    def request(url):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}{url}", timeout=60) as response:
+                response.read()
+            ok = True
+        except OSError:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(request, requests))
+    total = time.perf_counter() - start
+    latencies = sorted(elapsed for elapsed, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return len(results) / total, quantiles[49], quantiles[98], errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="REST API: встроенный сервер Flask против ASGI")
+    parser.add_argument('--pages', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=32, help="потоков пула ASGI-сервера")
+    parser.add_argument('--port', type=int, default=5090)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        keys = populate(tmp, args.pages)
+        requests = make_requests(keys, args.requests)
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        print(f"Клиентов: {args.clients}, запросов: {len(requests)}")
+        print(f"{'сервер':>7} {'запросов/с':>11} {'p50, мс':>8} {'p99, мс':>8} {'ошибок':>7}")
+        for name, command in SERVERS.items():
+            command = [part.format(port=args.port, workers=args.workers) for part in command]
+            server = subprocess.Popen(command, cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port(args.port)
+                # Прогрев: страницы читаются из снимка, индекс — с диска
+                load(args.port, requests[:1000], args.clients)
+                rps, p50, p99, errors = load(args.port, requests, args.clients)
+                print(f"{name:>7} {rps:11.0f} {p50 * 1000:8.1f} {p99 * 1000:8.1f} {errors:7}")
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+
+
+if __name__ == '__main__':
+    main()
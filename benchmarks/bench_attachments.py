@@ -0,0 +1,164 @@
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import WORDS, make_corpus
+from database import Database
+
+# Поиск по содержимому вложений: файлы DOCX, XLSX, PDF и TXT загружаются в
+# базу, текст извлекается в фоновых процессах. Замеры: время загрузки (не
+# ждёт разбора), время до появления файлов в поиске, число разборов при
+# повторяющихся файлах, огромная книга XLSX (останавливается по пределу
+# времени и не задерживает остальные файлы) и повторный запуск (тексты из кэша).
+SPREADSHEET_NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+DOCUMENT_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def sentences(rnd, count, marker):
+    return [' '.join(rnd.choice(WORDS) for _ in range(12)) + f' {marker}' for _ in range(count)]
+
+
+def write_docx(path, lines):
+    body = ''.join(f'<w:p><w:r><w:t>{line}</w:t></w:r></w:p>' for line in lines)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('word/document.xml', f'<w:document {DOCUMENT_NS}><w:body>{body}</w:body></w:document>')
+
+
+def write_xlsx(path, lines, rows=0):
+    # rows — сколько ещё строк-заполнителей записать потоком (огромная книга)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        strings = ''.join(f'<si><t>{line}</t></si>' for line in lines)
+        archive.writestr('xl/sharedStrings.xml', f'<sst {SPREADSHEET_NS}>{strings}</sst>')
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(f'<worksheet {SPREADSHEET_NS}><sheetData>'.encode())
+            for index in range(len(lines)):
+                sheet.write(f'<row><c t="s"><v>{index}</v></c><c><v>{index}</v></c></row>'.encode())
+            filler = ''.join(f'<c t="inlineStr"><is><t>значение{column}</t></is></c>' for column in range(10))
+            for index in range(rows):
+                sheet.write(f'<row>{filler}<c><v>{index}</v></c></row>'.encode())
+            sheet.write(b'</sheetData></worksheet>')
+
+
+def write_pdf(path, lines):
+    content = b'BT /F1 12 Tf 72 720 Td ' + b' '.join(
+        b'(' + line.encode('latin-1', errors='replace') + b') Tj 0 -14 Td' for line in lines
+    ) + b' ET'
+    stream = zlib.compress(content)
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n1 0 obj << /Length ' + str(len(stream)).encode() + b' /Filter /FlateDecode >>\nstream\n')
+        f.write(stream)
+        f.write(b'\nendstream\nendobj\n%%EOF\n')
+
+
+def write_txt(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+
+
+WRITERS = [('docx', write_docx), ('xlsx', write_xlsx), ('pdf', write_pdf), ('txt', write_txt)]
+
+
+def wait_searchable(db, query, expected, timeout):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if db.search_page(query, limit=1)['total'] >= expected:
+            return time.perf_counter() - start
+        time.sleep(0.01)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск по содержимому вложений")
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--duplicates', type=float, default=0.3, help="доля повторно загружаемых файлов")
+    parser.add_argument('--huge-rows', type=int, default=1000000, help="строк в огромной книге XLSX")
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--time-limit', type=float, default=None, help="предел времени разбора файла, с")
+    args = parser.parse_args()
+    rnd = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = os.path.join(tmp, 'src')
+        os.makedirs(sources)
+        files = []
+        for index in range(args.files):
+            kind, writer = WRITERS[index % len(WRITERS)]
+            # Уникальная метка файла: по ней проверяется, что файл найден
+            marker = f'metka{index}'
+            path = os.path.join(sources, f'file{index}.{kind}')
+            writer(path, sentences(rnd, 20, marker))
+            files.append((f'file{index}.{kind}', path, marker))
+        huge = os.path.join(sources, 'huge.xlsx')
+        write_xlsx(huge, ['огромная книга hugemarker'], rows=args.huge_rows)
+
+        db = Database(os.path.join(tmp, 'data.db'), 'journal')
+        if args.time_limit:
+            db.attachments.time_limit = args.time_limit
+        with db.transaction():
+            for key, html in make_corpus(args.pages):
+                db.save_content(key, html)
+        print(f"Страниц: {args.pages}, файлов: {args.files} + огромная книга "
+              f"({os.path.getsize(huge) / 1e6:.1f} МБ сжатой, {args.huge_rows} строк), "
+              f"процессов разбора: {db.attachments.workers}, предел {db.attachments.time_limit} с на файл")
+
+        # Огромная книга — первой, следом обычные файлы и их повторы
+        uploads = [('Вложения/Огромная', 'huge.xlsx', huge)]
+        uploads += [(f'Вложения/{index % 50}', name, path) for index, (name, path, _) in enumerate(files)]
+        repeated = rnd.sample(files, int(len(files) * args.duplicates))
+        uploads += [(f'Копии/{index}', 'copy_' + name, path) for index, (name, path, _) in enumerate(repeated)]
+        timings = []
+        start = time.perf_counter()
+        for key, name, path in uploads:
+            started = time.perf_counter()
+            db.add_file(key, name, path)
+            timings.append(time.perf_counter() - started)
+        uploaded = time.perf_counter() - start
+        print(f"Загрузка {len(uploads)} файлов: {uploaded:.2f} с, на файл медиана "
+              f"{statistics.median(timings) * 1000:.1f} мс, max {max(timings) * 1000:.1f} мс")
+
+        last_marker = files[-1][2]
+        small_ready = wait_searchable(db, last_marker, 1, 600)
+        print(f"Последний обычный файл найден через {small_ready + uploaded:.2f} с после начала загрузки")
+        while db.attachments.pending():
+            time.sleep(0.05)
+        all_ready = time.perf_counter() - start
+        missing = [marker for _, _, marker in files if db.search_page(marker, limit=1)['total'] == 0]
+        print(f"Все файлы в поиске через {all_ready:.2f} с; не найдено: {len(missing)}")
+        unique = len(files) + 1
+        print(f"Разобрано файлов: {db.attachments.extracted} из {len(uploads)} загруженных ({unique} разных)")
+        huge_text = db.attachment_text('Вложения/Огромная', 'huge.xlsx')
+        print(f"Огромная книга: извлечено {len(huge_text)} символов, в поиске: "
+              f"{db.search_page('hugemarker')['total'] == 1}")
+
+        name, _, marker = repeated[0]
+        page = db.search_page(marker)
+        print(f"Запрос '{marker}': {[(result['key'], result['file']) for result in page['results']]}")
+        query_times = []
+        for _, _, marker in files[:50]:
+            started = time.perf_counter()
+            db.search_page(marker)
+            query_times.append(time.perf_counter() - started)
+        print(f"search_page с фрагментом из вложения: медиана {statistics.median(query_times) * 1000:.2f} мс")
+        db.close()
+
+        start = time.perf_counter()
+        db = Database(os.path.join(tmp, 'data.db'), 'journal')
+        opened = time.perf_counter() - start
+        while db.attachments.pending():
+            time.sleep(0.05)
+        print(f"Повторный запуск: открытие {opened:.2f} с, разобрано заново: {db.attachments.extracted}, "
+              f"найдено по метке: {db.search_page(files[0][2])['total']}")
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_corpus
+from bulk import export_to, import_items, open_source
+from database import Database
+
+# Массовый импорт и экспорт против поштучного добавления. Источник —
+# каталог в формате bulk.py: синтетический корпус страниц и по вложению
+# на каждые FILE_EVERY страниц. Поштучно (save_content и add_file на
+# каждый элемент) замеряется на первых --single страницах.
+FILE_EVERY = 7
+FILE_SIZE = 256 * 1024
+
+
+def make_source(folder, pages):
+    from bulk import key_path
+    for i, (key, html) in enumerate(make_corpus(pages)):
+        path = os.path.join(folder, *key_path(key))
+        os.makedirs(path, exist_ok=True)
+        with open(path + '.html', 'w', encoding='utf-8') as f:
+            f.write(html)
+        if i % FILE_EVERY == 0:
+            os.makedirs(path + '.files', exist_ok=True)
+            with open(os.path.join(path + '.files', f"вложение {i}.bin"), 'wb') as f:
+                f.write(os.urandom(FILE_SIZE))
+
+
+def single(db, items, limit):
+    # Прежний путь: каждый элемент — отдельная фиксация
+    pages = size = 0
+    start = time.perf_counter()
+    for item in items:
+        if item[0] == 'node':
+            db.add_nodes([item[1]])
+        elif item[0] == 'page':
+            if pages == limit:
+                break
+            db.save_content(item[1], item[2])
+            pages += 1
+            size += len(item[2].encode('utf-8'))
+        else:
+            size += db.add_file(item[1], item[2], item[3])["size"]
+    elapsed = time.perf_counter() - start
+    return pages / elapsed, size / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовый импорт и экспорт")
+    parser.add_argument('--pages', type=int, default=20000)
+    parser.add_argument('--single', type=int, default=500)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source')
+        make_source(source, args.pages)
+        print(f"Источник: {args.pages} страниц, {args.pages // FILE_EVERY} вложений по {FILE_SIZE // 1024} КБ")
+        print(f"{'операция':>28} {'страниц/с':>10} {'МБ/с':>8}")
+        for storage in ('pickle', 'journal'):
+            db = Database(os.path.join(tmp, f'single_{storage}', 'data.db'), storage)
+            pages_rate, mb_rate = single(db, open_source(source), args.single)
+            db.close()
+            print(f"{'поштучно, ' + storage:>28} {pages_rate:10.0f} {mb_rate:8.1f}")
+        for storage in ('pickle', 'journal'):
+            db = Database(os.path.join(tmp, f'bulk_{storage}', 'data.db'), storage)
+            stats = import_items(db, open_source(source)).as_dict()
+            if storage == 'journal':
+                exported = db
+            else:
+                db.close()
+            print(f"{'импорт каталога, ' + storage:>28} {stats['pages_per_second']:10.0f} {stats['mb_per_second']:8.1f}")
+        exported.compact()
+        for fmt in ('tar', 'tgz', 'jsonl'):
+            target = os.path.join(tmp, f'export.{fmt}')
+            stats = export_to(exported, target, fmt).as_dict()
+            print(f"{'экспорт ' + fmt:>28} {stats['pages_per_second']:10.0f} {stats['mb_per_second']:8.1f}")
+        db = Database(os.path.join(tmp, 'from_tar', 'data.db'), 'journal')
+        stats = import_items(db, open_source(os.path.join(tmp, 'export.tar'))).as_dict()
+        db.close()
+        print(f"{'импорт tar, journal':>28} {stats['pages_per_second']:10.0f} {stats['mb_per_second']:8.1f}")
+        # Пик памяти Python при экспорте — порядка одной страницы и порции
+        # архива, а не размера базы
+        tracemalloc.start()
+        export_to(exported, os.path.join(tmp, 'traced.tar'), 'tar')
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        total = sum(os.path.getsize(os.path.join(folder, name))
+                    for folder, _, names in os.walk(source) for name in names)
+        print(f"Экспорт tar: пик памяти {peak / 1e6:.1f} МБ при объёме базы {total / 1e6:.0f} МБ")
+        exported.close()
+
+
+if __name__ == '__main__':
+    main()
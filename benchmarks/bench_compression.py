@@ -0,0 +1,79 @@
+import argparse
+import logging
+import os
+import pickle
+import statistics
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_corpus
+from pagecodec import RAW, PageCodec, canonicalize_html, sample_keys
+from snapshot import is_snapshot, read_snapshot, write_snapshot
+
+# Размер снимка и задержки для страниц без сжатия, zlib без словаря и zlib
+# со словарём по корпусу, с канонизацией HTML и без. Корпус — настоящий
+# data.db (старый pickle или снимок), если передан путь, иначе синтетический.
+# Загрузка — load_content непрочитанной страницы из отображённого снимка,
+# сохранение — сжатие страницы при записи снимка.
+
+
+def load_corpus(path):
+    if is_snapshot(path):
+        data, _ = read_snapshot(path)
+        content = data["content"]
+        corpus = {key: content.peek(key) for key in content}
+        content.release()
+        return corpus
+    with open(path, 'rb') as f:
+        return dict(pickle.load(f)["content"])
+
+
+def measure(folder, name, corpus, codec):
+    path = os.path.join(folder, f"{name}.db")
+    start = time.perf_counter()
+    write_snapshot(path, {"tree": [], "files": {}, "content": corpus}, 0, codec)
+    written = time.perf_counter() - start
+    data, _ = read_snapshot(path)
+    content = data["content"]
+    timings = []
+    for key in sample_keys(content, 2000, seed=1):
+        start = time.perf_counter()
+        content[key]
+        timings.append(time.perf_counter() - start)
+    content.release()
+    return os.path.getsize(path), written / max(len(corpus), 1), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сжатие страниц в снимке базы")
+    parser.add_argument('db_file', nargs='?', help="data.db с настоящим корпусом")
+    parser.add_argument('--pages', type=int, default=20000, help="размер синтетического корпуса")
+    args = parser.parse_args()
+    if args.db_file:
+        corpus = load_corpus(args.db_file)
+        print(f"Корпус: {args.db_file}, страниц {len(corpus)}")
+    else:
+        corpus = dict(make_corpus(args.pages))
+        print(f"Синтетический корпус, страниц {len(corpus)}")
+    raw_size = None
+    print(f"{'канонизация':>11} {'сжатие':>10} {'файл, КБ':>10} {'доля':>6} "
+          f"{'словарь, с':>11} {'запись, мкс':>12} {'загрузка, мкс':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for canonical in (False, True):
+            pages = {key: canonicalize_html(html) for key, html in corpus.items()} if canonical else corpus
+            start = time.perf_counter()
+            trained = PageCodec.train((pages[key] for key in sample_keys(pages)), len(pages))
+            training = time.perf_counter() - start
+            for name, codec, spent in (('нет', RAW, 0.0), ('zlib', PageCodec('zlib'), 0.0), ('словарь', trained, training)):
+                size, save, load = measure(tmp, f"{name}_{canonical}", pages, codec)
+                raw_size = raw_size or size
+                print(f"{'да' if canonical else 'нет':>11} {name:>10} {size / 1024:10.1f} {size / raw_size:6.2f} "
+                      f"{spent:11.2f} {save * 1e6:12.1f} {load * 1e6:14.1f}")
+
+
+if __name__ == '__main__':
+    main()
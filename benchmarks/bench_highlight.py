@@ -0,0 +1,105 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QRegularExpression, Qt
+from PyQt5.QtGui import QColor, QTextCharFormat, QTextCursor
+from PyQt5.QtWidgets import QApplication, QTextEdit
+
+from corpus import WORDS
+from highlighter import MAX_SELECTIONS, MatchHighlighter
+
+# Подсветка совпадений на большой странице: прежний способ (регулярное
+# выражение Qt и выделение на каждое совпадение во всём документе) против
+# MatchHighlighter (тот же поиск подстроки без учёта регистра, выделения
+# только в видимой части). Замеры: время подсветки частого и редкого слова, число выделений,
+# время перехода к следующему совпадению и прокрутки на экран.
+QUERIES = ['поиск', 'Документ сервер', 'редкоеслово']
+
+
+def make_text(size, rnd):
+    lines = []
+    length = 0
+    while length < size:
+        line = ' '.join(rnd.choice(WORDS) for _ in range(14))
+        if rnd.random() < 0.001:
+            line += ' редкоеслово'
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)
+
+
+def old_highlight(editor, term):
+    # Прежняя подсветка из knowledge_base_app.highlight_search_term
+    selections = []
+    fmt = QTextCharFormat()
+    fmt.setBackground(QColor(Qt.yellow))
+    regex = QRegularExpression(term, QRegularExpression.CaseInsensitiveOption)
+    iterator = regex.globalMatch(editor.toPlainText())
+    while iterator.hasNext():
+        match = iterator.next()
+        selection = QTextEdit.ExtraSelection()
+        selection.cursor = QTextCursor(editor.document())
+        selection.cursor.setPosition(match.capturedStart())
+        selection.cursor.setPosition(match.capturedEnd(), QTextCursor.KeepAnchor)
+        selection.format = fmt
+        selections.append(selection)
+    editor.setExtraSelections(selections)
+    return len(selections)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    QApplication.processEvents()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подсветка совпадений на большой странице")
+    parser.add_argument('--size', type=float, default=5.0, help="размер страницы, МБ текста")
+    parser.add_argument('--skip-old', action='store_true', help="не замерять прежний способ")
+    args = parser.parse_args()
+    app = QApplication(sys.argv)
+    editor = QTextEdit()
+    editor.resize(1000, 800)
+    editor.show()
+    text = make_text(int(args.size * 1e6), random.Random(1))
+    start = time.perf_counter()
+    editor.setPlainText(text)
+    QApplication.processEvents()
+    print(f"Страница {len(text) / 1e6:.1f} млн символов, загрузка {time.perf_counter() - start:.2f} с")
+
+    highlighter = MatchHighlighter(editor)
+    for query in QUERIES:
+        if not args.skip_old:
+            count, elapsed = timed(old_highlight, editor, query)
+            print(f"  {query!r} прежний способ: {count} выделений, {elapsed * 1000:.0f} мс")
+            editor.setExtraSelections([])
+        count, elapsed = timed(highlighter.highlight, query)
+        print(f"  {query!r} MatchHighlighter: совпадений {count}, выделений "
+              f"{len(editor.extraSelections())} (не больше {MAX_SELECTIONS}), {elapsed * 1000:.0f} мс")
+        steps = []
+        for _ in range(20):
+            steps.append(timed(highlighter.next)[1])
+        scrolls = []
+        scrollbar = editor.verticalScrollBar()
+        for _ in range(20):
+            scrolls.append(timed(lambda: (scrollbar.setValue(scrollbar.value() + editor.viewport().height()),
+                                          highlighter.update_selections()))[1])
+        if steps and count:
+            print(f"    переход к совпадению: медиана {statistics.median(steps) * 1000:.1f} мс; "
+                  f"прокрутка на экран: медиана {statistics.median(scrolls) * 1000:.1f} мс, "
+                  f"max {max(scrolls) * 1000:.1f} мс")
+        highlighter.clear()
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import RevisionStore
+
+# Стоимость записи ревизии при правке в несколько символов для страниц
+# разного размера: правка (RevisionStore) против полной копии каждой версии.
+# Для правок считается и время чтения произвольной ревизии.
+SIZES = [1000, 10000, 100000, 1000000]
+EDITS = 500
+
+
+def edits(page, count, seed=1):
+    rnd = random.Random(seed)
+    for i in range(count):
+        position = rnd.randrange(len(page))
+        page = page[:position] + f"правка {i} " + page[position + 5:]
+        yield page
+
+
+def main():
+    print(f"{'страница':>9} {'способ':>8} {'запись, мкс':>12} {'байт/ревизию':>13} {'чтение, мкс':>12}")
+    for size in SIZES:
+        page = ('<p style=" margin-top:0px;">Текст страницы базы знаний</p>\n' * (size // 55 + 1))[:size]
+        versions = list(edits(page, EDITS))
+        with tempfile.TemporaryDirectory() as tmp:
+            store = RevisionStore(os.path.join(tmp, 'data.db.history'))
+            store.load()
+            store.record('page', None, page, zlib.crc32(page.encode('utf-8')))
+            checksums = [zlib.crc32(version.encode('utf-8')) for version in versions]
+            written = os.path.getsize(store.path)
+            start = time.perf_counter()
+            previous = page
+            for version, crc in zip(versions, checksums):
+                store.record('page', previous, version, crc)
+                previous = version
+            delta_time = (time.perf_counter() - start) / EDITS
+            delta_bytes = (os.path.getsize(store.path) - written) / EDITS
+            rnd = random.Random(2)
+            start = time.perf_counter()
+            for _ in range(100):
+                store.load_revision('page', rnd.randint(1, EDITS + 1))
+            read_time = (time.perf_counter() - start) / 100
+            store.close()
+        start = time.perf_counter()
+        full_bytes = sum(len(zlib.compress(version.encode('utf-8'))) for version in versions) / EDITS
+        full_time = (time.perf_counter() - start) / EDITS
+        print(f"{size:9} {'правка':>8} {delta_time * 1e6:12.1f} {delta_bytes:13.0f} {read_time * 1e6:12.1f}")
+        print(f"{size:9} {'копия':>8} {full_time * 1e6:12.1f} {full_bytes:13.0f} {'':>12}")
+
+
+if __name__ == '__main__':
+    main()
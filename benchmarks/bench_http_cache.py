@@ -0,0 +1,78 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import make_corpus
+
+# Запросы в секунду к /api/content, /api/sections и /api/files через WSGI
+# в том же процессе (без сети, чтобы мерить сам обработчик):
+#   без кэша   — каждый ответ сериализуется заново (как прежний jsonify);
+#   холодный   — первый запрос к каждому ключу, промах кэша;
+#   тёплый     — ответ из кэша, тело уже сжато gzip;
+#   304        — клиент присылает If-None-Match с текущим ETag.
+
+
+def run(client, requests, headers_for):
+    start = time.perf_counter()
+    statuses = {}
+    for url in requests:
+        response = client.get(url, headers=headers_for(url))
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return len(requests) / (time.perf_counter() - start), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кэш HTTP-ответов search.py")
+    parser.add_argument('--pages', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        # search.py открывает data.db в текущем каталоге
+        os.chdir(tmp)
+        import search
+        logging.getLogger().setLevel(logging.WARNING)
+        from httpcache import ResponseCache
+        keys = []
+        with search.db.transaction():
+            for key, html in make_corpus(args.pages):
+                search.db.save_content(key, html)
+                keys.append(key)
+        rnd = random.Random(1)
+        kinds = ['/api/content?key={}'] * 8 + ['/api/files?key={}', '/api/sections']
+        requests = [rnd.choice(kinds).format(rnd.choice(keys)) for _ in range(args.requests)]
+        cold = [f'/api/content?key={key}' for key in keys]
+        client = search.app.test_client()
+        gzip_only = {'Accept-Encoding': 'gzip'}
+        etags = {}
+
+        def remember(url):
+            return dict(gzip_only, **({'If-None-Match': etags[url]} if url in etags else {}))
+
+        print(f"{'режим':>10} {'запросов/с':>11} {'ответы':>20}")
+        search.cache = ResponseCache(max_entries=0)
+        rps, statuses = run(client, requests, lambda url: gzip_only)
+        print(f"{'без кэша':>10} {rps:11.0f} {str(statuses):>20}")
+        search.cache = ResponseCache()
+        rps, statuses = run(client, cold, lambda url: gzip_only)
+        print(f"{'холодный':>10} {rps:11.0f} {str(statuses):>20}")
+        rps, statuses = run(client, requests, lambda url: gzip_only)
+        print(f"{'тёплый':>10} {rps:11.0f} {str(statuses):>20}")
+        for url in set(requests):
+            etags[url] = client.get(url, headers=gzip_only).headers['ETag']
+        rps, statuses = run(client, requests, remember)
+        print(f"{'304':>10} {rps:11.0f} {str(statuses):>20}")
+        print(f"Кэш: попаданий {search.cache.hits}, промахов {search.cache.misses}, "
+              f"{search.cache.size / 1e6:.1f} МБ")
+        search.db.close()
+        os.chdir(ROOT)
+
+
+if __name__ == '__main__':
+    main()
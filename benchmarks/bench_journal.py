@@ -0,0 +1,50 @@
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Логи бенчмарка не пишем в app.log рабочего каталога
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+# Сравнение задержки save_content в режимах 'pickle' и 'journal'
+# при росте объёма вложений в базе
+SIZES_MB = [0, 10, 50, 100]
+SAVES = 50
+
+
+def fill(db, size_mb):
+    blob = os.urandom(1024 * 1024)
+    for i in range(size_mb):
+        db.add_file("Главная", f"file_{i}.bin", blob)
+
+
+def measure(db):
+    timings = []
+    for i in range(SAVES):
+        start = time.perf_counter()
+        db.save_content("Главная", f"<p>Правка {i}</p>" * 20)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, max(timings) * 1000
+
+
+def main():
+    print(f"{'МБ':>6} {'pickle, мс (med/max)':>24} {'journal, мс (med/max)':>24}")
+    for size_mb in SIZES_MB:
+        row = []
+        for storage in ('pickle', 'journal'):
+            with tempfile.TemporaryDirectory() as tmp:
+                db = Database(os.path.join(tmp, 'data.db'), storage)
+                fill(db, size_mb)
+                median, worst = measure(db)
+                db.close()
+                row.append(f"{median:10.3f} / {worst:9.3f}")
+        print(f"{size_mb:>6} {row[0]:>24} {row[1]:>24}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logsetup
+
+# Стоимость записи журнала для вызывающего потока: прежняя настройка
+# (basicConfig, синхронная запись в файл) против очереди logsetup в
+# текстовом и JSON-режиме. Записи — как у save_content, через модульную
+# функцию logging.info. Для очереди отдельно замеряется, сколько фоновому
+# потоку нужно, чтобы дописать накопленное. Потоки — те же записи из
+# нескольких потоков одновременно (ожидание блокировки файла у basicConfig).
+MESSAGE = "Содержимое для '{}' сохранено."
+
+
+def calls(count):
+    start = time.perf_counter()
+    for i in range(count):
+        logging.info(MESSAGE.format(i))
+    return time.perf_counter() - start
+
+
+def formatting(count):
+    # То же сообщение без логирования: из замера вычитается f-строка
+    start = time.perf_counter()
+    for i in range(count):
+        MESSAGE.format(i)
+    return time.perf_counter() - start
+
+
+def threaded(count, threads):
+    elapsed = []
+
+    def worker():
+        elapsed.append(calls(count))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return max(elapsed) / count
+
+
+def measure(folder, mode, count, threads):
+    log_file = os.path.join(folder, f'{mode}.log')
+    if mode == 'basicConfig':
+        logging.basicConfig(
+            filename=log_file, filemode='a', format=logsetup.TEXT_FORMAT, level=logging.DEBUG, force=True
+        )
+        logging.setLogRecordFactory(logging.LogRecord)
+        logging._srcfile = logging.__file__
+        logging.logThreads = logging.logProcesses = logging.logMultiprocessing = True
+    else:
+        logsetup.configure_logging(log_file, {"log_format": mode, "log_rotate_hours": 0, "log_max_bytes": 0}, force=True)
+    calls(1000)
+    overhead = formatting(count)
+    caller = (calls(count) - overhead) / count
+    start = time.perf_counter()
+    if mode == 'basicConfig':
+        logging.getLogger().handlers[0].flush()
+    else:
+        logsetup.shutdown_logging()
+    drain = time.perf_counter() - start
+    if mode == 'basicConfig':
+        contended = threaded(count // threads, threads)
+    else:
+        logsetup.configure_logging(log_file, {"log_format": mode, "log_rotate_hours": 0, "log_max_bytes": 0}, force=True)
+        contended = threaded(count // threads, threads)
+        logsetup.shutdown_logging()
+    lines = sum(1 for _ in open(log_file, encoding='utf-8'))
+    return caller, drain, contended, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость записи журнала")
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Отсчёт: пустой вызов функции на этой машине
+        start = time.perf_counter()
+        for i in range(args.records):
+            len(MESSAGE)
+        call = (time.perf_counter() - start) / args.records
+        print(f"Записей: {args.records}, вызов встроенной функции: {call * 1e9:.0f} нс")
+        print(f"{'режим':>12} {'вызов, мкс':>11} {'дописать, с':>12} {f'{args.threads} потоков, мкс':>16} {'строк':>8}")
+        for mode in ('basicConfig', 'text', 'json'):
+            caller, drain, contended, lines = measure(tmp, mode, args.records, args.threads)
+            print(f"{mode:>12} {caller * 1e6:11.2f} {drain:12.2f} {contended * 1e6:16.2f} {lines:8}")
+        logsetup.configure_logging(os.path.join(tmp, 'filtered.log'), {"log_level": "WARNING"}, force=True)
+        start = time.perf_counter()
+        for i in range(args.records):
+            logging.debug("Содержимое для '%s' сохранено.", i)
+        print(f"Отброшенная по уровню запись (отложенное форматирование): "
+              f"{(time.perf_counter() - start) / args.records * 1e6:.2f} мкс")
+        logsetup.shutdown_logging()
+
+
+if __name__ == '__main__':
+    main()
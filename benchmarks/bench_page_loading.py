@@ -0,0 +1,157 @@
+import argparse
+import base64
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.WARNING)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QBuffer, QByteArray, QEvent, QObject
+from PyQt5.QtGui import QColor, QImage, QTextDocument
+from PyQt5.QtWidgets import QApplication, QTextEdit
+
+from corpus import WORDS
+from database import Database
+from pageloader import PageLoader
+
+# Открытие большой страницы: прежде — load_content и setText всей страницы
+# в GUI-потоке, теперь — PageLoader (первый экран сразу, остальное разбирается
+# в рабочем потоке). Замеры: время до первой отрисовки редактора, до полной
+# загрузки и самый долгий шаг цикла событий (сколько интерфейс не отвечал).
+# Страницы: большая таблица (вставка из Excel), длинный текст, картинки.
+
+
+def to_qt(body):
+    # Страницы в базе — вывод toHtml(), как их сохраняет редактор
+    document = QTextDocument()
+    document.setHtml(body)
+    return document.toHtml()
+
+
+def make_pages(rnd, rows):
+    cells = ''.join(
+        '<tr>' + ''.join(f'<td>{rnd.choice(WORDS)} {rnd.randint(0, 99999)}</td>' for _ in range(8)) + '</tr>'
+        for _ in range(rows)
+    )
+    table = to_qt('<p>Таблица</p><table border="1"><thead><tr>' + '<th>столбец</th>' * 8
+                  + '</tr></thead><tbody>' + cells + '</tbody></table><p>после таблицы</p>')
+    text = to_qt(''.join(f'<p>{" ".join(rnd.choice(WORDS) for _ in range(20))}</p>' for _ in range(rows * 4)))
+    images = []
+    for i in range(12):
+        image = QImage(1500, 1500, QImage.Format_RGB32)
+        image.fill(QColor(10 * i, 200, 30))
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QBuffer.WriteOnly)
+        image.save(buffer, 'JPG')
+        buffer.close()
+        images.append('data:image/jpeg;base64,' + base64.b64encode(bytes(data)).decode())
+    pictures = to_qt(''.join(
+        f'<p>картинка {i} {" ".join(rnd.choice(WORDS) for _ in range(200))}</p><p><img src="{source}" width="400" /></p>'
+        for i, source in enumerate(images * 3)
+    ))
+    return {'Таблица': table, 'Текст': text, 'Картинки': pictures}
+
+
+class PaintWatch(QObject):
+    # Время первой отрисовки области редактора после reset()
+
+    def __init__(self, editor):
+        super().__init__()
+        self.painted = None
+        editor.viewport().installEventFilter(self)
+
+    def reset(self):
+        self.painted = None
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and self.painted is None:
+            self.painted = time.perf_counter()
+        return False
+
+
+def run_loop(until, limit=120):
+    # Крутит цикл событий, пока until() ложно; возвращает самый долгий шаг
+    longest = 0
+    start = time.perf_counter()
+    while not until() and time.perf_counter() - start < limit:
+        step = time.perf_counter()
+        QApplication.processEvents()
+        longest = max(longest, time.perf_counter() - step)
+        time.sleep(0.002)
+    # Ленивая разметка Qt после подмены документа
+    for _ in range(50):
+        step = time.perf_counter()
+        QApplication.processEvents()
+        longest = max(longest, time.perf_counter() - step)
+    return longest
+
+
+def old_open(db, editor, watch, key):
+    watch.reset()
+    start = time.perf_counter()
+    editor.setText(db.load_content(key))
+    loaded = time.perf_counter()
+    longest = max(loaded - start, run_loop(lambda: watch.painted is not None))
+    return watch.painted - start, loaded - start, longest
+
+
+def new_open(loader, watch, key):
+    loaded = []
+    loader.page_loaded.connect(lambda _: loaded.append(time.perf_counter()))
+    watch.reset()
+    start = time.perf_counter()
+    loader.load(key, started=start)
+    opened = time.perf_counter() - start
+    longest = max(opened, run_loop(lambda: watch.painted is not None and loaded))
+    return watch.painted - start, loaded[0] - start, longest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Открытие больших страниц")
+    parser.add_argument('--rows', type=int, default=5000, help="строк в таблице (абзацев текста — вчетверо больше)")
+    parser.add_argument('--skip-old', action='store_true', help="не замерять прежний способ")
+    args = parser.parse_args()
+    app = QApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'data.db'), 'journal')
+        pages = make_pages(random.Random(1), args.rows)
+        with db.transaction():
+            for key, html in pages.items():
+                db.save_content(key, html)
+        print(", ".join(f"{key}: {len(html) / 1e6:.1f} млн символов" for key, html in pages.items()))
+        print(f"{'страница':>10} {'способ':>16} {'отрисовка, мс':>14} {'целиком, мс':>12} {'макс. шаг, мс':>14}")
+        for key in pages:
+            for label in ([] if args.skip_old else ['прежде']) + ['PageLoader']:
+                # Каждый замер — в новом редакторе: разметка прежней страницы
+                # не мешает следующей
+                editor = QTextEdit()
+                editor.resize(1000, 800)
+                editor.show()
+                QApplication.processEvents()
+                watch = PaintWatch(editor)
+                if label == 'прежде':
+                    painted, loaded, longest = old_open(db, editor, watch, key)
+                else:
+                    loader = PageLoader(db, editor)
+                    painted, loaded, longest = new_open(loader, watch, key)
+                    expected = QTextDocument()
+                    expected.setHtml(pages[key])
+                    # Документ всей страницы — тот же HTML без изменений
+                    assert expected.toHtml() == editor.document().toHtml(), key
+                    loader.close()
+                print(f"{key:>10} {label:>16} {painted * 1000:14.0f} {loaded * 1000:12.0f} {longest * 1000:14.0f}")
+                editor.close()
+                editor.deleteLater()
+                QApplication.processEvents()
+        db.close()
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+# Число фиксаций и время переименования категории: прежняя цепочка вызовов
+# (как в старом rename_item), та же цепочка внутри transaction() и
+# rename_category. Фон — база со страницами, чтобы перезапись файла в режиме
+# 'pickle' стоила как в жизни.
+FILES = [0, 10, 50]
+BACKGROUND_PAGES = 2000
+
+
+def legacy_rename(db, section, category, new_name):
+    old_key = f"{section}/{category}"
+    new_key = f"{section}/{new_name}"
+    db.add_category(section, new_name)
+    db.save_content(new_key, db.load_content(old_key))
+    db.delete_content(old_key)
+    for file_name, record in db.get_files(old_key).items():
+        db.link_file(new_key, file_name, record)
+    db.delete_files(old_key)
+    db.delete_category(section, category)
+
+
+def transaction_rename(db, section, category, new_name):
+    with db.transaction():
+        legacy_rename(db, section, category, new_name)
+
+
+def native_rename(db, section, category, new_name):
+    db.rename_category(section, category, new_name)
+
+
+def prepare(folder, storage, files):
+    db = Database(os.path.join(folder, 'data.db'), storage)
+    db.add_section("Раздел")
+    db.add_category("Раздел", "Категория")
+    with db.transaction():
+        for i in range(BACKGROUND_PAGES):
+            db.save_content(f"Фон/{i}", f"<p>Страница {i} {'текст ' * 100}</p>")
+        db.save_content("Раздел/Категория", "<p>Содержимое категории</p>")
+    for i in range(files):
+        db.add_file("Раздел/Категория", f"file_{i}.txt", f"файл {i}".encode('utf-8'))
+    return db
+
+
+def main():
+    methods = [('цепочка', legacy_rename), ('транзакция', transaction_rename), ('rename_category', native_rename)]
+    print(f"{'файлов':>7} {'режим':>8} {'способ':>16} {'фиксаций':>9} {'время, мс':>10}")
+    for files in FILES:
+        for storage in ('pickle', 'journal'):
+            for name, method in methods:
+                with tempfile.TemporaryDirectory() as tmp:
+                    db = prepare(tmp, storage, files)
+                    committed = db.committed
+                    start = time.perf_counter()
+                    method(db, "Раздел", "Категория", "Новая")
+                    elapsed = time.perf_counter() - start
+                    commits = db.committed - committed
+                    assert db.get_sections()["Раздел"] == ["Новая"]
+                    assert len(db.get_files("Раздел/Новая")) == files
+                    assert db.load_content("Раздел/Новая") == "<p>Содержимое категории</p>"
+                    db.close()
+                print(f"{files:7} {storage:>8} {name:>16} {commits:9} {elapsed * 1000:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.WARNING)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import make_corpus
+
+# Память нескольких процессов API над одной базой и свежесть чтения:
+#   копии   — каждый процесс открывает свою Database (как раньше);
+#   реплики — основной процесс пишет, остальные открывают ReadReplica.
+# Каждый процесс читает все страницы (прогретый сервер); реплики — без
+# своего поискового индекса, как в asgi_server.py --replicas. Память — сумма
+# PSS (общие страницы делятся между процессами). Задержка — время от
+# возврата save_content в основном процессе до того, как реплика в другом
+# процессе, вызывающая refresh() в цикле, увидит новую версию страницы.
+WORKER = '''
+import logging, sys
+logging.disable(logging.CRITICAL)
+sys.path.insert(0, {root!r})
+from database import Database
+from replica import ReadReplica
+db = ReadReplica('data.db') if {replica} else Database('data.db', 'journal')
+for key in db.data["content"]:
+    db.load_content(key)
+print('ready', flush=True)
+sys.stdin.readline()
+with open('/proc/self/smaps_rollup') as f:
+    pss = next(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+print(pss, flush=True)
+'''
+FOLLOWER = '''
+import logging, sys, time
+logging.disable(logging.CRITICAL)
+sys.path.insert(0, {root!r})
+from replica import ReadReplica
+db = ReadReplica('data.db')
+print('ready', flush=True)
+last = None
+while True:
+    db.refresh()
+    value = db.load_content('lag')
+    if value != last:
+        last = value
+        if value == 'stop':
+            break
+        if value:
+            print(value, time.time(), flush=True)
+    time.sleep(0.0005)
+'''
+
+
+def memory(folder, processes, replica):
+    workers = [
+        subprocess.Popen(
+            [sys.executable, '-c', WORKER.format(root=ROOT, replica=replica)],
+            cwd=folder, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.stdout.readline()
+    total = 0
+    for worker in workers:
+        worker.stdin.write('\n')
+        worker.stdin.flush()
+        total += int(worker.stdout.readline())
+        worker.wait()
+    return total / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Реплики для чтения: память и свежесть")
+    parser.add_argument('--pages', type=int, default=20000)
+    parser.add_argument('--writes', type=int, default=500)
+    args = parser.parse_args()
+    from database import Database
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'data.db'), 'journal')
+        with db.transaction():
+            for key, html in make_corpus(args.pages):
+                db.save_content(key, html)
+        db.compact()
+        db.close()
+        print(f"Страниц: {args.pages}, снимок {os.path.getsize(os.path.join(tmp, 'data.db')) / 1e6:.1f} МБ")
+        print(f"{'процессов':>9} {'копии, МБ':>10} {'реплики, МБ':>12}")
+        for processes in (1, 2, 4, 8):
+            private = memory(tmp, processes, False)
+            db = Database(os.path.join(tmp, 'data.db'), 'journal')
+            shared = memory(tmp, processes, True)
+            db.close()
+            print(f"{processes:9} {private:10.1f} {shared:12.1f}")
+        db = Database(os.path.join(tmp, 'data.db'), 'journal')
+        follower = subprocess.Popen(
+            [sys.executable, '-c', FOLLOWER.format(root=ROOT)], cwd=tmp, stdout=subprocess.PIPE, text=True
+        )
+        follower.stdout.readline()
+        saved = []
+        for i in range(args.writes):
+            db.save_content('lag', str(i))
+            saved.append(time.time())
+            time.sleep(0.002)
+        db.save_content('lag', 'stop')
+        seen = [line.split() for line in follower.stdout]
+        lags = sorted(float(at) - saved[int(i)] for i, at in seen)
+        follower.wait()
+        db.close()
+        quantiles = statistics.quantiles(lags, n=100)
+        print(f"Задержка видимости в реплике ({len(lags)} изменений): p50 {quantiles[49] * 1000:.2f} мс, "
+              f"p99 {quantiles[98] * 1000:.2f} мс, max {lags[-1] * 1000:.2f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_corpus
+from search_index import SearchIndex, fingerprint, parse_query
+from textextract import html_to_text
+
+# Сравнение линейного просмотра (как в прежнем SearchThread, но без создания
+# QTextBrowser) с инвертированным индексом на 10k и 100k страниц
+SIZES = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+QUERIES = ['база', 'договор*', '"база знаний"', 'отчёт срок', 'несуществующее']
+REPEATS = 5
+
+
+def scan(pages, query):
+    results = []
+    needle = query.strip('"*').lower()
+    for key, html in pages:
+        plain_text = html_to_text(html)
+        if needle in plain_text.lower():
+            results.append(key)
+    return results
+
+
+def timed(function, *args, repeats=REPEATS):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, result
+
+
+def main():
+    for size in SIZES:
+        pages = list(make_corpus(size))
+        with tempfile.TemporaryDirectory() as tmp:
+            index = SearchIndex(os.path.join(tmp, 'data.db.index'))
+            start = time.perf_counter()
+            for key, html in pages:
+                index.update(key, html_to_text(html), fingerprint(html))
+            build = time.perf_counter() - start
+            index.save()
+            start = time.perf_counter()
+            loaded = SearchIndex(index.index_file)
+            loaded.load()
+            load = time.perf_counter() - start
+            print(f"\nСтраниц: {size}; построение индекса {build:.1f} с, загрузка {load:.2f} с, "
+                  f"размер {os.path.getsize(index.index_file) / 1e6:.1f} МБ")
+            print(f"{'запрос':>18} {'просмотр, мс':>14} {'индекс, мс':>12} {'найдено':>9}")
+            for query in QUERIES:
+                # На больших корпусах просмотр слишком долгий для нескольких повторов
+                scan_ms, _ = timed(scan, pages, query, repeats=1 if size > 10000 else REPEATS)
+                index_ms, hits = timed(loaded._rank, parse_query(query), None)
+                print(f"{query:>18} {scan_ms:14.1f} {index_ms:12.2f} {len(hits):9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_corpus
+from database import Database
+from search_index import highlight_spans, parse_query
+from searchexec import SearchExecutor
+
+# Время до первых результатов поиска в приложении:
+#   прежде — SearchThread: все найденные страницы с контекстом, потом сигнал;
+#   теперь — SearchExecutor: порции по страницам ранжирования.
+# Каждый запрос выполняется на холодном кэше ранжирования и текстов (сразу
+# после правки базы), как первый поиск после изменения. Отмена — запрос
+# с большой выдачей, через 5 мс новый: время до первых результатов нового.
+QUERIES = ['база', 'договор*', '"база знаний"', 'отчёт срок', 'сервер', 'поиск', 'search', 'несуществующее']
+
+
+def old_search(db, query):
+    start = time.perf_counter()
+    results = []
+    hits = db.search(query)
+    parts = parse_query(query)
+    for key, score in hits:
+        plain_text = db.load_text(key)
+        spans = highlight_spans(plain_text, parts)
+        index = spans[0][0] if spans else 0
+        results.append((key, plain_text[max(0, index - 50):index + 50]))
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, len(results)
+
+
+def new_search(executor, query):
+    first = []
+    done = threading.Event()
+    count = []
+    start = time.perf_counter()
+
+    def on_results(search_id, batch):
+        if not first:
+            first.append(time.perf_counter() - start)
+
+    def on_done(search_id, total):
+        count.append(total)
+        done.set()
+
+    executor.submit(query, on_results, None, on_done)
+    done.wait()
+    return first[0] if first else time.perf_counter() - start, time.perf_counter() - start, count[0]
+
+
+def invalidate(db):
+    # Правка сбрасывает кэш ранжирования; кэш текстов очищается отдельно
+    db.save_content('bench/правка', str(time.time()))
+    db.text_cache.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время до первых результатов поиска")
+    parser.add_argument('--pages', type=int, default=20000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'data.db'), 'journal')
+        with db.transaction():
+            for key, html in make_corpus(args.pages):
+                db.save_content(key, html)
+        executor = SearchExecutor(db)
+        print(f"Страниц: {args.pages}")
+        print(f"{'запрос':>16} {'найдено':>8} {'прежде, мс':>11} {'первые, мс':>11} {'все, мс':>9}")
+        firsts = []
+        for query in QUERIES:
+            invalidate(db)
+            old, _, found = old_search(db, query)
+            invalidate(db)
+            first, total, count = new_search(executor, query)
+            assert count == found, (query, count, found)
+            firsts.append(first)
+            print(f"{query:>16} {found:8} {old * 1000:11.1f} {first * 1000:11.1f} {total * 1000:9.1f}")
+        print(f"Первые результаты: медиана {statistics.median(firsts) * 1000:.1f} мс, max {max(firsts) * 1000:.1f} мс")
+        lags = []
+        for stale, query in zip(QUERIES, QUERIES[1:]):
+            invalidate(db)
+            cancelled = []
+            executor.submit(stale, lambda search_id, batch: None, None, lambda search_id, total: cancelled.append(1))
+            time.sleep(0.005)
+            lags.append(new_search(executor, query)[0])
+            if cancelled:
+                print(f"Запрос '{stale}' успел завершиться до отмены")
+        print(f"После отмены предыдущего запроса: медиана {statistics.median(lags) * 1000:.1f} мс, "
+              f"max {max(lags) * 1000:.1f} мс")
+        executor.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import io
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.WARNING)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from blobstore import BlobStore
+from corpus import make_corpus
+from nodestore import NodeStore
+from snapshot import write_snapshot
+from utils import get_mime_type
+
+# Время открытия и потребление памяти для старого формата (весь data.db,
+# включая байты вложений, в одном pickle) и для снимка с оглавлением,
+# отображаемого в память. Каждое открытие — в отдельном процессе.
+CASES = [(1000, 10), (10000, 100), (10000, 500)]
+ATTACHMENT_MB = 1
+
+CHILD = r"""
+import pickle, sys, time
+sys.path.insert(0, sys.argv[1])
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+base = rss_mb()
+start = time.perf_counter()
+if sys.argv[2] == 'pickle':
+    with open(sys.argv[3], 'rb') as f:
+        data = pickle.load(f)
+else:
+    from snapshot import read_snapshot
+    data, _ = read_snapshot(sys.argv[3])
+opened = time.perf_counter() - start
+start = time.perf_counter()
+data['content']['Раздел 0/Категория 0']
+page = time.perf_counter() - start
+print(opened * 1000, page * 1000, rss_mb() - base)
+"""
+
+
+def build(folder, pages, attachments):
+    corpus = list(make_corpus(pages))
+    sections = {}
+    for key in dict(corpus):
+        section, _, category = key.partition('/')
+        categories = sections.setdefault(section, [])
+        if category:
+            categories.append(category)
+    blob = os.urandom(ATTACHMENT_MB * 1024 * 1024)
+    # Разные байты у каждого вложения, чтобы хранилище не схлопнуло дубликаты
+    payloads = {f"file_{i}.bin": blob[:-8] + i.to_bytes(8, 'little') for i in range(attachments)}
+    legacy = {"sections": sections, "content": dict(corpus), "files": {"Раздел 0": payloads}}
+    legacy_file = os.path.join(folder, 'legacy.db')
+    with open(legacy_file, 'wb') as f:
+        pickle.dump(legacy, f)
+    blobs = BlobStore(os.path.join(folder, 'blobs'))
+    records = {}
+    for order, (name, payload) in enumerate(payloads.items()):
+        digest, size = blobs.put(io.BytesIO(payload))
+        records[name] = {"name": name, "digest": digest, "size": size, "mime": get_mime_type(name), "order": order}
+    snapshot_file = os.path.join(folder, 'data.db')
+    tree = NodeStore.from_sections(sections).dump()
+    write_snapshot(snapshot_file, {"tree": tree, "content": dict(corpus), "files": {"Раздел 0": records}})
+    return legacy_file, snapshot_file
+
+
+def measure(kind, path):
+    output = subprocess.run([sys.executable, '-c', CHILD, ROOT, kind, path],
+                            check=True, capture_output=True, text=True).stdout
+    return [float(value) for value in output.split()]
+
+
+def main():
+    print(f"{'страниц':>8} {'вложений, МБ':>13} {'формат':>8} {'открытие, мс':>13} "
+          f"{'1-я страница, мс':>17} {'RSS, МБ':>8} {'файл, МБ':>9}")
+    for pages, attachments in CASES:
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy_file, snapshot_file = build(tmp, pages, attachments)
+            for kind, path in (('pickle', legacy_file), ('snapshot', snapshot_file)):
+                opened, page, rss = measure(kind, path)
+                print(f"{pages:8} {attachments * ATTACHMENT_MB:13} {kind:>8} {opened:13.1f} "
+                      f"{page:17.3f} {rss:8.1f} {os.path.getsize(path) / 1e6:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import gc
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_corpus
+from database import Database
+
+# Подсказки при наборе (Database.suggest): время на каждое нажатие клавиши
+# при наборе запросов по буквам, в том числе с опечатками, память индексов
+# подсказок и видимость нового узла и новой страницы сразу после фиксации.
+TYPED = [
+    'отчёт срок', 'договор поставка', 'сервер', 'категория 1234', 'катгория 77',
+    'knowledge base', 'serach index', 'инструкцыя', 'регламент отдела', 'склад бюджет', 'стрнаицы'
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подсказки при наборе")
+    parser.add_argument('--pages', type=int, default=20000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'data.db'), 'journal')
+        pages = list(make_corpus(args.pages))
+        db.add_nodes([key for key, _ in pages])
+        with db.transaction():
+            for key, html in pages:
+                db.save_content(key, html)
+        # Журнал после импорта сворачивается в снимок; замер — после этого
+        db.compact()
+        tracemalloc.start()
+        start = time.perf_counter()
+        db.prepare_suggest()
+        prepare = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"Страниц и узлов: {args.pages}, словарь {len(db.search_index.terms)} слов")
+        print(f"Построение индексов подсказок: {prepare * 1000:.0f} мс, {memory / 1e6:.1f} МБ")
+        # Полная сборка мусора и сброс снимка на диск — как в приложении,
+        # успевшем отработать после запуска; иначе их паузы попадают на
+        # первые нажатия
+        gc.collect()
+        os.sync()
+        timings = []
+        for query in TYPED:
+            for end in range(1, len(query) + 1):
+                start = time.perf_counter()
+                result = db.suggest(query[:end])
+                timings.append(time.perf_counter() - start)
+            print(f"  {query!r}: {result['completions'][:2]} {result['titles'][:2]}")
+        quantiles = statistics.quantiles(timings, n=100)
+        print(f"На нажатие ({len(timings)}): p50 {quantiles[49] * 1000:.2f} мс, p95 {quantiles[94] * 1000:.2f} мс, "
+              f"p99 {quantiles[98] * 1000:.2f} мс, max {max(timings) * 1000:.2f} мс "
+              f"(первое {timings[0] * 1000:.2f} мс)")
+        start = time.perf_counter()
+        db.add_node('Раздел 1/Квартальная сводка')
+        db.save_content('Раздел 1/Квартальная сводка', '<p>Ежеквартальный меморандум</p>')
+        result = db.suggest('квартальн')['titles'], db.suggest('меморанд')['completions']
+        print(f"Новые узел и страница в подсказках: {result}, "
+              f"{(time.perf_counter() - start) * 1000:.1f} мс от фиксации")
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
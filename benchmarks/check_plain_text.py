@@ -0,0 +1,148 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtGui import QTextDocument
+from PyQt5.QtWidgets import QApplication
+
+from corpus import WORDS
+from textextract import html_to_text
+
+# Проверка textextract.html_to_text: текст должен совпадать с
+# QTextDocument.toPlainText() после setHtml() того же HTML. Каждый образец
+# проверяется дважды: как есть (импорт, API) и после toHtml() — так страницы
+# сохраняет редактор. Кроме образцов — случайные страницы из абзацев,
+# списков и таблиц. В конце — время обоих способов на всех страницах.
+
+TABLE = '<table border="1"><tr><td>a</td><td>b</td></tr><tr><td>1</td><td>x<br />2</td></tr></table>'
+EMPTY = '<p style="-qt-paragraph-type:empty; margin-top:0px;"><br /></p>'
+SAMPLES = {
+    'абзацы': '<p>Hello</p><p>world</p>',
+    'таблица после абзаца': '<p>Intro</p>' + TABLE + '<p>after</p>',
+    'таблица из Excel': '<p>Intro</p><table border="1" class="dataframe"><thead><tr style="text-align: right;">'
+                        '<th>a</th><th>b</th></tr></thead><tbody><tr><td>1</td><td>x</td></tr>'
+                        '<tr><td>2</td><td>NaN</td></tr></tbody></table>',
+    'таблица в начале': TABLE + '<p>after</p>',
+    'таблица в конце': '<p>Intro</p>' + TABLE,
+    'две таблицы подряд': TABLE + TABLE,
+    'таблица, абзац, таблица': TABLE + '<p>mid</p>' + TABLE,
+    'текст после таблицы': TABLE + 'after',
+    'вложенная таблица': '<table><tr><td>out<table><tr><td>in</td></tr></table>tail</td><td>z</td></tr></table>',
+    'таблица в пустой ячейке': '<table><tr><td><table><tr><td>in</td></tr></table></td></tr></table>',
+    'пустые ячейки': '<table><tr><td></td><td>x</td><td></td></tr></table>',
+    'короткие строки': '<table><tr><td>a</td></tr><tr><td>c</td><td>d</td><td>e</td></tr><tr></tr></table>',
+    'colspan и rowspan': '<table><tr><td colspan="2">a</td><td rowspan="3">b</td></tr><tr><td>c</td></tr></table>',
+    'таблица без ячеек': '<p>a</p><table><tr></tr></table><p>b</p>',
+    'пустой абзац': '<p>a</p><p></p><p>b</p>',
+    'пустой абзац в конце': '<p>a</p><p></p>',
+    'пустой абзац Qt': '<p>a</p>' + EMPTY + EMPTY + '<p>b</p>',
+    'пустой абзац Qt в ячейке': '<table><tr><td>x</td><td>' + EMPTY + '</td></tr></table>',
+    'список': '<ul><li>a</li><li>b</li></ul>',
+    'вложенный список': '<ul><li>a<ul><li>b</li><li>c</li></ul></li><li>d</li></ul>',
+    'абзацы в пунктах списка': '<ol><li><p>one</p></li><li><p>two</p><p>three</p></li></ol>',
+    'таблица в пункте списка': '<ul><li>a' + TABLE + '</li><li>b</li></ul>',
+    'перевод строки': '<p>a<br />b</p><p>c<br /></p>',
+    'картинка': '<p>a<img src="x.png" />b</p>',
+    'заголовок и линия': '<h1>T</h1><p>a</p><hr /><p>b</p>',
+    'pre': '<pre>\na\n  b\n</pre><p>c</p>',
+    'pre-wrap': '<html><head><style>p, li { white-space: pre-wrap; }</style></head>'
+                '<body><p>a  b\n</p><ul><li>c\n<ul><li>d</li></ul></li></ul></body></html>',
+    'div и blockquote': '<div>a<p>b</p>c</div><blockquote><p>q</p></blockquote>',
+    'пробелы': '<p> a&nbsp;b  c </p>',
+    'лишний закрывающий тег': '</p><p>a</p></li>',
+}
+
+
+def make_page(rnd, depth=0):
+    # Случайная страница: абзацы, заголовки, линии, списки и таблицы
+    # (с неровными строками и вложенными блоками в ячейках)
+    parts = []
+    for _ in range(rnd.randint(1, 4)):
+        kind = rnd.random()
+        if depth > 2 or kind < 0.35:
+            parts.append(f'<p>{make_inline(rnd)}</p>')
+        elif kind < 0.45:
+            parts.append(f'<h2>{make_inline(rnd)}</h2>')
+        elif kind < 0.5:
+            parts.append(rnd.choice(['<hr />', '<p></p>', EMPTY]))
+        elif kind < 0.7:
+            tag = rnd.choice(['ul', 'ol'])
+            items = ''.join(
+                f'<li>{make_inline(rnd)}{make_page(rnd, depth + 1) if rnd.random() < 0.3 else ""}</li>'
+                for _ in range(rnd.randint(1, 3))
+            )
+            parts.append(f'<{tag}>{items}</{tag}>')
+        else:
+            rows = ''.join(
+                '<tr>' + ''.join(
+                    f'<td>{make_page(rnd, depth + 1) if rnd.random() < 0.3 else make_inline(rnd)}</td>'
+                    for _ in range(rnd.randint(0, 3))
+                ) + '</tr>'
+                for _ in range(rnd.randint(1, 3))
+            )
+            parts.append(f'<table border="1">{rows}</table>')
+    return ''.join(parts)
+
+
+def make_inline(rnd):
+    parts = []
+    for _ in range(rnd.randint(0, 4)):
+        kind = rnd.random()
+        if kind < 0.6:
+            parts.append(' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 5))))
+        elif kind < 0.7:
+            parts.append('<br />')
+        elif kind < 0.8:
+            parts.append('<img src="x.png" />')
+        elif kind < 0.9:
+            parts.append(f'<b>{rnd.choice(WORDS)}</b>&nbsp;')
+        else:
+            parts.append(' \n')
+    return ''.join(parts)
+
+
+def qt_document(html):
+    document = QTextDocument()
+    document.setHtml(html)
+    return document
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Текст страниц: html_to_text против QTextDocument.toPlainText()")
+    parser.add_argument('--pages', type=int, default=500, help="случайных страниц")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    app = QApplication(sys.argv)
+    rnd = random.Random(args.seed)
+    cases = list(SAMPLES.items()) + [(f'случайная {i}', make_page(rnd)) for i in range(args.pages)]
+    pages = []
+    failed = 0
+    for name, body in cases:
+        for label, html in (('как есть', body), ('после toHtml', qt_document(body).toHtml())):
+            pages.append(html)
+            expected = qt_document(html).toPlainText()
+            text = html_to_text(html)
+            if text != expected:
+                failed += 1
+                print(f"РАСХОЖДЕНИЕ: {name} ({label})\n  Qt:          {expected!r}\n  html_to_text: {text!r}")
+    print(f"Проверено страниц: {len(pages)}, расхождений: {failed}")
+    start = time.perf_counter()
+    for html in pages:
+        qt_document(html).toPlainText()
+    qt_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for html in pages:
+        html_to_text(html)
+    own_time = time.perf_counter() - start
+    print(f"QTextDocument: {qt_time * 1000:.0f} мс, html_to_text: {own_time * 1000:.0f} мс")
+    app.quit()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import random
+
+# Синтетический корпус страниц в формате, который сохраняет QTextBrowser.toHtml()
+HEADER = (
+    '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.0//EN" "http://www.w3.org/TR/REC-html40/strict.dtd">\n'
+    '<html><head><meta name="qrichtext" content="1" /><style type="text/css">\n'
+    'p, li { white-space: pre-wrap; }\n'
+    "</style></head><body style=\" font-family:'MS Shell Dlg 2'; font-size:8.25pt; font-weight:400; font-style:normal;\">\n"
+)
+PARAGRAPH = (
+    '<p style=" margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; '
+    '-qt-block-indent:0; text-indent:0px;">{}</p>'
+)
+FOOTER = '</body></html>'
+
+WORDS = (
+    'база знаний раздел категория документ файл поиск индекс страница текст '
+    'сервер клиент запрос ответ настройка журнал ошибка отчёт договор счёт '
+    'инструкция регламент сотрудник отдел проект задача срок бюджет склад поставка '
+    'knowledge base section category document file search index page text '
+    'server client request response config journal error report contract invoice'
+).split()
+
+
+def make_vocabulary(size, seed=1):
+    # Общие слова плюс редкие синтетические, чтобы частоты были похожи на реальные
+    rnd = random.Random(seed)
+    letters = 'абвгдежзиклмнопрстуфхцчшэюяabcdefghijklmnopqrstuvwxyz'
+    rare = {''.join(rnd.choice(letters) for _ in range(rnd.randint(4, 10))) for _ in range(size)}
+    return WORDS + sorted(rare)
+
+
+def zipf_weights(size):
+    # Накопленные веса: слово с рангом r встречается с частотой ~ 1/r
+    total = 0.0
+    weights = []
+    for rank in range(1, size + 1):
+        total += 1.0 / rank
+        weights.append(total)
+    return weights
+
+
+def make_page(rnd, vocabulary, weights, paragraphs=5, words=20):
+    body = []
+    for _ in range(paragraphs):
+        text = ' '.join(rnd.choices(vocabulary, cum_weights=weights, k=words))
+        body.append(PARAGRAPH.format(text))
+    return HEADER + '\n'.join(body) + FOOTER
+
+
+def make_corpus(pages, seed=1):
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(max(pages, 1000), seed)
+    weights = zipf_weights(len(vocabulary))
+    for i in range(pages):
+        yield f"Раздел {i % 100}/Категория {i}", make_page(rnd, vocabulary, weights)
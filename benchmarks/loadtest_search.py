@@ -0,0 +1,99 @@
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.WARNING)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import WORDS, make_corpus
+
+# Нагрузочный тест /api/search.
+#   1) python benchmarks/loadtest_search.py populate /tmp/kb --pages 100000
+#   2) cd /tmp/kb && python /path/to/search.py
+#   3) python benchmarks/loadtest_search.py run --clients 32 --requests 5000
+
+
+def populate(args):
+    from database import Database
+    os.makedirs(args.folder, exist_ok=True)
+    db = Database(os.path.join(args.folder, 'data.db'), 'journal')
+    start = time.perf_counter()
+    for key, html in make_corpus(args.pages):
+        db.save_content(key, html)
+    db.close()
+    print(f"Создано страниц: {args.pages} за {time.perf_counter() - start:.1f} с")
+
+
+def make_queries(count, seed=2):
+    # Смесь запросов: частые и редкие слова, префиксы, фразы, фильтр по разделу
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        kind = rnd.random()
+        if kind < 0.5:
+            params = {'q': rnd.choice(WORDS)}
+        elif kind < 0.7:
+            params = {'q': rnd.choice(WORDS)[:4] + '*'}
+        elif kind < 0.85:
+            params = {'q': f'"{rnd.choice(WORDS)} {rnd.choice(WORDS)}"'}
+        else:
+            params = {'q': f"{rnd.choice(WORDS)} {rnd.choice(WORDS)}", 'prefix': f"Раздел {rnd.randrange(100)}"}
+        queries.append(params)
+    return queries
+
+
+def run(args):
+    queries = make_queries(args.requests)
+
+    def request(params):
+        url = f"{args.url}/api/search?{urllib.parse.urlencode(params)}"
+        start = time.perf_counter()
+        with urllib.request.urlopen(url) as response:
+            body = json.load(response)
+        elapsed = time.perf_counter() - start
+        # Каждый пятый клиент дочитывает вторую страницу по курсору
+        if body.get('next_cursor') and random.random() < 0.2:
+            page = dict(params, cursor=body['next_cursor'])
+            start = time.perf_counter()
+            with urllib.request.urlopen(f"{args.url}/api/search?{urllib.parse.urlencode(page)}") as response:
+                json.load(response)
+            elapsed = max(elapsed, time.perf_counter() - start)
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        latencies = sorted(pool.map(request, queries))
+    total = time.perf_counter() - start
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"Запросов: {len(latencies)}, клиентов: {args.clients}, {len(latencies) / total:.0f} запросов/с")
+    print(f"p50 {quantiles[49] * 1000:.1f} мс, p95 {quantiles[94] * 1000:.1f} мс, "
+          f"p99 {quantiles[98] * 1000:.1f} мс, max {latencies[-1] * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест /api/search')
+    commands = parser.add_subparsers(dest='command', required=True)
+    populate_parser = commands.add_parser('populate', help='создать базу с синтетическим корпусом')
+    populate_parser.add_argument('folder')
+    populate_parser.add_argument('--pages', type=int, default=100000)
+    run_parser = commands.add_parser('run', help='нагрузить запущенный сервер')
+    run_parser.add_argument('--url', default='http://127.0.0.1:5000')
+    run_parser.add_argument('--clients', type=int, default=32)
+    run_parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+    if args.command == 'populate':
+        populate(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
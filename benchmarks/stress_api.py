@@ -0,0 +1,171 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+logging.basicConfig(level=logging.WARNING)
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Стресс-тест API search.py: сервер поднимается в этом же процессе во
+# временном каталоге, читатели и писатели работают параллельно.
+# Проверяется, что:
+#   - ни один запрос не завершился ошибкой;
+#   - читатель никогда не видит версию страницы старше уже увиденной;
+#   - после остановки в базе (и после повторного открытия) последние версии
+#     всех страниц и все загруженные файлы.
+# Затем измеряется пропускная способность чтения при разном числе потоков.
+#   python benchmarks/stress_api.py --writers 4 --readers 8 --seconds 10
+
+VERSION = re.compile(r'<p>writer (\d+) version (\d+)</p>')
+
+
+class Client:
+    def __init__(self, url):
+        self.url = url
+
+    def get(self, path, **params):
+        with urllib.request.urlopen(f"{self.url}{path}?{urllib.parse.urlencode(params)}") as response:
+            return json.load(response)
+
+    def post_json(self, path, payload):
+        request = urllib.request.Request(f"{self.url}{path}", data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def upload(self, key, file_name, payload):
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="key"\r\n\r\n{key}\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8') + payload + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        request = urllib.request.Request(f"{self.url}/api/upload_file", data=body,
+                                         headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+
+def start_server(folder):
+    os.chdir(folder)
+    from werkzeug.serving import make_server
+    import search
+    server = make_server('127.0.0.1', 0, search.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='stress-server', daemon=True).start()
+    return server, search.db, f"http://127.0.0.1:{server.server_port}"
+
+
+def writer(client, number, stop, state, errors):
+    key = f"Раздел/Писатель {number}"
+    version = 0
+    while not stop.is_set():
+        version += 1
+        try:
+            client.post_json('/api/save_content', {'key': key, 'content': f"<p>writer {number} version {version}</p>"})
+            state['versions'][number] = version
+            if version % 10 == 0:
+                file_name = f"file_{version}.bin"
+                client.upload(key, file_name, os.urandom(4096))
+                state['files'][number].add(file_name)
+        except Exception as e:
+            errors.append(f"писатель {number}: {e}")
+
+
+def reader(client, writers, stop, counter, errors):
+    seen = {}
+    while not stop.is_set():
+        try:
+            client.get('/api/sections')
+            for number in range(writers):
+                key = f"Раздел/Писатель {number}"
+                content = client.get('/api/content', key=key)['content']
+                client.get('/api/files', key=key)
+                counter[0] += 3
+                if not content:
+                    continue
+                match = VERSION.fullmatch(content)
+                if not match or int(match.group(1)) != number:
+                    errors.append(f"чужое или повреждённое содержимое '{key}': {content!r}")
+                    continue
+                version = int(match.group(2))
+                if version < seen.get(number, 0):
+                    errors.append(f"'{key}': версия {version} после {seen[number]}")
+                seen[number] = version
+        except Exception as e:
+            errors.append(f"читатель: {e}")
+
+
+def run_phase(client, writers, readers, seconds, state, errors):
+    stop = threading.Event()
+    counter = [0]
+    threads = [threading.Thread(target=writer, args=(client, number, stop, state, errors)) for number in range(writers)]
+    threads += [threading.Thread(target=reader, args=(client, max(writers, 1), stop, counter, errors))
+                for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counter[0] / seconds
+
+
+def check(db, state, errors, label):
+    for number, version in state['versions'].items():
+        key = f"Раздел/Писатель {number}"
+        expected = f"<p>writer {number} version {version}</p>"
+        if db.load_content(key) != expected:
+            errors.append(f"{label}: '{key}' = {db.load_content(key)!r}, ожидалось {expected!r}")
+        missing = state['files'][number] - set(db.get_files(key))
+        if missing:
+            errors.append(f"{label}: у '{key}' нет файлов {sorted(missing)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Стресс-тест API search.py')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        server, db, url = start_server(tmp)
+        client = Client(url)
+        state = {'versions': {}, 'files': {number: set() for number in range(args.writers)}}
+        errors = []
+        rate = run_phase(client, args.writers, args.readers, args.seconds, state, errors)
+        print(f"Писателей {args.writers}, читателей {args.readers}: {rate:.0f} чтений/с, "
+              f"мутаций {db.committed} за {db.batches} пачек")
+        check(db, state, errors, 'в памяти')
+
+        print(f"{'читателей':>10} {'чтений/с':>10}")
+        for readers in (1, 2, 4, 8, 16):
+            rate = run_phase(client, 0, readers, max(args.seconds / 4, 1), state, errors)
+            print(f"{readers:10} {rate:10.0f}")
+
+        server.shutdown()
+        db.close()
+        from database import Database
+        reopened = Database(os.path.join(tmp, 'data.db'))
+        check(reopened, state, errors, 'после перезапуска')
+        reopened.close()
+        os.chdir(ROOT)
+    if errors:
+        print(f"Нарушений: {len(errors)}")
+        for error in errors[:20]:
+            print('  ' + error)
+        sys.exit(1)
+    print("Нарушений не обнаружено.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import logging
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    # Контентно-адресуемое хранилище вложений: каждый файл хранится один раз
+    # под своим sha256 в <root>/<первые 2 символа>/<digest>.
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, stream):
+        # Копирует поток во временный файл, считая хэш на лету.
+        # Возвращает (digest, size); одинаковые файлы не дублируются.
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            digest = hasher.hexdigest()
+            blob_path = self.path(digest)
+            if os.path.exists(blob_path):
+                os.remove(tmp_path)
+                # Обновляем время, чтобы сборка мусора не удалила блоб до фиксации записи
+                os.utime(blob_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(tmp_path, blob_path)
+            return digest, size
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, digest):
+        return open(self.path(digest), 'rb')
+
+    def materialize(self, digest, file_name, folder):
+        # Даёт файлу блоба человекочитаемое имя (для открытия внешней программой)
+        dest_folder = os.path.join(folder, digest)
+        dest_path = os.path.join(dest_folder, file_name)
+        if not os.path.exists(dest_path):
+            os.makedirs(dest_folder, exist_ok=True)
+            try:
+                os.link(self.path(digest), dest_path)
+            except OSError:
+                shutil.copyfile(self.path(digest), dest_path)
+        return dest_path
+
+    def collect_garbage(self, live_digests, older_than):
+        # Удаляет блобы, на которые нет ссылок и которые не менялись после older_than
+        removed = 0
+        for prefix in os.listdir(self.root):
+            folder = os.path.join(self.root, prefix)
+            if prefix == 'tmp' or not os.path.isdir(folder):
+                continue
+            for digest in os.listdir(folder):
+                blob_path = os.path.join(folder, digest)
+                if digest in live_digests or os.path.getmtime(blob_path) >= older_than:
+                    continue
+                try:
+                    os.remove(blob_path)
+                    removed += 1
+                except OSError as e:
+                    logging.error(f"Не удалось удалить блоб '{blob_path}': {e}")
+        if removed:
+            logging.info(f"Удалено неиспользуемых блобов: {removed}.")
+        return removed
@@ -0,0 +1,468 @@
+import argparse
+import base64
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import urllib.parse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from nodestore import SEPARATOR, join
+
+# Массовый импорт и экспорт базы знаний.
+#
+# Каталог и tar-архив устроены одинаково (имена узлов — компоненты пути):
+#   <путь узла>/              — узел дерева
+#   <путь узла>.html          — страница с этим ключом (UTF-8)
+#   <путь узла>.files/<имя>   — вложения страницы
+# Страница без каталога узла (например, 'Главная') — страница вне дерева.
+# Символы, недопустимые в именах файлов, и '%' кодируются как %XX. В tar
+# элементы идут в порядке дерева и списков файлов; в каталоге порядок не
+# хранится, и при импорте узлы и вложения добавляются по имени.
+#
+# JSONL — по записи на строку:
+#   {"node": ключ}
+#   {"page": ключ, "content": HTML}
+#   {"file": ключ, "name": имя, "data": base64} или "path" — путь к файлу
+#   относительно JSONL
+#
+# Импорт идёт потоком: узлы, страницы и готовые записи вложений
+# накапливаются в пачку и фиксируются одной транзакцией (одна запись
+# журнала вместо сохранения базы на каждый элемент). Вложения копируются в
+# хранилище блобов с подсчётом sha256 в пуле потоков, пока читаются
+# следующие элементы. Экспорт читает согласованный срез базы
+# (Database.export_view) по одной странице, не держа базу в памяти.
+
+# Пачка импорта: не больше BATCH_PAGES страниц и BATCH_BYTES байт HTML
+BATCH_PAGES = 500
+BATCH_BYTES = 16 * 1024 * 1024
+# Вложение из потокового архива до этого размера буферизуется в памяти,
+# больше — во временном файле, чтобы хэширование шло параллельно чтению
+SPOOL_SIZE = 4 * 1024 * 1024
+# Порция вложения при экспорте в JSONL; кратна 3, чтобы base64 порций
+# склеивался без заполнителей '='
+BASE64_CHUNK = 3 * 1024 * 1024
+EXPORT_FORMATS = ('dir', 'tar', 'tgz', 'jsonl')
+_UNSAFE = re.compile(r'[%\\/:*?"<>|\x00-\x1f]')
+_PAGE_SUFFIX = '.html'
+_FILES_SUFFIX = '.files'
+
+
+def encode_name(name):
+    if name in ('.', '..'):
+        return name.replace('.', '%2E')
+    return _UNSAFE.sub(lambda match: f"%{ord(match.group()):02X}", name)
+
+
+def decode_name(name):
+    return urllib.parse.unquote(name)
+
+
+def key_path(key):
+    return [encode_name(name) for name in key.split(SEPARATOR)]
+
+
+class BulkStats:
+    def __init__(self):
+        self.nodes = 0
+        self.pages = 0
+        self.files = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def as_dict(self):
+        elapsed = max(self.elapsed, 1e-9)
+        return {
+            'nodes': self.nodes,
+            'pages': self.pages,
+            'files': self.files,
+            'bytes': self.bytes,
+            'seconds': round(self.elapsed, 3),
+            'pages_per_second': round(self.pages / elapsed, 1),
+            'mb_per_second': round(self.bytes / elapsed / 1e6, 2)
+        }
+
+    def __str__(self):
+        stats = self.as_dict()
+        return (f"узлов {self.nodes}, страниц {self.pages}, файлов {self.files}, "
+                f"{self.bytes / 1e6:.1f} МБ за {self.elapsed:.1f} с: "
+                f"{stats['pages_per_second']:.0f} страниц/с, {stats['mb_per_second']:.1f} МБ/с")
+
+
+# Источники импорта. Каждый выдаёт элементы ('node', ключ),
+# ('page', ключ, HTML) и ('file', ключ, имя, источник), где источник — путь
+# к файлу или открытый бинарный поток.
+
+def read_directory(root):
+    def walk(folder, key):
+        for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+            name = entry.name
+            if entry.is_dir():
+                if name.endswith(_FILES_SUFFIX):
+                    page_key = join(key, decode_name(name[:-len(_FILES_SUFFIX)]))
+                    for item in sorted(os.scandir(entry.path), key=lambda item: item.name):
+                        if item.is_file():
+                            yield ('file', page_key, decode_name(item.name), item.path)
+                else:
+                    child_key = join(key, decode_name(name))
+                    yield ('node', child_key)
+                    yield from walk(entry.path, child_key)
+            elif name.endswith(_PAGE_SUFFIX):
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    yield ('page', join(key, decode_name(name[:-len(_PAGE_SUFFIX)])), f.read())
+
+    yield from walk(root, '')
+
+
+def read_tar(stream):
+    # Архив читается потоком (tar, tar.gz, tar.bz2, tar.xz), без перемотки
+    with tarfile.open(fileobj=stream, mode='r|*') as tar:
+        for member in tar:
+            parts = [part for part in member.name.split('/') if part and part != '.']
+            if not parts:
+                continue
+            if member.isdir():
+                if not parts[-1].endswith(_FILES_SUFFIX):
+                    yield ('node', SEPARATOR.join(decode_name(part) for part in parts))
+            elif member.isfile():
+                data = tar.extractfile(member)
+                if len(parts) > 1 and parts[-2].endswith(_FILES_SUFFIX):
+                    key = SEPARATOR.join(decode_name(part) for part in parts[:-2] + [parts[-2][:-len(_FILES_SUFFIX)]])
+                    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+                    shutil.copyfileobj(data, spool)
+                    spool.seek(0)
+                    yield ('file', key, decode_name(parts[-1]), spool)
+                elif parts[-1].endswith(_PAGE_SUFFIX):
+                    parts[-1] = parts[-1][:-len(_PAGE_SUFFIX)]
+                    yield ('page', SEPARATOR.join(decode_name(part) for part in parts), data.read().decode('utf-8'))
+
+
+def read_jsonl(stream, base_folder=None):
+    # stream — текстовый или бинарный поток строк JSON
+    for number, line in enumerate(stream, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if "node" in record:
+            yield ('node', record["node"])
+        elif "page" in record:
+            if not isinstance(record["content"], str):
+                raise ValueError(f"Строка {number} JSONL: содержимое страницы должно быть строкой")
+            yield ('page', record["page"], record["content"])
+        elif "file" in record:
+            if "data" in record:
+                source = io.BytesIO(base64.b64decode(record["data"]))
+            else:
+                source = os.path.join(base_folder or '.', record["path"])
+            yield ('file', record["file"], record["name"], source)
+        else:
+            logging.warning(f"Строка {number} JSONL не распознана.")
+
+
+def open_source(path):
+    # Элементы источника по пути: каталог, *.jsonl или tar-архив; '-' — stdin (tar)
+    if path == '-':
+        return read_tar(sys.stdin.buffer)
+    if os.path.isdir(path):
+        return read_directory(path)
+
+    def items():
+        if path.endswith('.jsonl'):
+            with open(path, 'r', encoding='utf-8') as f:
+                yield from read_jsonl(f, os.path.dirname(os.path.abspath(path)))
+        else:
+            with open(path, 'rb') as f:
+                yield from read_tar(f)
+
+    return items()
+
+
+class Importer:
+    # Импорт элементов в Database пачками транзакций
+
+    def __init__(self, db, workers=None, batch_pages=BATCH_PAGES, batch_bytes=BATCH_BYTES):
+        self.db = db
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 2)
+        self.batch_pages = batch_pages
+        self.batch_bytes = batch_bytes
+        self.pending = []
+        self.pending_pages = 0
+        self.pending_bytes = 0
+        self.pending_files = 0
+        # ключ -> место следующего вложения в списке файлов
+        self.next_order = {}
+
+    def run(self, items):
+        stats = BulkStats()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk-import') as pool:
+            for item in items:
+                kind = item[0]
+                if kind == 'file':
+                    _, key, file_name, source = item
+                    self.pending.append(('file', key, file_name, pool.submit(self.store_file, file_name, source)))
+                    self.pending_files += 1
+                else:
+                    self.pending.append(item)
+                    if kind == 'page':
+                        self.pending_pages += 1
+                        self.pending_bytes += len(item[2])
+                if (self.pending_pages >= self.batch_pages or self.pending_bytes >= self.batch_bytes
+                        or self.pending_files >= 4 * self.workers):
+                    self.flush(stats)
+            self.flush(stats)
+        stats.finish()
+        logging.info(f"Импорт завершён: {stats}.")
+        return stats
+
+    def store_file(self, file_name, source):
+        if isinstance(source, str):
+            with open(source, 'rb') as stream:
+                return self.db.make_file_record(file_name, stream, 0)
+        try:
+            return self.db.make_file_record(file_name, source, 0)
+        finally:
+            source.close()
+
+    def flush(self, stats):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        self.pending_pages = self.pending_bytes = self.pending_files = 0
+        # Записи вложений готовы до начала транзакции: внутри неё только
+        # отложенные мутации, без ожидания диска
+        files = [(item[1], item[2], item[3].result()) for item in pending if item[0] == 'file']
+        with self.db.transaction():
+            stats.nodes += self.db.add_nodes([item[1] for item in pending if item[0] == 'node'])
+            for item in pending:
+                if item[0] == 'page':
+                    self.db.save_content(item[1], item[2])
+                    stats.pages += 1
+                    stats.bytes += len(item[2].encode('utf-8'))
+            for key, file_name, record in files:
+                if key not in self.next_order:
+                    self.next_order[key] = len(self.db.get_files(key))
+                self.db.link_file(key, file_name, record, self.next_order[key])
+                self.next_order[key] += 1
+                stats.files += 1
+                stats.bytes += record["size"]
+
+
+def import_items(db, items, workers=None):
+    return Importer(db, workers).run(items)
+
+
+# Экспорт
+
+def export_items(db):
+    # Элементы экспорта по согласованному срезу базы: узлы в прямом порядке
+    # обхода, за каждым — его страница и вложения; затем страницы и
+    # вложения вне дерева. Вложение — ('file', ключ, имя, запись).
+    view = db.export_view()
+    tree, content, files = view["tree"], view["content"], view["files"]
+    try:
+        exported = set()
+        for key in tree.subtree_keys('')[1:]:
+            yield ('node', key)
+            yield from _key_items(key, content, files)
+            exported.add(key)
+        for key in list(content) + list(files):
+            if key not in exported:
+                yield from _key_items(key, content, files)
+                exported.add(key)
+    finally:
+        content.release()
+
+
+def _key_items(key, content, files):
+    if key in content:
+        yield ('page', key, content.peek(key))
+    for file_name, record in sorted(files.get(key, {}).items(), key=lambda entry: entry[1]["order"]):
+        yield ('file', key, file_name, record)
+
+
+def export_directory(db, root):
+    stats = BulkStats()
+    for item in export_items(db):
+        path = os.path.join(root, *key_path(item[1]))
+        if item[0] == 'node':
+            os.makedirs(path, exist_ok=True)
+            stats.nodes += 1
+        elif item[0] == 'page':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            body = item[2].encode('utf-8')
+            with open(path + _PAGE_SUFFIX, 'wb') as f:
+                f.write(body)
+            stats.pages += 1
+            stats.bytes += len(body)
+        else:
+            folder = path + _FILES_SUFFIX
+            os.makedirs(folder, exist_ok=True)
+            stats.bytes += _copy_blob(db, item[3], os.path.join(folder, encode_name(item[2])))
+            stats.files += 1
+    stats.finish()
+    logging.info(f"Экспорт в '{root}' завершён: {stats}.")
+    return stats
+
+
+def _copy_blob(db, record, target):
+    try:
+        shutil.copyfile(db.file_path(record), target)
+    except FileNotFoundError:
+        logging.warning(f"Блоб {record['digest']} вложения '{record['name']}' не найден, пропущен.")
+        return 0
+    return record["size"]
+
+
+class _Chunks:
+    # Файлоподобный приёмник для tarfile: накопленное забирается take()
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def export_stream(db, fmt='tar', stats=None):
+    # Генератор байтов архива (tar, tgz) или JSONL — для файла, stdout или
+    # потокового HTTP-ответа. Вложения читаются из блобов порциями.
+    stats = stats or BulkStats()
+    if fmt == 'jsonl':
+        for item in export_items(db):
+            if item[0] == 'node':
+                record = {"node": item[1]}
+                stats.nodes += 1
+            elif item[0] == 'page':
+                record = {"page": item[1], "content": item[2]}
+                stats.pages += 1
+                stats.bytes += len(item[2].encode('utf-8'))
+            else:
+                try:
+                    blob = open(db.file_path(item[3]), 'rb')
+                except FileNotFoundError:
+                    logging.warning(f"Блоб {item[3]['digest']} вложения '{item[2]}' не найден, пропущен.")
+                    continue
+                # Поле data пишется порциями: вложение целиком в памяти не держится
+                head = json.dumps({"file": item[1], "name": item[2], "data": ""}, ensure_ascii=False)
+                yield head[:-2].encode('utf-8')
+                with blob:
+                    while True:
+                        chunk = blob.read(BASE64_CHUNK)
+                        if not chunk:
+                            break
+                        yield base64.b64encode(chunk)
+                        stats.bytes += len(chunk)
+                yield b'"}\n'
+                stats.files += 1
+                continue
+            yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        stats.finish()
+        return
+    sink = _Chunks()
+    with tarfile.open(fileobj=sink, mode='w|gz' if fmt == 'tgz' else 'w|', format=tarfile.PAX_FORMAT) as tar:
+        for item in export_items(db):
+            name = '/'.join(key_path(item[1]))
+            if item[0] == 'node':
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                tar.addfile(info)
+                stats.nodes += 1
+            elif item[0] == 'page':
+                body = item[2].encode('utf-8')
+                info = tarfile.TarInfo(name + _PAGE_SUFFIX)
+                info.size = len(body)
+                tar.addfile(info, io.BytesIO(body))
+                stats.pages += 1
+                stats.bytes += len(body)
+            else:
+                record = item[3]
+                try:
+                    blob = open(db.file_path(record), 'rb')
+                except FileNotFoundError:
+                    logging.warning(f"Блоб {record['digest']} вложения '{item[2]}' не найден, пропущен.")
+                    continue
+                with blob:
+                    info = tarfile.TarInfo(f"{name}{_FILES_SUFFIX}/{encode_name(item[2])}")
+                    info.size = record["size"]
+                    tar.addfile(info, blob)
+                stats.files += 1
+                stats.bytes += record["size"]
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    chunk = sink.take()
+    if chunk:
+        yield chunk
+    stats.finish()
+
+
+def export_to(db, target, fmt):
+    if fmt == 'dir':
+        return export_directory(db, target)
+    stats = BulkStats()
+    out = sys.stdout.buffer if target == '-' else open(target, 'wb')
+    try:
+        for chunk in export_stream(db, fmt, stats):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    logging.info(f"Экспорт в '{target}' завершён: {stats}.")
+    return stats
+
+
+def main():
+    from database import Database
+    parser = argparse.ArgumentParser(description="Массовый импорт и экспорт базы знаний")
+    parser.add_argument('--db', default='data.db', help="файл базы (сервер с этой базой должен быть остановлен)")
+    parser.add_argument('--storage', default='journal', choices=('journal', 'pickle'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    importing = commands.add_parser('import', help="каталог, *.jsonl или tar-архив ('-' — tar из stdin)")
+    importing.add_argument('source')
+    importing.add_argument('--workers', type=int, default=None, help="потоков для вложений")
+    exporting = commands.add_parser('export', help="в каталог, tar, tgz или jsonl ('-' — stdout)")
+    exporting.add_argument('target')
+    exporting.add_argument('--format', choices=EXPORT_FORMATS, default=None,
+                           help="по умолчанию — по расширению цели, иначе каталог")
+    args = parser.parse_args()
+    db = Database(args.db, args.storage)
+    try:
+        if args.command == 'import':
+            stats = import_items(db, open_source(args.source), args.workers)
+        else:
+            fmt = args.format or guess_format(args.target)
+            stats = export_to(db, args.target, fmt)
+    finally:
+        db.close()
+    print(stats, file=sys.stderr)
+
+
+def guess_format(target):
+    if target == '-':
+        return 'tar'
+    for suffix, fmt in (('.jsonl', 'jsonl'), ('.tar.gz', 'tgz'), ('.tgz', 'tgz'), ('.tar', 'tar')):
+        if target.endswith(suffix):
+            return fmt
+    return 'dir'
+
+
+if __name__ == '__main__':
+    main()
@@ -1,128 +1,1045 @@
+import contextlib
+import difflib
+import io
 import pickle
+import queue
 import threading
+import time
 import os
 import logging
-
-# Настройка логирования
-logging.basicConfig(
-    filename='app.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
+from concurrent.futures import Future
+from attachments import AttachmentExtractor
+from blobstore import BlobStore
+from generation import Generation
+from nodestore import SEPARATOR, NodeStore, join, split
+from history import RevisionStore
+from journal import Journal
+from logsetup import configure_logging, load_settings
+from pagecodec import RAW, TRAINING_SAMPLE, PageCodec, canonicalize_html, sample_keys
+from snapshot import PageStore, is_snapshot, read_snapshot, write_snapshot
+from search_index import (
+    ATTACHMENT_SEPARATOR, SearchIndex, attachment_key, decode_cursor, encode_cursor, fingerprint,
+    highlight_spans, make_snippets, parse_query, split_attachment_key
 )
+from suggest import TitleIndex, split_query
+from textextract import html_to_text
+from utils import get_mime_type
+
+# Настройка логирования (фоновая запись, уровень и ротация — в config.json)
+configure_logging('app.log', load_settings())
+
+# Размер журнала, после которого он сворачивается в снимок
+COMPACT_THRESHOLD = 16 * 1024 * 1024
+# Размер журнала поискового индекса, после которого индекс сохраняется
+# целиком, а журнал начинается заново
+INDEX_LOG_THRESHOLD = 32 * 1024 * 1024
+# Наибольшее число мутаций, которые поток записи применяет одной пачкой
+COMMIT_BATCH = 256
+# Словарь сжатия страниц пересобирается, когда корпус вырос вдвое с момента
+# сборки, но не раньше этого числа страниц и не позже TRAINING_SAMPLE
+MIN_TRAINING_PAGES = 100
+# Порция текста страницы при чтении по частям (iter_content)
+CONTENT_CHUNK = 64 * 1024
+
+
 
 class Database:
-    def __init__(self, db_file='data.db'):
+    def __init__(self, db_file='data.db', storage='pickle', blobs_folder=None, compression='zlib', canonicalize=False):
+        self._setup(db_file, storage, blobs_folder, compression, canonicalize)
+        self.compact_lock = threading.Lock()
+        # Поколение для реплик в других процессах (replica.ReadReplica)
+        self.generation = Generation(db_file + '.gen', writable=True)
+        self.load_data()
+        self.open_journal()
+        self.migrate_files()
+        self.search_index = SearchIndex(db_file + '.index')
+        self.search_index.load()
+        self.search_index.open_log()
+        # Тексты вложений извлекаются в фоновых процессах и попадают в тот же
+        # индекс отдельными документами
+        self.attachments = AttachmentExtractor(db_file + '.text')
+        self.sync_search_index()
+        self.listeners.append(self.update_search_index)
+        self.listeners.append(self.update_attachment_index)
+        self.listeners.append(self.update_titles)
+        self.history = RevisionStore(db_file + '.history')
+        self.history.load()
+        self.sync_history()
+        self.listeners.append(self.update_history)
+        # Все мутации применяет единственный поток записи. Читатели не берут
+        # блокировок: разделы и списки файлов заменяются копиями, а не
+        # изменяются на месте, так что полученный объект остаётся согласованным.
+        self.commits = queue.Queue()
+        self.batches = 0
+        self.committed = 0
+        self.writer = threading.Thread(target=self._write_loop, name='database-writer', daemon=True)
+        self.writer.start()
+
+    def _setup(self, db_file, storage, blobs_folder, compression, canonicalize):
+        # Состояние в памяти, общее для базы и реплик (replica.ReadReplica):
+        # всё, что не открывает файлов базы и не запускает потоков
         self.db_file = db_file
+        self.storage = storage
+        # compression — 'zlib' (со словарём по корпусу) или 'raw' для страниц
+        # в снимке; canonicalize — сокращать служебные стили Qt при сохранении
+        self.compression = compression
+        self.canonicalize = canonicalize
+        self.blobs = BlobStore(blobs_folder or os.path.join(os.path.dirname(os.path.abspath(db_file)), 'blobs'))
+        self.garbage = False
         self.lock = threading.Lock()
         self.data = {
-            "sections": {},
-            "content": {},
+            "tree": NodeStore(),
+            "content": PageStore(),
             "files": {}
         }
-        self.load_data()
+        self.snapshot_seq = 0
+        self.text_cache = {}
+        # Версии данных для ETag и кэша HTTP-ответов: (вид, ключ) -> номер
+        # изменения, вид — 'content', 'files' или 'tree' (ключ ''). Номера
+        # уникальны в процессе, эпоха отличает запуски.
+        self.versions = {}
+        self.version_seq = 0
+        self.epoch = os.urandom(4).hex()
+        self.listeners = []
+        # Открытая транзакция текущего потока: список отложенных мутаций и
+        # черновик для проверок (_Draft)
+        self.local = threading.local()
+        # Откат пачки (_apply_batch): прежние списки файлов [(ключ, список или
+        # None)] и изменённые версии [(вид, ключ)]
+        self.undo = None
+        self.touched = None
+        self.journal = None
+        self.search_index = None
+        # attachment_names — ключ -> имена проиндексированных вложений
+        self.attachment_lock = threading.Lock()
+        self.attachment_names = {}
+        # Названия узлов для подсказок; строятся при первой подсказке
+        self.titles = None
+        self.closed = False
 
     def load_data(self):
         # Проверяем, существует ли файл базы данных
         if os.path.exists(self.db_file):
+            if is_snapshot(self.db_file):
+                # Снимок: сразу читается только оглавление, страницы — по запросу
+                try:
+                    self.data, self.snapshot_seq = read_snapshot(self.db_file)
+                    logging.info("База данных успешно загружена.")
+                except Exception as e:
+                    logging.error(f"Ошибка при загрузке базы данных: {e}")
+                return
             with open(self.db_file, 'rb') as f:
                 try:
                     self.data = pickle.load(f)
+                    self.data["tree"] = NodeStore.from_sections(self.data.pop("sections"))
+                    self.data["content"] = PageStore(self.data["content"])
                     logging.info("База данных успешно загружена.")
                 except Exception as e:
                     logging.error(f"Ошибка при загрузке базы данных: {e}")
-                    self.data = {"sections": {}, "content": {}, "files": {}}
+                    self.data = {"tree": NodeStore(), "content": PageStore(), "files": {}}
+                    return
+                # После данных старого формата может идти служебная запись
+                # с номером последнего свёрнутого сегмента журнала
+                try:
+                    self.snapshot_seq = pickle.load(f).get("wal_seq", 0)
+                except Exception:
+                    self.snapshot_seq = 0
         else:
             logging.info("Файл данных не найден. Начинаем с пустой базы данных.")
 
+    def open_journal(self):
+        # Доигрываем журнал поверх снимка. В режиме 'pickle' оставшиеся после
+        # режима 'journal' сегменты сразу сворачиваются в обычный файл данных.
+        journal = Journal(self.db_file)
+        replayed = 0
+        for op, args in journal.replay(self.snapshot_seq):
+            self.apply(op, args)
+            replayed += 1
+        if replayed:
+            logging.info(f"Из журнала восстановлено записей: {replayed}.")
+        if self.storage == 'journal':
+            journal.open(self.snapshot_seq)
+            self.journal = journal
+        elif journal.segments():
+            self.save_data()
+            journal.drop_until(journal.seq)
+
+    def migrate_files(self):
+        # Переносим содержимое вложений старого формата (байты внутри data.db)
+        # в хранилище блобов, оставляя в базе только метаданные
+        migrated = 0
+        for key, files in list(self.data["files"].items()):
+            if not any(isinstance(value, bytes) for value in files.values()):
+                continue
+            records = {}
+            for order, (file_name, value) in enumerate(files.items()):
+                if isinstance(value, bytes):
+                    value = self.make_file_record(file_name, io.BytesIO(value), order)
+                    migrated += 1
+                records[file_name] = value
+            with self.lock:
+                self.apply("update_file_order", (key, records))
+        if migrated:
+            self.save_data()
+            logging.info(f"Перенесено вложений в хранилище блобов: {migrated}.")
+
+    def make_file_record(self, file_name, stream, order):
+        digest, size = self.blobs.put(stream)
+        return {
+            "name": file_name,
+            "digest": digest,
+            "size": size,
+            "mime": get_mime_type(file_name),
+            "order": order
+        }
+
     def save_data(self):
-        # Сохраняем данные в файл
+        # Сохраняем данные в файл. Ошибка записи поднимается вызывающему:
+        # изменения остались только в памяти
+        if self.journal is not None:
+            self.compact()
+            return
         with self.lock:
             try:
-                with open(self.db_file, 'wb') as f:
-                    pickle.dump(self.data, f)
+                started = time.time()
+                snapshot = self.snapshot()
+                self.store_snapshot(snapshot, 0)
                 logging.info("База данных успешно сохранена.")
             except Exception as e:
                 logging.error(f"Ошибка при сохранении базы данных: {e}")
+                raise
+            self.collect_garbage(snapshot, started)
+        # В режиме 'pickle' база пишется целиком при каждой записи, индекс —
+        # только когда его журнал разросся
+        if self.search_index is not None and self.search_index.log_size() > INDEX_LOG_THRESHOLD:
+            self.search_index.save()
 
-    def add_section(self, section_name):
-        if section_name not in self.data["sections"]:
-            self.data["sections"][section_name] = []
-            self.save_data()
-            logging.info(f"Раздел '{section_name}' добавлен.")
+    def snapshot(self):
+        # Поверхностная копия данных для записи снимка (вызывается под self.lock)
+        return {
+            "tree": self.data["tree"].dump(),
+            "content": self.data["content"].snapshot(),
+            "files": {key: dict(files) for key, files in self.data["files"].items()}
+        }
+
+    def store_snapshot(self, snapshot, seq):
+        # Снимок пишется во временный файл и атомарно заменяет файл данных;
+        # непрочитанные страницы переключаются на новый файл
+        tmp_file = self.db_file + '.tmp'
+        codec = self.page_codec(snapshot["content"])
+        pages = write_snapshot(tmp_file, snapshot, seq, codec)
+        self.data["content"].remap(tmp_file, self.db_file, snapshot["content"], pages, codec)
+        self.generation.publish(snapshot=True)
+
+    def page_codec(self, content):
+        # Кодек для нового снимка: текущий или словарь, собранный заново по
+        # выборке страниц. Смена словаря перекодирует все страницы снимка,
+        # поэтому пересборка идёт лишь при удвоении корпуса и только пока
+        # выборка не достигла TRAINING_SAMPLE страниц.
+        if self.compression == 'raw':
+            return RAW
+        current = content.codec
+        pages = len(content)
+        if current.method == 'zlib' and (
+            current.trained_on >= TRAINING_SAMPLE
+            or pages < max(2 * current.trained_on, MIN_TRAINING_PAGES)
+        ):
+            return current
+        started = time.perf_counter()
+        codec = PageCodec.train((content.peek(key) for key in sample_keys(content)), pages)
+        logging.info(
+            f"Словарь сжатия страниц собран по {min(pages, TRAINING_SAMPLE)} страницам "
+            f"из {pages} за {time.perf_counter() - started:.2f} с."
+        )
+        return codec
+
+    def collect_garbage(self, data, started):
+        # Блобы удаляем только после того, как удаление ссылок записано на диск
+        if not self.garbage:
+            return
+        self.garbage = False
+        live_digests = {
+            record["digest"]
+            for files in data["files"].values()
+            for record in files.values()
+            if isinstance(record, dict)
+        }
+        self.blobs.collect_garbage(live_digests, started)
+        self.attachments.cache.collect_garbage(live_digests, started)
+
+    def compact(self):
+        # Сворачиваем журнал в снимок. Под блокировкой только ротация сегмента
+        # и поверхностная копия словарей; запись снимка идёт без блокировки.
+        with self.compact_lock:
+            with self.lock:
+                started = time.time()
+                seq = self.journal.rotate()
+                snapshot = self.snapshot()
+            try:
+                self.store_snapshot(snapshot, seq)
+                self.snapshot_seq = seq
+                self.journal.drop_until(seq)
+                logging.info(f"Журнал свёрнут в снимок (сегмент {seq}).")
+                # Заодно сохраняем поисковый индекс, чтобы его журнал не рос
+                # (при переносе вложений в начале открытия индекса ещё нет)
+                if self.search_index is not None:
+                    self.search_index.save()
+                self.collect_garbage(snapshot, started)
+            except Exception as e:
+                logging.error(f"Ошибка при сворачивании журнала: {e}")
+
+    def save_search_index(self):
+        # Сохраняет индекс в фоне, если его журнал всё ещё больше порога
+        # (другой поток мог уже сохранить его, пока этот ждал блокировку)
+        with self.compact_lock:
+            if self.search_index.log_size() > INDEX_LOG_THRESHOLD:
+                self.search_index.save()
+
+    def close(self):
+        # Повторный вызов (например, из atexit после штатной остановки сервера) ничего не делает
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer.is_alive():
+            self.commits.put(None)
+            self.writer.join()
+        if self.journal is not None:
+            if self.garbage:
+                self.compact()
+            self.journal.close()
+        self.attachments.close()
+        self.search_index.close()
+        self.history.close()
+        self.data["content"].release()
+        self.generation.close()
+
+    def sync_search_index(self):
+        # Доводим сохранённый индекс до текущего содержимого: переиндексируются
+        # только страницы, изменённые после последнего сохранения индекса.
+        # Тексты новых и заменённых вложений извлекаются в фоне.
+        content = self.data["content"]
+        files = self.data["files"]
+        self.attachment_names = {}
+        for key in self.search_index.indexed_keys():
+            owner, file_name = split_attachment_key(key)
+            if file_name is None:
+                if key not in content:
+                    self.search_index.remove(key)
+            elif files.get(owner, {}).get(file_name, {}).get("digest") != self.search_index.fingerprint(key):
+                self.search_index.remove(key)
+            else:
+                self.attachment_names.setdefault(owner, set()).add(file_name)
+        reindexed = 0
+        for key in content:
+            # Для непрочитанных страниц crc32 берётся из оглавления снимка
+            html_fingerprint = content.crc32(key)
+            if self.search_index.fingerprint(key) != html_fingerprint:
+                self.search_index.update(key, self.load_text(key), html_fingerprint)
+                reindexed += 1
+        if reindexed:
+            logging.info(f"Переиндексировано страниц: {reindexed}.")
+        for key, records in files.items():
+            for file_name, record in records.items():
+                self.index_attachment(key, file_name, record)
+
+    def update_search_index(self, op, args):
+        if op == "content_revision":
+            key, _, _, html_fingerprint = args
+            self.search_index.update(key, self.load_text(key), html_fingerprint)
+        elif op == "delete_content":
+            self.search_index.remove(args[0])
+        elif op == "rename_key":
+            self.search_index.rename(*args)
+
+    def update_attachment_index(self, op, args):
+        if op == "add_file":
+            self.index_attachment(*args)
+        elif op == "delete_files":
+            self.remove_attachments(args[0])
+        elif op == "update_file_order":
+            key, files = args
+            self.remove_attachments(key, keep=files)
+        elif op == "move_files":
+            old_key, new_key = args
+            with self.attachment_lock:
+                names = self.attachment_names.pop(old_key, set())
+                for file_name in names:
+                    self.search_index.rename(attachment_key(old_key, file_name), attachment_key(new_key, file_name))
+                if names:
+                    self.attachment_names[new_key] = names
+            # Вложения, текст которых ещё извлекается, индексируются под новым ключом
+            for file_name, record in self.get_files(new_key).items():
+                self.index_attachment(new_key, file_name, record)
+
+    def index_attachment(self, key, file_name, record):
+        # Извлекает текст вложения в фоне и индексирует его, если к тому
+        # времени файл всё ещё привязан к ключу. Текст заменённого файла с тем
+        # же именем удаляется из индекса сразу.
+        digest = record["digest"]
+        doc_key = attachment_key(key, file_name)
+        indexed = self.search_index.fingerprint(doc_key)
+        if indexed == digest:
+            return
+        if indexed is not None:
+            with self.attachment_lock:
+                self.search_index.remove(doc_key)
+                self.attachment_names.get(key, set()).discard(file_name)
+        future = self.attachments.submit(digest, self.blobs.path(digest), file_name)
+        future.add_done_callback(lambda done: self.store_attachment_text(key, file_name, digest, done))
+
+    def store_attachment_text(self, key, file_name, digest, done):
+        # Вызывается в потоке пула извлечения
+        if done.cancelled() or not done.result():
+            return
+        with self.attachment_lock:
+            record = self.get_files(key).get(file_name)
+            if record is None or record["digest"] != digest:
+                return
+            self.search_index.update(attachment_key(key, file_name), done.result(), digest)
+            self.attachment_names.setdefault(key, set()).add(file_name)
+
+    def remove_attachments(self, key, keep=()):
+        # Убирает из индекса вложения ключа, кроме имён из keep
+        with self.attachment_lock:
+            names = self.attachment_names.get(key, set())
+            for file_name in [name for name in names if name not in keep]:
+                self.search_index.remove(attachment_key(key, file_name))
+                names.discard(file_name)
+            if not names:
+                self.attachment_names.pop(key, None)
+
+    def attachment_text(self, key, file_name):
+        # Извлечённый текст вложения ('' — текста нет или он ещё не извлечён)
+        record = self.get_files(key).get(file_name)
+        if record is None:
+            return ''
+        return self.attachments.text(record["digest"]) or ''
+
+    def update_titles(self, op, args):
+        # Узлы сохраняют id при переносе: переиндексируется только имя самого
+        # перенесённого узла; удалённые вычищаются при поиске
+        titles = self.titles
+        if titles is None or op not in ("add_node", "move_node"):
+            return
+        key = args[-1]
+        node_id = self.data["tree"].node_id(key)
+        if node_id is not None:
+            titles.add(node_id, split(key)[1])
+
+    def sync_history(self):
+        # Последняя ревизия должна совпадать с текущей страницей. Хвост
+        # истории мог не попасть на диск при сбое (мутация базы завершается
+        # после fsync журнала, история пишется без fsync): недостающая версия
+        # записывается полной копией.
+        content = self.data["content"]
+        recorded = 0
+        for key in self.history.keys():
+            if key not in content:
+                self.history.drop(key)
+            elif self.history.last_crc(key) != content.crc32(key):
+                self.history.record(key, None, content[key], content.crc32(key))
+                recorded += 1
+        if recorded:
+            logging.info(f"Восстановлено последних ревизий: {recorded}.")
+
+    def update_history(self, op, args):
+        if op == "content_revision":
+            self.history.record(*args)
+        elif op == "delete_content":
+            self.history.drop(args[0])
+        elif op == "rename_key":
+            self.history.rename(*args)
+
+    def add_listener(self, listener):
+        # listener(op, args) вызывается после каждой мутации, в порядке фиксации.
+        # Удаление и перенос узлов дополнительно порождают события по каждой
+        # затронутой странице: ('delete_content', (ключ,)) и ('rename_key', (старый, новый)),
+        # а по ключам с вложениями — ('delete_files', (ключ,)) и ('move_files', (старый, новый)).
+        # Сохранение страницы порождает ('content_revision', (ключ, прежний HTML
+        # или None, новый HTML, crc32 нового HTML)) — одна контрольная сумма на
+        # сохранение для поискового индекса и истории.
+        self.listeners.append(listener)
+
+    def search(self, query, prefix=None):
+        # Все подходящие страницы по убыванию релевантности: [(ключ, оценка)].
+        # Вложения выдаёт только search_page
+        return [
+            (key, -negative_score) for negative_score, key in self.search_index.rank(query, prefix)
+            if ATTACHMENT_SEPARATOR not in key
+        ]
+
+    def suggest(self, query, limit=10):
+        # Подсказки для набираемого запроса: ключи узлов, в названии которых
+        # есть слова запроса, и запросы с дописанным последним словом (слова
+        # с опечатками заменены ближайшими из словаря страниц)
+        self.prepare_suggest()
+        done, partial = split_query(query)
+        corrected = [self.search_index.correct(word) or word for word in done]
+        if partial:
+            completions = [' '.join(corrected + [word]) for word in self.search_index.complete(partial, limit)]
+        else:
+            completions = [' '.join(corrected)] if corrected != done else []
+        return {'titles': self.titles.lookup(query, limit), 'completions': completions}
+
+    def prepare_suggest(self):
+        # Строит индексы подсказок (при первой подсказке или заранее, в фоне)
+        if self.titles is None:
+            with self.lock:
+                if self.titles is None:
+                    self.titles = TitleIndex(self.data["tree"])
+        self.search_index.prepare_complete()
+
+    def search_page(self, query, prefix=None, limit=20, cursor=None, snippets=3):
+        # Страница ранжированных результатов с подсвеченными фрагментами.
+        # Для совпадения во вложении file — имя файла, key — ключ его страницы
+        after = decode_cursor(cursor) if cursor else None
+        page, total = self.search_index.page(query, prefix, after, limit)
+        parts = parse_query(query)
+        results = []
+        for negative_score, doc_key in page:
+            key, file_name = split_attachment_key(doc_key)
+            text = self.load_text(key) if file_name is None else self.attachment_text(key, file_name)
+            results.append({
+                'key': key,
+                'file': file_name,
+                'score': round(-negative_score, 4),
+                'snippets': make_snippets(text, highlight_spans(text, parts), snippets)
+            })
+        # Курсор на следующую страницу; пустая следующая страница возможна,
+        # если последний результат совпал с концом выдачи
+        next_cursor = encode_cursor(page[-1]) if len(page) == limit else None
+        return {'results': results, 'total': total, 'next_cursor': next_cursor}
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Все мутации внутри блока фиксируются при выходе одной записью
+        # ('batch'): один fsync журнала или одна перезапись файла, после сбоя
+        # видны либо все, либо ни одной. При исключении ничего не применяется.
+        # Вложенная транзакция входит во внешнюю. Проверки в методах внутри
+        # транзакции видят мутации, отложенные в ней раньше (staged).
+        if getattr(self.local, 'ops', None) is not None:
+            yield
+            return
+        self.local.ops = []
+        self.local.draft = None
+        try:
+            yield
+            ops = self.local.ops
+        finally:
+            self.local.ops = None
+            self.local.draft = None
+        if ops:
+            self.commit("batch", ops)
+
+    def staged(self):
+        # Данные для проверок в методах: внутри транзакции — вместе с уже
+        # отложенными в ней мутациями (черновик строится при первой проверке
+        # после них), вне транзакции — сами данные базы
+        ops = getattr(self.local, 'ops', None)
+        if not ops:
+            return self.data
+        draft = self.local.draft
+        if draft is None:
+            with self.lock:
+                draft = self.local.draft = _Draft(self.data)
+        for op, args in ops[draft.applied:]:
+            draft.apply(op, args)
+        draft.applied = len(ops)
+        return draft.data
+
+    def commit(self, op, *args):
+        # Передаём мутацию потоку записи и ждём, пока она будет применена,
+        # сохранена и обработана слушателями. Ошибка применения поднимается здесь.
+        # Внутри транзакции мутация только откладывается до её конца.
+        ops = getattr(self.local, 'ops', None)
+        if ops is not None:
+            ops.append((op, args))
+            return
+        future = Future()
+        self.commits.put((op, args, future))
+        return future.result()
+
+    def _write_loop(self):
+        stopping = False
+        while not stopping:
+            item = self.commits.get()
+            if item is None:
+                break
+            # Забираем всё, что накопилось за время предыдущей пачки
+            batch = [item]
+            while len(batch) < COMMIT_BATCH:
+                try:
+                    item = self.commits.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        # В режиме 'journal' каждая мутация — короткая запись в журнале, fsync
+        # один на пачку; в режиме 'pickle' файл перезаписывается раз на пачку
+        applied = []
+        need_compact = False
+        error = None
+        with self.lock:
+            for op, args, future in batch:
+                try:
+                    events = self.apply(op, args)
+                except Exception as e:
+                    logging.error(f"Ошибка при применении '{op}': {e}")
+                    future.set_exception(e)
+                    continue
+                if self.journal is not None:
+                    self.journal.append((op, args))
+                applied.append((events, future))
+            if self.journal is not None:
+                need_compact = self.journal.size > COMPACT_THRESHOLD
+        for events, _ in applied:
+            for op, args in events:
+                for listener in self.listeners:
+                    try:
+                        listener(op, args)
+                    except Exception as e:
+                        logging.error(f"Ошибка слушателя для '{op}': {e}")
+        if applied:
+            try:
+                if self.journal is None:
+                    self.save_data()
+                else:
+                    # Групповой fsync: вызывающие получают ответ, когда
+                    # записи пачки на диске
+                    self.journal.sync()
+            except Exception as e:
+                # Мутации применены, но не записаны: вызывающие получают ошибку,
+                # следующая удачная запись сохранит и их
+                error = e
+        if need_compact and not self.compact_lock.locked():
+            threading.Thread(target=self.compact, name='journal-compact', daemon=True).start()
+        elif self.search_index.log_size() > INDEX_LOG_THRESHOLD and not self.compact_lock.locked():
+            # Журнал индекса растёт и без записей в журнал базы (тексты вложений)
+            threading.Thread(target=self.save_search_index, name='index-save', daemon=True).start()
+        if applied:
+            # Пачка и её ревизии видны в файлах — объявляем новое поколение
+            # репликам до ответа вызывающим: следующий запрос к любой реплике
+            # уже увидит изменения
+            self.generation.publish()
+        self.batches += 1
+        self.committed += len(applied)
+        for _, future in applied:
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def apply(self, op, args):
+        # Возвращает события для слушателей: саму мутацию и производные от неё
+        # изменения страниц. Транзакция отдаёт события своих мутаций по порядку.
+        derived = getattr(self, f"_apply_{op}")(*args) or []
+        return derived if op == "batch" else [(op, args)] + derived
+
+    def invalidate_text(self, *keys):
+        for key in keys:
+            self.text_cache.pop(key, None)
+
+    def touch(self, kind, *keys):
+        # Новая версия данных; вызывается после изменения, чтобы читатель,
+        # увидевший новую версию, увидел и новые данные
+        self.version_seq += 1
+        for key in keys:
+            self.versions[(kind, key)] = self.version_seq
+        if self.touched is not None:
+            self.touched.extend((kind, key) for key in keys)
+
+    def version(self, kind, key=''):
+        # Строка версии для ETag: меняется при каждом изменении данных ключа
+        return f"{self.epoch}.{self.versions.get((kind, key), 0)}"
+
+    # Повторное добавление и удаление несуществующего ничего не делают.
+    # Списки файлов не изменяются на месте: публикуется изменённая копия,
+    # и читатель без блокировок видит либо старое, либо новое состояние.
+
+    def _apply_batch(self, ops):
+        # Пачка применяется целиком или никак: при ошибке в одной из мутаций
+        # уже применённые откатываются, и ошибка поднимается дальше
+        tree = self.data["tree"]
+        pages = self.data["content"]
+        garbage = self.garbage
+        tree.begin()
+        pages.begin()
+        self.undo = []
+        self.touched = []
+        try:
+            events = []
+            for op, args in ops:
+                events.extend(self.apply(op, args))
+            return events
+        except Exception:
+            tree.rollback()
+            self.invalidate_text(*pages.rollback())
+            undo, touched = self.undo, self.touched
+            self.undo = self.touched = None
+            for key, files in reversed(undo):
+                self._set_files(key, files)
+            self.garbage = garbage
+            # Читатели могли увидеть отменённые изменения: их версии устаревают
+            for kind, key in touched:
+                self.touch(kind, key)
+            raise
+        finally:
+            tree.end()
+            pages.end()
+            self.undo = self.touched = None
+
+    def _set_files(self, key, files):
+        # Публикует список файлов ключа (None — удаляет); внутри пачки
+        # прежний запоминается для отката
+        current = self.data["files"]
+        if self.undo is not None:
+            self.undo.append((key, current.get(key)))
+        if files is None:
+            current.pop(key, None)
+        else:
+            current[key] = files
+
+    def _apply_add_node(self, key):
+        self.data["tree"].add(key)
+        self.touch("tree", '')
+
+    def _apply_delete_node(self, key):
+        # Удаляются узел с поддеревом, их страницы и вложения. Ключ без узла
+        # (например, страница вне дерева) удаляется сам по себе.
+        content = self.data["content"]
+        events = []
+        for removed_key in self.data["tree"].remove(key) or [key]:
+            if removed_key in content:
+                del content[removed_key]
+                events.append(("delete_content", (removed_key,)))
+            self.invalidate_text(removed_key)
+            if removed_key in self.data["files"]:
+                events.append(("delete_files", (removed_key,)))
+            self._apply_delete_files(removed_key)
+            self.touch("content", removed_key)
+        self.touch("tree", '')
+        return events
+
+    def _apply_move_node(self, key, new_key):
+        # Страницы и вложения поддерева переносятся под новые ключи без
+        # декодирования страниц и без копирования блобов
+        content = self.data["content"]
+        files = self.data["files"]
+        events = []
+        for old_key, moved_key in self.data["tree"].move(key, new_key):
+            if old_key in content:
+                content.rename(old_key, moved_key)
+                events.append(("rename_key", (old_key, moved_key)))
+            self.invalidate_text(old_key, moved_key)
+            if old_key in files:
+                self._set_files(moved_key, files[old_key])
+                self._set_files(old_key, None)
+                events.append(("move_files", (old_key, moved_key)))
+            self.touch("content", old_key, moved_key)
+            self.touch("files", old_key, moved_key)
+        self.touch("tree", '')
+        return events
+
+    # Операции прежнего формата журнала
+
+    def _apply_add_section(self, section_name):
+        self._apply_add_node(section_name)
+
+    def _apply_delete_section(self, section_name):
+        return self._apply_delete_node(section_name)
+
+    def _apply_add_category(self, section_name, category_name):
+        self._apply_add_node(join(section_name, category_name))
+
+    def _apply_delete_category(self, section_name, category_name):
+        return self._apply_delete_node(join(section_name, category_name))
+
+    def _apply_rename_section(self, section_name, new_name):
+        return self._apply_move_node(section_name, new_name)
+
+    def _apply_rename_category(self, section_name, category_name, new_name):
+        return self._apply_move_node(join(section_name, category_name), join(section_name, new_name))
+
+    def _apply_save_content(self, key, content):
+        # Прежняя версия нужна истории, чтобы записать только правку
+        html_fingerprint = fingerprint(content)
+        pages = self.data["content"]
+        previous = pages.get(key)
+        pages[key] = content
+        self.invalidate_text(key)
+        self.touch("content", key)
+        return [("content_revision", (key, previous, content, html_fingerprint))]
+
+    def _apply_delete_content(self, key):
+        self.data["content"].pop(key, None)
+        self.invalidate_text(key)
+        self.touch("content", key)
+
+    def _apply_add_file(self, key, file_name, record):
+        files = dict(self.data["files"].get(key, {}))
+        if file_name in files:
+            self.garbage = True
+        files[file_name] = record
+        self._set_files(key, files)
+        self.touch("files", key)
+
+    def _apply_delete_files(self, key):
+        removed = self.data["files"].get(key)
+        self._set_files(key, None)
+        if removed:
+            self.garbage = True
+            self.touch("files", key)
+
+    def _apply_update_file_order(self, key, files):
+        if set(self.data["files"].get(key, {})) - set(files):
+            self.garbage = True
+        self._set_files(key, files)
+        self.touch("files", key)
+
+    def add_node(self, key):
+        # Добавляет узел дерева по ключу 'Раздел/Категория/...'; родитель должен существовать
+        if self.staged()["tree"].can_add(key):
+            self.commit("add_node", key)
+            logging.info(f"Узел '{key}' добавлен.")
             return True
-        logging.warning(f"Раздел '{section_name}' уже существует.")
+        logging.warning(f"Узел '{key}' нельзя добавить.")
         return False
 
-    def delete_section(self, section_name):
-        if section_name in self.data["sections"]:
-            del self.data["sections"][section_name]
-            self.delete_content(section_name)
-            self.delete_files(section_name)
-            self.save_data()
-            logging.info(f"Раздел '{section_name}' удалён.")
+    def delete_node(self, key):
+        if key in self.staged()["tree"]:
+            self.commit("delete_node", key)
+            logging.info(f"Узел '{key}' удалён.")
             return True
-        logging.warning(f"Раздел '{section_name}' не существует.")
+        logging.warning(f"Узел '{key}' не существует.")
         return False
 
-    def add_category(self, section_name, category_name):
-        if section_name in self.data["sections"] and category_name not in self.data["sections"][section_name]:
-            self.data["sections"][section_name].append(category_name)
-            self.save_data()
-            logging.info(f"Категория '{category_name}' добавлена в раздел '{section_name}'.")
+    def move_node(self, key, new_key):
+        # Переименование и/или перенос узла вместе с поддеревом
+        if self.staged()["tree"].can_move(key, new_key):
+            self.commit("move_node", key, new_key)
+            logging.info(f"Узел '{key}' перенесён в '{new_key}'.")
             return True
-        logging.warning(f"Категория '{category_name}' уже существует в разделе '{section_name}'.")
+        logging.warning(f"Узел '{key}' нельзя перенести в '{new_key}'.")
         return False
 
+    def add_nodes(self, keys):
+        # Добавляет узлы вместе с недостающими предками одной транзакцией
+        # (массовый импорт); существующие узлы пропускаются. Возвращает число
+        # добавленных узлов.
+        tree = self.staged()["tree"]
+        added = []
+        seen = set()
+        for key in keys:
+            names = key.split(SEPARATOR)
+            if not all(names):
+                logging.warning(f"Некорректный ключ узла '{key}'.")
+                continue
+            for depth in range(1, len(names) + 1):
+                node_key = SEPARATOR.join(names[:depth])
+                if node_key not in seen and node_key not in tree:
+                    added.append(node_key)
+                seen.add(node_key)
+        with self.transaction():
+            for node_key in added:
+                self.commit("add_node", node_key)
+        return len(added)
+
+    def has_node(self, key):
+        return key in self.data["tree"]
+
+    def get_children(self, key=''):
+        return self.data["tree"].child_names(key)
+
+    def get_tree(self, key=''):
+        # Вложенное поддерево: [{"name", "key", "children": [...]}]
+        return self.data["tree"].tree(key)
+
+    def add_section(self, section_name):
+        return self.add_node(section_name)
+
+    def rename_section(self, section_name, new_name):
+        return self.move_node(section_name, new_name)
+
+    def delete_section(self, section_name):
+        return self.delete_node(section_name)
+
+    def add_category(self, section_name, category_name):
+        return self.add_node(join(section_name, category_name))
+
+    def rename_category(self, section_name, category_name, new_name):
+        return self.move_node(join(section_name, category_name), join(section_name, new_name))
+
     def delete_category(self, section_name, category_name):
-        if section_name in self.data["sections"]:
-            if category_name in self.data["sections"][section_name]:
-                self.data["sections"][section_name].remove(category_name)
-                self.delete_content(f"{section_name}/{category_name}")
-                self.delete_files(f"{section_name}/{category_name}")
-                self.save_data()
-                logging.info(f"Категория '{category_name}' удалена из раздела '{section_name}'.")
-                return True
-        logging.warning(f"Категория '{category_name}' не существует в разделе '{section_name}'.")
-        return False
+        return self.delete_node(join(section_name, category_name))
 
     def save_content(self, key, content):
-        self.data["content"][key] = content
-        self.save_data()
+        # Страница — строка HTML; другое значение не попадает ни в базу, ни в журнал
+        if not isinstance(content, str):
+            raise TypeError(f"Содержимое для '{key}' должно быть строкой, а не {type(content).__name__}")
+        if self.canonicalize:
+            content = canonicalize_html(content)
+        self.commit("save_content", key, content)
         logging.info(f"Содержимое для '{key}' сохранено.")
 
     def load_content(self, key):
         return self.data["content"].get(key, "")
 
-    def add_file(self, key, file_name, file_content):
-        if key not in self.data["files"]:
-            self.data["files"][key] = {}
-        self.data["files"][key][file_name] = file_content
-        self.save_data()
+    def iter_content(self, key, size=CONTENT_CHUNK):
+        # То же, что load_content, порциями текста: большие страницы
+        # показываются по мере чтения (pageloader)
+        try:
+            return self.data["content"].chunks(key, size)
+        except KeyError:
+            return iter(())
+
+    def get_revisions(self, key):
+        # Ревизии страницы по возрастанию: [{"rev", "time", "size"}]
+        return self.history.list(key)
+
+    def load_revision(self, key, rev):
+        # HTML ревизии или None, если такой нет
+        return self.history.load_revision(key, rev)
+
+    def diff_revisions(self, key, old_rev, new_rev=None):
+        # Построчная разница простого текста двух ревизий в формате unified
+        # diff; new_rev=None — текущее содержимое страницы
+        old = self.load_revision(key, old_rev)
+        new = self.load_content(key) if new_rev is None else self.load_revision(key, new_rev)
+        if old is None or new is None:
+            return None
+        return list(difflib.unified_diff(
+            html_to_text(old).splitlines(), html_to_text(new).splitlines(),
+            f"{key}@{old_rev}", f"{key}@{new_rev or 'текущая'}", lineterm=''
+        ))
+
+    def load_text(self, key):
+        # Простой текст страницы (как toPlainText()), кэшируется до следующего save_content
+        text = self.text_cache.get(key)
+        if text is None:
+            html = self.data["content"].get(key, "")
+            text = html_to_text(html)
+            # Не кэшируем, если страницу успели перезаписать во время разбора
+            if self.data["content"].get(key) is html:
+                self.text_cache[key] = text
+        return text
+
+    def add_file(self, key, file_name, source):
+        # source — путь к файлу, открытый бинарный поток или байты
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        order = len(self.staged()["files"].get(key, {}))
+        if isinstance(source, str):
+            with open(source, 'rb') as stream:
+                record = self.make_file_record(file_name, stream, order)
+        else:
+            record = self.make_file_record(file_name, source, order)
+        self.commit("add_file", key, file_name, record)
         logging.info(f"Файл '{file_name}' добавлен для ключа '{key}'.")
+        return record
+
+    def link_file(self, key, file_name, record, order=None):
+        # Привязывает уже сохранённый блоб к ключу без копирования данных.
+        # order — место в списке файлов (по умолчанию последнее)
+        if order is None:
+            order = len(self.staged()["files"].get(key, {}))
+        record = dict(record, name=file_name, order=order)
+        self.commit("add_file", key, file_name, record)
+        logging.info(f"Файл '{file_name}' привязан к ключу '{key}'.")
 
     def load_file(self, key, file_name):
-        return self.data["files"].get(key, {}).get(file_name)
+        # Возвращает открытый бинарный поток с содержимым вложения
+        record = self.data["files"].get(key, {}).get(file_name)
+        if record is None:
+            return None
+        return self.blobs.open(record["digest"])
+
+    def file_path(self, record):
+        return self.blobs.path(record["digest"])
 
     def delete_content(self, key):
-        if key in self.data["content"]:
-            del self.data["content"][key]
-            self.save_data()
+        if key in self.staged()["content"]:
+            self.commit("delete_content", key)
             logging.info(f"Содержимое с ключом '{key}' удалено.")
 
     def delete_files(self, key):
-        if key in self.data["files"]:
-            del self.data["files"][key]
-            self.save_data()
+        if key in self.staged()["files"]:
+            self.commit("delete_files", key)
             logging.info(f"Файлы, связанные с ключом '{key}', удалены.")
 
+    def export_view(self):
+        # Согласованный срез базы для экспорта: дерево, страницы и списки
+        # файлов на один момент. Тела страниц не копируются: они читаются из
+        # своего отображения снимка (content.release() по окончании).
+        with self.lock:
+            return {
+                "tree": NodeStore.load(self.data["tree"].dump()),
+                "content": self.data["content"].detach(self.db_file),
+                "files": {key: dict(files) for key, files in self.data["files"].items()}
+            }
+
     def get_sections(self):
-        return self.data["sections"]
+        # Два верхних уровня дерева в прежнем виде {раздел: [категории]}
+        return self.data["tree"].sections()
 
     def get_files(self, key):
         return self.data["files"].get(key, {})
 
     def update_file_order(self, key, files):
-        self.data["files"][key] = files
-        self.save_data()
+        # files — словарь записей или список имён в новом порядке
+        current = self.staged()["files"].get(key, {})
+        files = {name: dict(current[name], order=order) for order, name in enumerate(files) if name in current}
+        self.commit("update_file_order", key, files)
         logging.info(f"Обновлён порядок файлов для ключа '{key}'.")
+
+
+class _Draft:
+    # Черновик транзакции для проверок: данные базы на момент первой
+    # проверки и отложенные мутации поверх них, применённые теми же
+    # методами _apply_*, что и в базе. От страниц нужны только ключи.
+
+    def __init__(self, data):
+        self.data = {
+            "tree": data["tree"].copy(),
+            "content": _DraftPages(data["content"]),
+            "files": dict(data["files"])
+        }
+        self.garbage = False
+        self.undo = None
+        self.applied = 0
+
+    def __getattr__(self, name):
+        # apply, _apply_* и _set_files базы — над черновиком
+        return getattr(Database, name).__get__(self)
+
+    def touch(self, kind, *keys):
+        pass
+
+    def invalidate_text(self, *keys):
+        pass
+
+
+class _DraftPages(set):
+    # Ключи страниц черновика с интерфейсом PageStore, нужным _apply_*
+
+    def get(self, key, default=None):
+        return default
+
+    def __setitem__(self, key, value):
+        self.add(key)
+
+    def __delitem__(self, key):
+        self.remove(key)
+
+    def pop(self, key, default=None):
+        self.discard(key)
+        return default
+
+    def rename(self, old_key, new_key):
+        if old_key in self:
+            self.remove(old_key)
+            self.add(new_key)
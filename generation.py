@@ -0,0 +1,45 @@
+import mmap
+import os
+import struct
+import threading
+
+# Файл <db_file>.gen: номер поколения (растёт после каждой зафиксированной
+# пачки мутаций) и номер снимка (растёт при каждой замене файла данных).
+# База пишет его через отображение в память, реплики сравнивают с последним
+# увиденным значением — одно чтение общей памяти на запрос.
+_FIELD = struct.Struct('<Q')
+_GENERATION = 0
+_SNAPSHOTS = 8
+SIZE = 16
+
+
+class Generation:
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.lock = threading.Lock()
+        if writable:
+            with open(path, 'ab') as f:
+                if f.tell() < SIZE:
+                    f.truncate(SIZE)
+        with open(path, 'r+b' if writable else 'rb') as f:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self.buffer = mmap.mmap(f.fileno(), SIZE, access=access)
+
+    def read(self):
+        # (поколение, номер снимка); поколение читается первым, так что
+        # реплика не пропустит замену снимка, о которой уже объявлено
+        generation, = _FIELD.unpack_from(self.buffer, _GENERATION)
+        snapshots, = _FIELD.unpack_from(self.buffer, _SNAPSHOTS)
+        return generation, snapshots
+
+    def publish(self, snapshot=False):
+        # Вызывается, когда данные поколения уже видны в файлах базы
+        with self.lock:
+            generation, snapshots = self.read()
+            if snapshot:
+                _FIELD.pack_into(self.buffer, _SNAPSHOTS, snapshots + 1)
+            _FIELD.pack_into(self.buffer, _GENERATION, generation + 1)
+
+    def close(self):
+        if not self.buffer.closed:
+            self.buffer.close()
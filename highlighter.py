@@ -0,0 +1,192 @@
+import bisect
+import re
+from PyQt5.QtCore import QEvent, QObject, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QTextCharFormat, QTextCursor
+from PyQt5.QtWidgets import QTextEdit
+
+# Подсветка строится для видимой части документа и стольких же экранов
+# выше и ниже: при прокрутке на экран она уже готова
+MARGIN_SCREENS = 1
+# Больше стольких подсветок одновременно не создаётся (мелкий шрифт на
+# большом экране и очень частое слово)
+MAX_SELECTIONS = 2000
+# Перестройка подсветки после прокрутки откладывается на столько мс:
+# серия событий прокрутки даёт одну перестройку
+UPDATE_DELAY = 15
+
+
+class MatchHighlighter(QObject):
+    # Совпадения поискового запроса в редакторе. Запрос ищется целиком как
+    # подстрока, буквально и без учёта регистра, один раз на запрос. Выделения
+    # (ExtraSelection) создаются только для совпадений в видимой части с
+    # запасом и перестраиваются при прокрутке и изменении размера.
+    # matches_changed(номер текущего совпадения с 1 или 0, всего).
+    matches_changed = pyqtSignal(int, int)
+
+    def __init__(self, editor, parent=None):
+        super().__init__(parent)
+        self.editor = editor
+        self.spans = []
+        self.starts = []
+        self.current = -1
+        # Диапазон документа, для которого построены выделения
+        self.built = None
+        self.match_format = QTextCharFormat()
+        self.match_format.setBackground(QColor(Qt.yellow))
+        self.current_format = QTextCharFormat()
+        self.current_format.setBackground(QColor(255, 150, 50))
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(UPDATE_DELAY)
+        self.timer.timeout.connect(self.update_selections)
+        # Блок, найденный при прошлом поиске по высоте (block_at)
+        self.last_block = 0
+        editor.verticalScrollBar().valueChanged.connect(self.schedule_update)
+        editor.viewport().installEventFilter(self)
+
+    def highlight(self, query):
+        text = self.editor.document().toPlainText() if query.strip() else ''
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
+        self.spans = [match.span() for match in pattern.finditer(text)] if text else []
+        self.starts = [start for start, _ in self.spans]
+        self.current = -1
+        self.built = None
+        self.update_selections()
+        self.matches_changed.emit(0, len(self.spans))
+        return len(self.spans)
+
+    def clear(self):
+        if not self.spans and self.built is None:
+            return
+        self.spans = []
+        self.starts = []
+        self.current = -1
+        self.built = None
+        self.timer.stop()
+        self.editor.setExtraSelections([])
+        self.matches_changed.emit(0, 0)
+
+    def next(self):
+        self.step(1)
+
+    def previous(self):
+        self.step(-1)
+
+    def step(self, direction):
+        # Первый переход — к ближайшему совпадению от начала видимой части
+        if not self.spans:
+            return
+        if self.current < 0:
+            top = self.visible_range(0)[0]
+            index = bisect.bisect_left(self.starts, top)
+            self.current = index % len(self.spans) if direction > 0 else (index - 1) % len(self.spans)
+        else:
+            self.current = (self.current + direction) % len(self.spans)
+        start = self.spans[self.current][0]
+        # Курсор — в начало совпадения, без выделения: подсветка текущего
+        # совпадения видна и так, а набранный текст не заменит слово
+        cursor = QTextCursor(self.editor.document())
+        cursor.setPosition(start)
+        self.editor.setTextCursor(cursor)
+        self.editor.ensureCursorVisible()
+        self.built = None
+        self.update_selections()
+        self.matches_changed.emit(self.current + 1, len(self.spans))
+
+    def visible_range(self, margin):
+        # Позиции документа в начале и конце видимой части, расширенной на
+        # margin экранов вверх и вниз (целыми строками)
+        height = self.editor.viewport().height()
+        top = self.editor.verticalScrollBar().value() - height * margin
+        return self.position_at(top, False), self.position_at(top + height * (1 + 2 * margin), True)
+
+    def position_at(self, y, end):
+        # Начало (или конец при end) строки документа на высоте y. Позиция
+        # считается по геометрии блоков и строк, а не через cursorForPosition:
+        # большой документ Qt размечает в фоне, и пока разметка не готова,
+        # попадание в точку возвращает позицию далеко от неё
+        block = self.block_at(y)
+        layout = block.layout()
+        offset = y - self.editor.document().documentLayout().blockBoundingRect(block).top()
+        low, high = 0, layout.lineCount()
+        while low < high:
+            middle = (low + high) // 2
+            line = layout.lineAt(middle)
+            if line.y() + line.height() <= offset:
+                low = middle + 1
+            else:
+                high = middle
+        if low == layout.lineCount():
+            return block.position() + (block.length() - 1 if end else 0)
+        line = layout.lineAt(low)
+        return block.position() + line.textStart() + (line.textLength() if end else 0)
+
+    def block_at(self, y):
+        # Последний блок, начинающийся не ниже y. Поиск идёт от блока,
+        # найденного в прошлый раз, шагами с удвоением, затем двоичный:
+        # blockBoundingRect доразмечает документ до блока, и так разметка
+        # уходит не дальше удвоенного расстояния прокрутки
+        document = self.editor.document()
+        layout = document.documentLayout()
+        count = document.blockCount()
+
+        def top(number):
+            return layout.blockBoundingRect(document.findBlockByNumber(number)).top()
+
+        start = min(self.last_block, count - 1)
+        step = 1
+        if top(start) <= y:
+            low, high = start, min(start + 1, count)
+            while high < count and top(high) <= y:
+                low, step = high, step * 2
+                high = min(low + step, count)
+        else:
+            low, high = max(start - 1, 0), start
+            while low > 0 and top(low) > y:
+                high, step = low, step * 2
+                low = max(high - step, 0)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if top(middle) <= y:
+                low = middle
+            else:
+                high = middle
+        self.last_block = low
+        return document.findBlockByNumber(low)
+
+    def schedule_update(self):
+        if self.spans:
+            self.timer.start()
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Resize:
+            self.built = None
+            self.schedule_update()
+        return False
+
+    def update_selections(self):
+        if not self.spans:
+            self.editor.setExtraSelections([])
+            return
+        # Пока видимая часть внутри построенного диапазона, выделения не меняются
+        top, bottom = self.visible_range(0)
+        if self.built is not None and self.built[0] <= top and bottom <= self.built[1]:
+            return
+        start, end = self.visible_range(MARGIN_SCREENS)
+        first = bisect.bisect_left(self.starts, start)
+        last = min(bisect.bisect_right(self.starts, end), first + MAX_SELECTIONS)
+        indices = list(range(first, last))
+        if self.current >= 0 and not first <= self.current < last:
+            indices.append(self.current)
+        document = self.editor.document()
+        selections = []
+        for index in indices:
+            match_start, match_end = self.spans[index]
+            selection = QTextEdit.ExtraSelection()
+            selection.cursor = QTextCursor(document)
+            selection.cursor.setPosition(match_start)
+            selection.cursor.setPosition(match_end, QTextCursor.KeepAnchor)
+            selection.format = self.current_format if index == self.current else self.match_format
+            selections.append(selection)
+        self.editor.setExtraSelections(selections)
+        self.built = (start, end) if last - first < MAX_SELECTIONS else (start, self.spans[last - 1][1])
@@ -0,0 +1,230 @@
+import os
+import struct
+import threading
+import time
+import zlib
+import logging
+
+# Формат записи: заголовок | ключ в UTF-8 | тело.
+# Заголовок — crc32 ключа и тела, длины ключа и тела, вид записи, номер
+# ревизии, время, длина страницы в символах и crc32 страницы в UTF-8
+# (как у fingerprint в поисковом индексе).
+_HEADER = struct.Struct('<IIIBIdII')
+# Тело правки: начало и конец заменённого участка прежней версии, затем
+# вставленный текст в UTF-8
+_DELTA = struct.Struct('<II')
+
+FULL = 0      # тело — вся страница, сжатая zlib
+DELTA = 1     # тело — правка относительно предыдущей ревизии
+RENAME = 2    # тело — новый ключ; история переезжает вместе со страницей
+DROP = 3      # страница удалена, её история больше не нужна
+
+# Полная копия пишется, когда цепочка правок от последней полной копии
+# стала длиннее MAX_CHAIN или суммарно больше самой страницы: так чтение
+# любой ревизии ограничено, а запись в среднем пропорциональна правке
+MAX_CHAIN = 64
+# Порция при поиске общего начала и конца двух версий
+_CHUNK = 4096
+
+
+class RevisionStore:
+    # История страниц в файле только для дозаписи (<db_file>.history).
+    # Ревизия — либо полная копия, либо правка: один заменённый участок
+    # предыдущей версии. В памяти — только оглавление: ключ -> список
+    # (номер, время, длина, crc32, вид, смещение тела, длина тела).
+    # Дописывает только поток записи базы; чтение — из любого потока.
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        # readonly — реплика: только читает файл, который дописывает база
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.revisions = {}
+        # ключ -> (число правок и их суммарный размер после последней полной копии)
+        self.chains = {}
+        self.file = None
+        # Конец последней прочитанной целой записи
+        self.end = 0
+
+    def load(self):
+        # Читает оглавление; повреждённый хвост (оборванная запись) отрезается.
+        # Реплика хвост не трогает: его может как раз дописывать база.
+        if os.path.exists(self.path):
+            with open(self.path, 'rb' if self.readonly else 'rb+') as f:
+                self._scan(f)
+                if not self.readonly and self.end != f.seek(0, os.SEEK_END):
+                    logging.warning(f"История '{self.path}' обрезана до {self.end} байт (повреждённый хвост).")
+                    f.truncate(self.end)
+        if not self.readonly:
+            self.file = open(self.path, 'a+b')
+        elif os.path.exists(self.path):
+            self.file = open(self.path, 'rb')
+        count = sum(len(revisions) for revisions in self.revisions.values())
+        logging.info(f"История: страниц {len(self.revisions)}, ревизий {count}.")
+
+    def refresh(self):
+        # Реплика: дочитывает записи, добавленные базой после прошлого чтения
+        with self.lock:
+            if self.file is None:
+                if not os.path.exists(self.path):
+                    return
+                self.file = open(self.path, 'rb')
+            self._scan(self.file)
+
+    def _scan(self, f):
+        f.seek(self.end)
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+            crc, key_length, body_length, kind, rev, saved, size, page_crc = _HEADER.unpack(header)
+            key_bytes = f.read(key_length)
+            body = f.read(body_length)
+            if len(body) < body_length or zlib.crc32(body, zlib.crc32(key_bytes)) != crc:
+                break
+            self._index(key_bytes.decode('utf-8'), kind, rev, saved, size, page_crc, self.end, key_length, body)
+            self.end = f.tell()
+
+    def _index(self, key, kind, rev, saved, size, page_crc, offset, key_length, body):
+        if kind == RENAME:
+            new_key = body.decode('utf-8')
+            if key in self.revisions:
+                self.revisions[new_key] = self.revisions.pop(key)
+                self.chains[new_key] = self.chains.pop(key)
+            return
+        if kind == DROP:
+            self.revisions.pop(key, None)
+            self.chains.pop(key, None)
+            return
+        body_offset = offset + _HEADER.size + key_length
+        self.revisions.setdefault(key, []).append((rev, saved, size, page_crc, kind, body_offset, len(body)))
+        if kind == FULL:
+            self.chains[key] = (0, 0)
+        else:
+            length, total = self.chains.get(key, (0, 0))
+            self.chains[key] = (length + 1, total + len(body))
+
+    def _append(self, key, kind, body, rev=0, size=0, page_crc=0):
+        key_bytes = key.encode('utf-8')
+        saved = time.time()
+        crc = zlib.crc32(body, zlib.crc32(key_bytes))
+        header = _HEADER.pack(crc, len(key_bytes), len(body), kind, rev, saved, size, page_crc)
+        with self.lock:
+            offset = self.file.seek(0, os.SEEK_END)
+            self.file.write(header + key_bytes + body)
+            # Сбрасываем в ОС, чтобы читатели видели запись; fsync не нужен:
+            # потерянный после сбоя хвост восстанавливает Database.sync_history
+            self.file.flush()
+            self._index(key, kind, rev, saved, size, page_crc, offset, len(key_bytes), body)
+            self.end = offset + len(header) + len(key_bytes) + len(body)
+
+    def record(self, key, previous, content, content_crc):
+        # Новая ревизия content; previous — версия, которую она заменила,
+        # content_crc — crc32 content в UTF-8 (его уже посчитала база).
+        # Первой ревизией страницы без истории становится previous.
+        revisions = self.revisions.get(key)
+        if not revisions and previous:
+            self._append_full(key, 1, previous)
+            revisions = self.revisions[key]
+        rev = revisions[-1][0] + 1 if revisions else 1
+        if not revisions:
+            self._append_full(key, rev, content)
+            return
+        if previous is None:
+            previous = self.load_revision(key)
+        start, end, inserted = splice(previous, content)
+        if start == end and not inserted:
+            return
+        body = _DELTA.pack(start, end) + inserted.encode('utf-8')
+        length, total = self.chains.get(key, (0, 0))
+        if length >= MAX_CHAIN or total + len(body) > len(content):
+            self._append_full(key, rev, content)
+        else:
+            self._append(key, DELTA, body, rev, len(content), content_crc)
+
+    def _append_full(self, key, rev, content):
+        body = content.encode('utf-8')
+        self._append(key, FULL, zlib.compress(body), rev, len(content), zlib.crc32(body))
+
+    def rename(self, old_key, new_key):
+        if old_key in self.revisions:
+            self._append(old_key, RENAME, new_key.encode('utf-8'))
+
+    def drop(self, key):
+        if key in self.revisions:
+            self._append(key, DROP, b'')
+
+    def keys(self):
+        with self.lock:
+            return list(self.revisions)
+
+    def last_crc(self, key):
+        revisions = self.revisions.get(key)
+        return revisions[-1][3] if revisions else None
+
+    def list(self, key):
+        # [{"rev", "time", "size"}] по возрастанию номера
+        with self.lock:
+            revisions = list(self.revisions.get(key, ()))
+        return [{"rev": rev, "time": saved, "size": size} for rev, saved, size, *_ in revisions]
+
+    def load_revision(self, key, rev=None):
+        # HTML ревизии rev (по умолчанию последней) или None: ближайшая
+        # полная копия не позже rev и правки после неё до rev
+        with self.lock:
+            revisions = self.revisions.get(key)
+            if not revisions:
+                return None
+            # Номера ревизий страницы идут подряд
+            position = len(revisions) - 1 if rev is None else rev - revisions[0][0]
+            if not 0 <= position < len(revisions):
+                return None
+            base = position
+            while revisions[base][4] != FULL:
+                base -= 1
+            bodies = []
+            for entry in revisions[base:position + 1]:
+                self.file.seek(entry[5])
+                bodies.append(self.file.read(entry[6]))
+        content = zlib.decompress(bodies[0]).decode('utf-8')
+        for body in bodies[1:]:
+            start, end = _DELTA.unpack_from(body)
+            content = content[:start] + body[_DELTA.size:].decode('utf-8') + content[end:]
+        return content
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def splice(old, new):
+    # (начало, конец, вставка): new == old[:начало] + вставка + old[конец:].
+    # Общие начало и конец ищутся сравнением порций (memcmp), поэтому
+    # интерпретатор делает O(log) шагов на порцию, а не шаг на символ.
+    limit = min(len(old), len(new))
+    prefix = _common_length(old, new, limit, False)
+    suffix = _common_length(old, new, limit - prefix, True)
+    return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+
+def _common_length(a, b, limit, from_end):
+    def part(s, i, j):
+        return s[len(s) - j:len(s) - i] if from_end else s[i:j]
+
+    i = 0
+    while i < limit:
+        j = min(i + _CHUNK, limit)
+        if part(a, i, j) != part(b, i, j):
+            # Несовпадение внутри порции: двоичный поиск его позиции
+            low, high = i, j
+            while high - low > 1:
+                middle = (low + high) // 2
+                if part(a, low, middle) == part(b, low, middle):
+                    low = middle
+                else:
+                    high = middle
+            return low
+        i = j
+    return limit
@@ -0,0 +1,109 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    # brotli — необязательная зависимость; без неё ответы сжимаются только gzip
+    brotli = None
+
+# Ответы меньше этого размера не сжимаются: выигрыш меньше заголовков
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ENCODINGS = ('br', 'gzip')
+
+
+class ResponseCache:
+    # LRU сериализованных JSON-ответов. Запись помнит версию данных, из
+    # которых построена (Database.version); при несовпадении с текущей она
+    # считается устаревшей, так что сброс происходит ровно при изменении
+    # ключа. Сжатые варианты строятся при первом запросе с нужной кодировкой.
+    # max_entries=0 отключает кэш (ETag и 304 при этом работают).
+
+    def __init__(self, max_entries=4096, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, version):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry["version"] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+            self.hits += 1
+            return entry
+
+    def put(self, name, version, body):
+        entry = {"name": name, "version": version, "body": body, "encoded": {}}
+        if not self.max_entries:
+            return entry
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None:
+                self.size -= entry_size(old)
+            self.entries[name] = entry
+            self.size += len(body)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= entry_size(evicted)
+        return entry
+
+    def encode(self, entry, encoding):
+        # Сжатый вариант тела; кэшируется в самой записи
+        body = entry["encoded"].get(encoding)
+        if body is None:
+            if encoding == 'br':
+                body = brotli.compress(entry["body"], quality=BROTLI_QUALITY)
+            else:
+                body = gzip.compress(entry["body"], GZIP_LEVEL, mtime=0)
+            with self.lock:
+                if entry["encoded"].setdefault(encoding, body) is body and self.entries.get(entry["name"]) is entry:
+                    self.size += len(body)
+        return body
+
+
+def entry_size(entry):
+    return len(entry["body"]) + sum(len(body) for body in entry["encoded"].values())
+
+
+def negotiate(request, size):
+    # Кодировка ответа по Accept-Encoding: br, если есть brotli, иначе gzip
+    if size < MIN_COMPRESS_SIZE:
+        return None
+    offered = ENCODINGS if brotli is not None else ENCODINGS[1:]
+    return request.accept_encodings.best_match(offered)
+
+
+def cached_json(cache, request, name, version, build):
+    # JSON-ответ с сильным ETag по версии данных, 304 на If-None-Match и
+    # кэшем сериализованного тела. name — имя варианта ответа (эндпоинт и
+    # параметры), version — строка версии его данных, build() — данные для
+    # сериализации, вызывается только при промахе кэша.
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    # У каждого кодирования свой сильный ETag (RFC 9110, 8.8.3). Если клиент
+    # уже видел эту версию в любом кодировании, 304 отдаётся без кэша и данных.
+    for etag in (version, *(f"{version}-{encoding}" for encoding in ENCODINGS)):
+        if request.if_none_match.contains(etag):
+            headers['ETag'] = f'"{etag}"'
+            return Response(status=304, headers=headers)
+    entry = cache.get(name, version)
+    if entry is None:
+        body = json.dumps(build(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        entry = cache.put(name, version, body)
+    encoding = negotiate(request, len(entry["body"]))
+    headers['ETag'] = f'"{version}-{encoding}"' if encoding else f'"{version}"'
+    body = entry["body"]
+    if encoding:
+        body = cache.encode(entry, encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(body, status=200, headers=headers, mimetype='application/json')
@@ -0,0 +1,123 @@
+import glob
+import os
+import pickle
+import struct
+import threading
+import zlib
+import logging
+
+# Формат записи: длина (4 байта) + crc32 (4 байта) + pickle-представление записи
+_HEADER = struct.Struct('<II')
+
+
+class Journal:
+    # Журнал упреждающей записи (WAL): мутации дописываются в конец текущего
+    # сегмента, fsync — один на группу записей (пачку потока записи базы,
+    # sync()). Сегменты называются <db_file>.wal.<seq>, номер растёт при
+    # каждой ротации.
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.file = None
+        self.seq = 0
+        self.size = 0
+
+    def segment_path(self, seq):
+        return f"{self.db_file}.wal.{seq:08d}"
+
+    def segments(self):
+        # Возвращает список (seq, путь) существующих сегментов по возрастанию
+        result = []
+        for path in glob.glob(glob.escape(self.db_file) + '.wal.*'):
+            suffix = path.rsplit('.', 1)[-1]
+            if suffix.isdigit():
+                result.append((int(suffix), path))
+        return sorted(result)
+
+    def replay(self, after_seq=0):
+        # Читает записи всех сегментов с номером больше after_seq.
+        # Повреждённый хвост (оборванная запись после сбоя) отрезается.
+        for seq, path in self.segments():
+            self.seq = max(self.seq, seq)
+            if seq <= after_seq:
+                continue
+            with open(path, 'rb+') as f:
+                good = 0
+                for record, good in read_records(f):
+                    yield record
+                if good != os.path.getsize(path):
+                    logging.warning(f"Журнал '{path}' обрезан до {good} байт (повреждённый хвост).")
+                    f.truncate(good)
+
+    def open(self, after_seq=0):
+        # Открывает последний сегмент на дозапись.
+        # Сегменты, уже вошедшие в снимок (seq <= after_seq), не дописываются.
+        self.drop_until(after_seq)
+        self.seq = max(self.seq, after_seq + 1)
+        self.file = open(self.segment_path(self.seq), 'ab')
+        self.size = self.file.tell()
+
+    def append(self, record):
+        # Запись на диске только после sync()
+        data = pack_record(record)
+        with self.lock:
+            self.file.write(data)
+            self.size += len(data)
+
+    def sync(self):
+        # Сбрасывает буфер и выполняет fsync для всех уже добавленных записей
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def rotate(self):
+        # Закрывает текущий сегмент и начинает новый. Возвращает номер
+        # последнего закрытого сегмента: всё до него войдёт в снимок.
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            old_seq = self.seq
+            self.seq += 1
+            self.file = open(self.segment_path(self.seq), 'ab')
+            self.size = 0
+        return old_seq
+
+    def drop_until(self, seq):
+        # Удаляет сегменты, которые уже свёрнуты в снимок
+        for segment_seq, path in self.segments():
+            if segment_seq <= seq:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.error(f"Не удалось удалить сегмент журнала '{path}': {e}")
+
+    def close(self):
+        if self.file is None:
+            return
+        self.sync()
+        with self.lock:
+            self.file.close()
+            self.file = None
+
+
+def pack_record(record):
+    payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(f):
+    # Читает записи с текущей позиции файла и выдаёт (запись, смещение её
+    # конца). Останавливается на первой неполной или повреждённой записи.
+    while True:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        length, crc = _HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield pickle.loads(payload), f.tell()
@@ -1,19 +1,28 @@
 from PyQt5.QtWidgets import QAbstractItemView
 from PyQt5.QtWidgets import (
-    QMainWindow, QTreeWidget, QTreeWidgetItem, QTextBrowser, QVBoxLayout, 
+    QApplication, QMainWindow, QTreeView, QTextBrowser, QVBoxLayout, 
     QHBoxLayout, QSplitter, QWidget, QAction, QInputDialog, QMessageBox, 
     QToolBar, QLabel, QProgressBar, QLineEdit, QFileDialog, QListWidget, 
-    QListWidgetItem, QGroupBox, QPushButton, QDialog, QMenu, QTextEdit, QFontDialog, QColorDialog
+    QListWidgetItem, QGroupBox, QPushButton, QDialog, QMenu, QTextEdit, QFontDialog, QColorDialog, QCompleter
 )
-from PyQt5.QtCore import Qt, QRegularExpression, QSize, QThread, pyqtSignal
-from PyQt5.QtGui import QIcon, QFont, QColor, QPixmap, QTextCursor, QTextCharFormat
+from PyQt5.QtCore import Qt, QSize, QStringListModel, QTimer, pyqtSignal
+from PyQt5.QtGui import QIcon, QFont, QPixmap
 from PyQt5.QtPrintSupport import QPrinter
 from database import Database
-from utils import get_mime_type, read_file, write_file
+from highlighter import MatchHighlighter
+from pageloader import PROGRESSIVE_THRESHOLD, PageLoader
+from nodestore import SEPARATOR, in_subtree, join, split
+from treemodel import SectionTreeModel
+from autosave import AutosaveScheduler
+from logsetup import DEFAULT_SETTINGS, configure_logging
+from searchexec import SearchExecutor
+from thumbnails import ThumbnailLoader
 import json
 import os
 import sys
-import shutil
+import time
+import tempfile
+import threading
 import mimetypes
 import logging
 import subprocess
@@ -21,63 +30,47 @@ from PyQt5.QtCore import QUrl
 from PyQt5.QtGui import QDesktopServices
 
 
-# Настройка логирования
-logging.basicConfig(
-    filename='app.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
-
-class SearchThread(QThread):
-    progress_updated = pyqtSignal(int)
-    search_completed = pyqtSignal(list)
-
-    def __init__(self, db, search_text):
-        super().__init__()
-        self.db = db
-        self.search_text = search_text
-
-    def run(self):
-        results = []
-        total = len(self.db.data["content"])
-        for i, (key, content) in enumerate(self.db.data["content"].items()):
-            # Преобразуем HTML в простой текст
-            doc = QTextBrowser()
-            doc.setHtml(content)
-            plain_text = doc.toPlainText()
-            if self.search_text.lower() in plain_text.lower():
-                # Находим индекс вхождения поискового запроса
-                index = plain_text.lower().find(self.search_text.lower())
-                # Извлекаем контекст вокруг найденного слова
-                start = max(0, index - 50)
-                end = min(len(plain_text), index + 50)
-                context = plain_text[start:end]
-                results.append((key, context))
-            progress = int((i + 1) / total * 100) if total > 0 else 100
-            self.progress_updated.emit(progress)
-        self.search_completed.emit(results)
-
 class SearchResultsDialog(QDialog):
-    def __init__(self, results, parent=None):
+    # Результаты приходят порциями (add_results) по мере поиска; при новом
+    # запросе в открытом окне список очищается (start)
+    def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Результаты поиска")
         size = self.parent().config.get("search_window_size", [600, 400])
         self.resize(*size)
-        self.results = results
         self.parent = parent  # Сохраняем ссылку на родителя
         layout = QVBoxLayout()
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
         self.list_widget = QListWidget()
+        self.list_widget.setUniformItemSizes(True)
         layout.addWidget(self.list_widget)  # Добавляем список в макет один раз
-        for key, context in results:
-            item = QListWidgetItem(f"{key}: {context}")
-            item.setData(Qt.UserRole, key)
-            self.list_widget.addItem(item)  # Добавляем элемент в список
         self.list_widget.itemDoubleClicked.connect(self.go_to_result)
         self.setLayout(layout)
 
+    def start(self, query):
+        self.list_widget.clear()
+        self.status_label.setText(f"Поиск «{query}»...")
+
+    def add_results(self, results):
+        self.list_widget.setUpdatesEnabled(False)
+        for key, file_name, context in results:
+            # Совпадение во вложении показывается с именем файла
+            title = f"{key} › {file_name}" if file_name else key
+            item = QListWidgetItem(f"{title}: {context}")
+            item.setData(Qt.UserRole, key)
+            item.setData(Qt.UserRole + 1, file_name)
+            self.list_widget.addItem(item)  # Добавляем элемент в список
+        self.list_widget.setUpdatesEnabled(True)
+
+    def finish(self, total):
+        self.status_label.setText(f"Найдено страниц и вложений: {total}" if total else "Ничего не найдено.")
+
     def closeEvent(self, event):
         if self.parent:
+            # Закрытое окно результатов больше не ждёт
+            self.parent.search_executor.cancel()
+            self.parent.progress_bar.hide()
             self.parent.config["search_window_size"] = [self.width(), self.height()]
             with open('config.json', 'w', encoding='utf-8') as f:
                 json.dump(self.parent.config, f, ensure_ascii=False, indent=4)
@@ -86,13 +79,100 @@ class SearchResultsDialog(QDialog):
     def go_to_result(self, item):
         key = item.data(Qt.UserRole)
         self.parent.navigate_to_key(key)  # Используем self.parent
+        if item.data(Qt.UserRole + 1):
+            self.parent.select_file(item.data(Qt.UserRole + 1))
         self.close()
 
+class RevisionHistoryDialog(QDialog):
+    # Ревизии текущей страницы: просмотр, сравнение с текущей версией и
+    # (для администратора) восстановление выбранной ревизии
+    def __init__(self, db, key, can_restore, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"История изменений: {key}")
+        self.resize(800, 500)
+        self.db = db
+        self.key = key
+        self.parent = parent
+        layout = QVBoxLayout()
+        splitter = QSplitter(Qt.Horizontal)
+        self.list_widget = QListWidget()
+        for revision in reversed(db.get_revisions(key)):
+            saved = time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(revision["time"]))
+            item = QListWidgetItem(f"№{revision['rev']}  {saved}  ({revision['size']} симв.)")
+            item.setData(Qt.UserRole, revision["rev"])
+            self.list_widget.addItem(item)
+        self.list_widget.currentItemChanged.connect(self.show_revision)
+        self.preview = QTextBrowser()
+        splitter.addWidget(self.list_widget)
+        splitter.addWidget(self.preview)
+        splitter.setSizes([250, 550])
+        layout.addWidget(splitter)
+        buttons = QHBoxLayout()
+        self.diff_button = QPushButton("Сравнить с текущей")
+        self.diff_button.clicked.connect(self.show_diff)
+        self.restore_button = QPushButton("Восстановить")
+        self.restore_button.clicked.connect(self.restore)
+        self.restore_button.setVisible(can_restore)
+        buttons.addWidget(self.diff_button)
+        buttons.addWidget(self.restore_button)
+        buttons.addStretch()
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        if self.list_widget.count():
+            self.list_widget.setCurrentRow(0)
+        else:
+            self.preview.setPlainText("У страницы пока нет сохранённых ревизий.")
+            self.diff_button.setDisabled(True)
+            self.restore_button.setDisabled(True)
+
+    def selected_rev(self):
+        item = self.list_widget.currentItem()
+        return item.data(Qt.UserRole) if item else None
+
+    def show_revision(self, item, previous=None):
+        if item:
+            self.preview.setHtml(self.db.load_revision(self.key, item.data(Qt.UserRole)) or "")
+
+    def show_diff(self):
+        rev = self.selected_rev()
+        if rev is not None:
+            diff = self.db.diff_revisions(self.key, rev)
+            self.preview.setPlainText('\n'.join(diff) if diff else "Ревизия совпадает с текущей версией.")
+
+    def restore(self):
+        rev = self.selected_rev()
+        if rev is not None:
+            self.parent.restore_revision(self.key, rev)
+            self.accept()
+
 class KnowledgeBaseApp(QMainWindow):
+    # Порции результатов и прогресс поиска из потока SearchExecutor
+    search_results = pyqtSignal(int, list)
+    search_progress = pyqtSignal(int, int, int)
+    search_done = pyqtSignal(int, int)
+    suggestions_ready = pyqtSignal(int, dict)
+
     def __init__(self, mode='user'):
         super(KnowledgeBaseApp, self).__init__()
         self.config = self.load_config()
-        self.db = Database(self.config["db_file"])
+        configure_logging(self.config["log_file"], self.config, force=True)
+        self.db = Database(
+            self.config["db_file"], self.config["storage_mode"],
+            compression=self.config["page_compression"], canonicalize=self.config["canonicalize_html"]
+        )
+        self.autosave = AutosaveScheduler(self.db)
+        self.search_executor = SearchExecutor(self.db)
+        self.search_id = 0
+        self.search_started = 0
+        self.search_first_result = None
+        self.search_results_dialog = None
+        # Запрос для подсветки на странице, которая ещё загружается
+        self.pending_highlight = None
+        self.current_key = "Главная"
+        self.thumbnails = ThumbnailLoader(self.config["thumbnails_folder"], self.config["thumbnail_memory_cache"], self)
+        self.thumbnails.thumbnail_ready.connect(self.on_thumbnail_ready)
+        # digest -> элементы списка изображений, ждущие миниатюру
+        self.thumbnail_items = {}
         self.mode = mode
         self.init_ui()
 
@@ -104,9 +184,17 @@ class KnowledgeBaseApp(QMainWindow):
             "window_size": [1024, 768],
             "splitter_sizes": [200, 600, 200],
             "db_file": "data.db",
+            "storage_mode": "journal",
+            "page_compression": "zlib",
+            "canonicalize_html": False,
+            "autosave_interval": 1000,
             "files_folder": "files",
             "icons_folder": "icons",
+            "thumbnails_folder": "thumbnails",
+            "thumbnail_memory_cache": 512,
+            "progressive_page_threshold": PROGRESSIVE_THRESHOLD,
             "log_file": "app.log",
+            **DEFAULT_SETTINGS,
             "search_window_size": [600, 400]
         }
         config_file = 'config.json'
@@ -132,6 +220,13 @@ class KnowledgeBaseApp(QMainWindow):
         self.config["window_geometry"] = self.saveGeometry().data().hex()
         with open('config.json', 'w', encoding='utf-8') as f:
             json.dump(self.config, f, ensure_ascii=False, indent=4)
+        # Дописываем отложенные правки до закрытия базы
+        self.flush_autosave()
+        self.autosave.close()
+        self.page_loader.close()
+        self.search_executor.close()
+        self.thumbnails.close()
+        self.db.close()
         event.accept()
 
     def init_ui(self):
@@ -160,6 +255,11 @@ class KnowledgeBaseApp(QMainWindow):
         save_pdf_action.triggered.connect(self.save_as_pdf)
         file_menu.addAction(save_pdf_action)
 
+        history_action = QAction('История изменений', self)
+        history_action.setShortcut('Ctrl+Shift+H')
+        history_action.triggered.connect(self.show_history)
+        file_menu.addAction(history_action)
+
         login_admin_action = QAction('Войти как администратор', self)
         login_admin_action.triggered.connect(self.login_as_admin)
         file_menu.addAction(login_admin_action)
@@ -172,6 +272,23 @@ class KnowledgeBaseApp(QMainWindow):
         self.login_admin_action = login_admin_action
         self.logout_admin_action = logout_admin_action
 
+        search_menu = menubar.addMenu('Поиск')
+
+        find_action = QAction('Найти на странице', self)
+        find_action.setShortcut('Ctrl+F')
+        find_action.triggered.connect(self.find_on_page)
+        search_menu.addAction(find_action)
+
+        next_match_action = QAction('Следующее совпадение', self)
+        next_match_action.setShortcut('F3')
+        next_match_action.triggered.connect(lambda: self.highlighter.next())
+        search_menu.addAction(next_match_action)
+
+        previous_match_action = QAction('Предыдущее совпадение', self)
+        previous_match_action.setShortcut('Shift+F3')
+        previous_match_action.triggered.connect(lambda: self.highlighter.previous())
+        search_menu.addAction(previous_match_action)
+
     def setup_layout(self):
         # Основной макет и панели
         main_layout = QHBoxLayout()
@@ -182,9 +299,11 @@ class KnowledgeBaseApp(QMainWindow):
         self.splitter = QSplitter(Qt.Horizontal)
         main_layout.addWidget(self.splitter)
 
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabel("Разделы и Категории")
-        self.tree.itemClicked.connect(self.on_item_clicked)
+        # Модель сама следит за изменениями дерева в базе
+        self.tree = QTreeView()
+        self.tree_model = SectionTreeModel(self.db, self)
+        self.tree.setModel(self.tree_model)
+        self.tree.clicked.connect(self.on_item_clicked)
 
         central_widget = QWidget()
         central_layout = QVBoxLayout()
@@ -197,10 +316,44 @@ class KnowledgeBaseApp(QMainWindow):
         self.text_editor.anchorClicked.connect(self.open_link)
         self.text_editor.textChanged.connect(self.on_text_changed)
 
+        # Автосохранение после паузы в наборе
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(self.config["autosave_interval"])
+        self.autosave_timer.timeout.connect(self.flush_autosave)
+        QApplication.instance().focusChanged.connect(self.on_focus_changed)
+
         self.text_toolbar = QToolBar("Форматирование текста")
         self.add_text_formatting_actions(self.text_toolbar)
 
+        # Загрузка страниц в редактор: большие — по частям
+        self.page_loader = PageLoader(self.db, self.text_editor, self.config["progressive_page_threshold"], self)
+        self.page_loader.page_loaded.connect(self.on_page_loaded)
+
+        # Совпадения поискового запроса на странице: счётчик и переходы
+        self.highlighter = MatchHighlighter(self.text_editor, self)
+        self.highlighter.matches_changed.connect(self.update_match_label)
+        self.match_bar = QWidget()
+        match_layout = QHBoxLayout()
+        match_layout.setContentsMargins(0, 0, 0, 0)
+        self.match_bar.setLayout(match_layout)
+        self.match_label = QLabel()
+        match_layout.addWidget(self.match_label)
+        match_layout.addStretch()
+        previous_match_button = QPushButton("▲ Предыдущее")
+        previous_match_button.clicked.connect(self.highlighter.previous)
+        match_layout.addWidget(previous_match_button)
+        next_match_button = QPushButton("▼ Следующее")
+        next_match_button.clicked.connect(self.highlighter.next)
+        match_layout.addWidget(next_match_button)
+        close_match_button = QPushButton("✕")
+        close_match_button.setToolTip("Снять подсветку")
+        close_match_button.clicked.connect(self.clear_highlight)
+        match_layout.addWidget(close_match_button)
+        self.match_bar.hide()
+
         central_layout.addWidget(self.text_toolbar)
+        central_layout.addWidget(self.match_bar)
         central_layout.addWidget(self.text_editor)
 
         self.init_files_panel()
@@ -213,6 +366,32 @@ class KnowledgeBaseApp(QMainWindow):
         self.search_bar = QLineEdit()
         self.search_bar.setPlaceholderText("Поиск...")
         self.search_bar.returnPressed.connect(self.perform_search)
+        self.search_bar.textChanged.connect(self.on_search_text_changed)
+        # Пока открыто окно результатов, поиск перезапускается после паузы в наборе
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.perform_search)
+        # Подсказки при наборе: дополненные запросы и узлы с подходящими
+        # названиями. Database.suggest берёт блокировки базы и индекса,
+        # поэтому считается в потоке SearchExecutor после короткой паузы в наборе
+        self.suggest_timer = QTimer(self)
+        self.suggest_timer.setSingleShot(True)
+        self.suggest_timer.setInterval(100)
+        self.suggest_timer.timeout.connect(self.request_suggestions)
+        self.suggest_id = None
+        self.suggest_model = QStringListModel(self)
+        self.suggest_keys = set()
+        self.completer = QCompleter(self.suggest_model, self)
+        self.completer.setWidget(self.search_bar)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.activated[str].connect(self.on_suggestion_activated)
+        # Индексы подсказок строятся в фоне, чтобы первая подсказка не ждала
+        threading.Thread(target=self.db.prepare_suggest, name='suggest-prepare', daemon=True).start()
+        self.search_results.connect(self.on_search_results)
+        self.search_progress.connect(self.update_progress)
+        self.search_done.connect(self.display_search_results)
+        self.suggestions_ready.connect(self.update_suggestions)
         search_toolbar = self.addToolBar("Поиск")
         search_toolbar.addWidget(QLabel("Поиск: "))
         search_toolbar.addWidget(self.search_bar)
@@ -221,6 +400,9 @@ class KnowledgeBaseApp(QMainWindow):
         self.statusBar().addPermanentWidget(self.progress_bar)
         self.progress_bar.hide()
 
+        self.autosave_label = QLabel()
+        self.statusBar().addPermanentWidget(self.autosave_label)
+
         if "window_geometry" in self.config:
             self.restoreGeometry(bytes.fromhex(self.config["window_geometry"]))
 
@@ -230,40 +412,49 @@ class KnowledgeBaseApp(QMainWindow):
         file_path, _ = QFileDialog.getSaveFileName(self, "Сохранить как PDF", "", "PDF Files (*.pdf)")
         if file_path:
             printer.setOutputFileName(file_path)
+            # Догружаемая страница печатается целиком
+            self.page_loader.wait()
             self.text_editor.document().print_(printer)
             QMessageBox.information(self, "Сохранение в PDF", "Файл успешно сохранён.")
 
     def load_main_page(self):
         self.tree.clearSelection()
-        key = "Главная"
-        content = self.db.load_content(key)
-        self.text_editor.setText(content)
-        self.load_files(key)
-        self.text_editor.setReadOnly(self.mode != 'admin')
+        self.open_page("Главная")
 
     def load_sections(self):
-        self.tree.clear()
-        sections = self.db.get_sections()
-        for section_name, categories in sections.items():
-            section_item = QTreeWidgetItem([section_name])
-            self.tree.addTopLevelItem(section_item)
-            for category_name in categories:
-                category_item = QTreeWidgetItem([category_name])
-                section_item.addChild(category_item)
-        self.tree.expandAll()
-
-    def on_item_clicked(self, item, column):
-        key = self.get_item_key(item)
-        content = self.db.load_content(key)
-        self.text_editor.setText(content)
+        # Полная перестройка нужна только при запуске; дальше модель
+        # обновляется построчно по уведомлениям базы
+        self.tree_model.reload()
+        self.tree.expandToDepth(0)
+
+    def on_item_clicked(self, index):
+        self.open_page(self.get_item_key(index))
+
+    def open_page(self, key):
+        # Большая страница показывается первым экраном и догружается в фоне
+        # (PageLoader); править её можно, когда она загружена целиком
+        started = time.perf_counter()
+        self.flush_autosave()
+        self.clear_highlight()
+        self.pending_highlight = None
+        self.current_key = key
+        self.page_loader.load(key, started=started)
         self.load_files(key)
+
+    def on_page_loaded(self, key):
         self.text_editor.setReadOnly(self.mode != 'admin')
+        if self.pending_highlight:
+            self.highlight_search_term(self.pending_highlight)
 
     def login_as_admin(self):
         text, ok = QInputDialog.getText(self, "Пароль администратора", "Введите пароль:", QLineEdit.Password)
         if ok and text == "123":
             self.mode = 'admin'
             self.enable_editing()
+            # Первый экран догружаемой страницы не правится: редактор
+            # откроется для правки, когда страница загрузится целиком
+            if self.page_loader.loading:
+                self.text_editor.setReadOnly(True)
             QMessageBox.information(self, "Режим администратора", "Вы вошли в режим администратора.")
             self.login_admin_action.setVisible(False)
             self.logout_admin_action.setVisible(True)
@@ -398,30 +589,25 @@ class KnowledgeBaseApp(QMainWindow):
 
     def load_file(self):
         # Загрузка файлов в систему
-        current_item = self.tree.currentItem()
-        key = self.get_item_key(current_item) if current_item else "Главная"
+        current_index = self.tree.currentIndex()
+        key = self.get_item_key(current_index) if current_index.isValid() else "Главная"
 
         files, _ = QFileDialog.getOpenFileNames(self, "Выбрать файлы")
         if files:
             for file_path in files:
                 file_name = os.path.basename(file_path)
-                dest_folder = os.path.join(self.config.get("files_folder", "files"), *key.split('/'))
-                os.makedirs(dest_folder, exist_ok=True)
-                dest_path = os.path.join(dest_folder, file_name)
+                existing = self.db.get_files(key)
 
-                if os.path.exists(dest_path):
+                if file_name in existing:
                     base, ext = os.path.splitext(file_name)
                     counter = 1
-                    while os.path.exists(dest_path):
+                    while file_name in existing:
                         file_name = f"{base}_{counter}{ext}"
-                        dest_path = os.path.join(dest_folder, file_name)
                         counter += 1
 
                 try:
-                    shutil.copy(file_path, dest_path)
-                    # Чтение содержимого файла
-                    file_content = read_file(dest_path)
-                    self.db.add_file(key, file_name, file_content)
+                    # Файл потоково копируется в хранилище блобов
+                    self.db.add_file(key, file_name, file_path)
                 except Exception as e:
                     logging.error(f"Ошибка при копировании файла: {e}")
                     QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить файл '{file_name}': {e}")
@@ -431,21 +617,30 @@ class KnowledgeBaseApp(QMainWindow):
         # Загрузка и отображение файлов в списках
         self.image_list.clear()
         self.other_file_list.clear()
+        # Миниатюры прежней категории больше не нужны
+        self.thumbnails.cancel_pending()
+        self.thumbnail_items = {}
         files = self.db.get_files(key)
 
-        for file_name, file_content in files.items():
-            file_path = os.path.join(self.config.get("files_folder", "files"), *key.split('/'), file_name)
+        for file_name, record in sorted(files.items(), key=lambda entry: entry[1]["order"]):
+            file_path = self.db.file_path(record)
             if not os.path.exists(file_path):
                 logging.warning(f"Файл '{file_name}' не найден.")
                 continue
-            mime_type = get_mime_type(file_path)
+            mime_type = record["mime"]
             item = QListWidgetItem(file_name)
             item.setData(Qt.UserRole, file_path)
+            item.setData(Qt.UserRole + 1, record["digest"])
             if mime_type and mime_type.startswith('image'):
-                pixmap = QPixmap(file_path)
-                if not pixmap.isNull():
-                    icon = QIcon(pixmap.scaled(100, 100, Qt.KeepAspectRatio))
-                    item.setIcon(icon)
+                # Миниатюра берётся из памяти или декодируется в пуле потоков;
+                # до её готовности показывается заглушка
+                pixmap = self.thumbnails.get(record["digest"])
+                if pixmap is not None:
+                    item.setIcon(QIcon(pixmap))
+                else:
+                    item.setIcon(self.thumbnail_placeholder())
+                    self.thumbnail_items.setdefault(record["digest"], []).append(item)
+                    self.thumbnails.request(record["digest"], file_path)
                 self.image_list.addItem(item)
             else:
                 icon = QIcon.fromTheme('text-x-generic')
@@ -454,11 +649,26 @@ class KnowledgeBaseApp(QMainWindow):
                 item.setIcon(icon)
                 self.other_file_list.addItem(item)
 
+    def thumbnail_placeholder(self):
+        icon = QIcon.fromTheme('image-x-generic')
+        if icon.isNull():
+            icon = QIcon(os.path.join(self.config["icons_folder"], 'document.png'))
+        return icon
+
+    def on_thumbnail_ready(self, digest, pixmap):
+        for item in self.thumbnail_items.pop(digest, []):
+            item.setIcon(QIcon(pixmap))
+
     def open_file(self, item):
         # Открытие файла в системе
         file_path = item.data(Qt.UserRole)
         if os.path.exists(file_path):
             try:
+                # Внешней программе нужен файл с исходным именем и расширением
+                file_path = self.db.blobs.materialize(
+                    item.data(Qt.UserRole + 1), item.text(),
+                    os.path.join(tempfile.gettempdir(), 'knowledge_base')
+                )
                 if sys.platform.startswith('darwin'):
                     subprocess.call(('open', file_path))
                 elif os.name == 'nt':
@@ -472,117 +682,199 @@ class KnowledgeBaseApp(QMainWindow):
             QMessageBox.warning(self, "Ошибка", f"Файл '{file_path}' не найден.")
 
     def perform_search(self):
-        # Поиск по тексту
+        # Поиск по тексту в потоке SearchExecutor; предыдущий запрос отменяется
+        self.search_timer.stop()
         search_text = self.search_bar.text()
-        if search_text:
-            self.progress_bar.show()
-            self.progress_bar.setValue(0)
-            self.search_thread = SearchThread(self.db, search_text)
-            self.search_thread.progress_updated.connect(self.update_progress)
-            self.search_thread.search_completed.connect(self.display_search_results)
-            self.search_thread.start()
-
-    def update_progress(self, value):
-        self.progress_bar.setValue(value)
-
-    def display_search_results(self, results):
-        # Показ результатов поиска
+        if not search_text:
+            return
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        if self.search_results_dialog is None or not self.search_results_dialog.isVisible():
+            self.search_results_dialog = SearchResultsDialog(parent=self)
+        self.search_results_dialog.start(search_text)
+        self.search_results_dialog.show()
+        self.search_started = time.perf_counter()
+        self.search_first_result = None
+        self.search_id = self.search_executor.submit(
+            search_text, self.search_results.emit, self.search_progress.emit, self.search_done.emit
+        )
+
+    def on_search_text_changed(self, text):
+        # Устаревший запрос отменяется сразу, как только меняется строка поиска
+        self.search_executor.cancel()
         self.progress_bar.hide()
-        if results:
-            self.search_results_dialog = SearchResultsDialog(results, parent=self)
-            self.search_results_dialog.show()
+        if text and self.search_results_dialog is not None and self.search_results_dialog.isVisible():
+            self.search_timer.start()
+        # Подсказки для прежнего текста больше не показываются
+        self.suggest_id = None
+        if text.strip():
+            self.suggest_timer.start()
         else:
-            QMessageBox.information(self, "Результаты поиска", "Ничего не найдено.")
-
-    def on_text_changed(self):
-        # Сохранение изменений текста
-        current_item = self.tree.currentItem()
-        key = self.get_item_key(current_item) if current_item else "Главная"
-        content = self.text_editor.toHtml()
+            self.suggest_timer.stop()
+            self.show_suggestions({'titles': [], 'completions': []})
+
+    def request_suggestions(self):
+        self.suggest_id = self.search_executor.suggest(self.search_bar.text(), self.suggestions_ready.emit)
+
+    def update_suggestions(self, suggest_id, suggestions):
+        if suggest_id == self.suggest_id:
+            self.show_suggestions(suggestions)
+
+    def show_suggestions(self, suggestions):
+        text = self.search_bar.text()
+        self.suggest_keys = set(suggestions['titles'])
+        items = [item for item in suggestions['completions'] if item != text] + suggestions['titles']
+        self.suggest_model.setStringList(items)
+        if items and self.search_bar.hasFocus():
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
+    def on_suggestion_activated(self, text):
+        # Узел открывается сразу, по дополненному запросу запускается поиск
+        if text in self.suggest_keys:
+            self.navigate_to_key(text)
+            return
+        self.search_bar.setText(text)
+        self.suggest_timer.stop()
+        self.suggest_id = None
+        self.completer.popup().hide()
+        self.perform_search()
+
+    def on_search_results(self, search_id, results):
+        # Порции отменённого запроса, уже стоявшие в очереди событий, пропускаются
+        if search_id != self.search_id or self.search_results_dialog is None:
+            return
+        if self.search_first_result is None:
+            self.search_first_result = time.perf_counter() - self.search_started
+        self.search_results_dialog.add_results(results)
+
+    def update_progress(self, search_id, delivered, total):
+        if search_id == self.search_id:
+            self.progress_bar.setValue(int(delivered / total * 100) if total else 100)
+
+    def display_search_results(self, search_id, total):
+        # Поиск завершён
+        if search_id != self.search_id:
+            return
+        self.progress_bar.hide()
+        if self.search_results_dialog is not None:
+            self.search_results_dialog.finish(total)
+        if self.search_first_result is not None:
+            self.statusBar().showMessage(
+                f"Первые результаты через {self.search_first_result * 1000:.0f} мс, "
+                f"всё — через {(time.perf_counter() - self.search_started) * 1000:.0f} мс"
+            )
+
+    def show_history(self):
+        # Последняя правка должна попасть в историю до открытия диалога
+        self.flush_autosave()
+        self.autosave.wait()
+        dialog = RevisionHistoryDialog(self.db, self.current_key, self.mode == 'admin', self)
+        dialog.exec_()
+
+    def restore_revision(self, key, rev):
+        # Восстановление — новая ревизия с содержимым старой, история не теряется
+        content = self.db.load_revision(key, rev)
+        if content is None:
+            return
         self.db.save_content(key, content)
+        if key == self.current_key:
+            self.set_editor_content(key, content)
+        self.statusBar().showMessage(f"Восстановлена ревизия №{rev}")
+
+    def set_editor_content(self, key, content):
+        # Загрузка страницы в редактор не считается правкой; подсветка
+        # прежней страницы снимается, незаконченная загрузка бросается
+        self.clear_highlight()
+        self.page_loader.show(key, content)
+        self.current_key = key
+        self.text_editor.setReadOnly(self.mode != 'admin')
 
-    def get_item_key(self, item):
+    def on_text_changed(self):
+        # Помечаем страницу изменённой; сохранение — после паузы в наборе.
+        # Позиции совпадений после правки устарели
+        self.clear_highlight()
+        self.autosave.mark_dirty(self.current_key)
+        self.autosave_timer.start()
+
+    def on_focus_changed(self, old, new):
+        if old is self.text_editor:
+            self.flush_autosave()
+
+    def flush_autosave(self):
+        # Снимаем HTML только один раз на серию правок и отдаём его на запись
+        self.autosave_timer.stop()
+        if self.autosave.is_dirty(self.current_key):
+            self.autosave.submit(self.current_key, self.text_editor.toHtml())
+        self.autosave_label.setText(f"Объединено сохранений: {self.autosave.coalesced}")
+
+    def get_item_key(self, index):
         # Получение ключа элемента в дереве
-        keys = []
-        while item:
-            keys.append(item.text(0))
-            item = item.parent()
-        return '/'.join(reversed(keys))
+        return self.tree_model.key(index)
 
     def highlight_search_term(self, term):
-        # Подсветка поискового термина в тексте
-        self.text_editor.moveCursor(QTextCursor.Start)
-        self.text_editor.setExtraSelections([])
-
-        highlight_format = QTextCharFormat()
-        highlight_format.setBackground(QColor(Qt.yellow))
-
-        regex = QRegularExpression(term)
-        regex.setPatternOptions(QRegularExpression.CaseInsensitiveOption)
-
-        document = self.text_editor.document()
-        plain_text = document.toPlainText()
-
-        matches = regex.globalMatch(plain_text)
-        extra_selections = []
-        while matches.hasNext():
-            match = matches.next()
-            start = match.capturedStart()
-            end = match.capturedEnd()
-            cursor = self.text_editor.textCursor()
-            cursor.setPosition(start)
-            cursor.setPosition(end, QTextCursor.KeepAnchor)
-            selection = QTextBrowser.ExtraSelection()
-            selection.cursor = cursor
-            selection.format = highlight_format
-            extra_selections.append(selection)
-
-        self.text_editor.setExtraSelections(extra_selections)
+        # Подсветка запроса на странице (в видимой части) и переход к
+        # первому совпадению; на догружаемой странице — после загрузки
+        self.pending_highlight = term if self.page_loader.loading else None
+        if self.pending_highlight:
+            return
+        if not term.strip():
+            self.clear_highlight()
+            return
+        self.match_bar.show()
+        if self.highlighter.highlight(term):
+            self.highlighter.next()
+
+    def find_on_page(self):
+        # Подсветка на открытой странице по строке поиска
+        if self.search_bar.text().strip():
+            self.highlight_search_term(self.search_bar.text())
+        else:
+            self.search_bar.setFocus()
+
+    def clear_highlight(self):
+        self.highlighter.clear()
+        self.match_bar.hide()
+
+    def update_match_label(self, current, total):
+        if not total:
+            self.match_label.setText("Совпадений на странице нет")
+        elif current:
+            self.match_label.setText(f"Совпадение {current} из {total}")
+        else:
+            self.match_label.setText(f"Совпадений на странице: {total}")
 
     def navigate_to_key(self, key):
         # Навигация к элементу по ключу
-        item = self.find_tree_item_by_key(key)
-        if item:
-            self.tree.setCurrentItem(item)
-            self.on_item_clicked(item, 0)
+        index = self.find_tree_index_by_key(key)
+        if index is not None and index.isValid():
+            self.tree.setCurrentIndex(index)
+            self.tree.scrollTo(index)
+            self.on_item_clicked(index)
             self.highlight_search_term(self.search_bar.text())
 
-    def find_tree_item_by_key(self, key):
-        # Поиск элемента в дереве по ключу
-        keys = key.split('/')
-        root_items = self.tree.findItems(keys[0], Qt.MatchExactly)
-        if root_items:
-            item = root_items[0]
-            for k in keys[1:]:
-                found = False
-                for i in range(item.childCount()):
-                    child = item.child(i)
-                    if child.text(0) == k:
-                        item = child
-                        found = True
-                        break
-                if not found:
-                    return None
-            return item
-        return None
+    def select_file(self, file_name):
+        # Выделяет вложение открытой страницы в списке файлов
+        for file_list in (self.other_file_list, self.image_list):
+            items = file_list.findItems(file_name, Qt.MatchExactly)
+            if items:
+                file_list.setCurrentItem(items[0])
+                file_list.scrollToItem(items[0])
+                return
+
+    def find_tree_index_by_key(self, key):
+        # Индекс элемента дерева по ключу (O(1) для уже загруженных узлов)
+        return self.tree_model.index_for_key(key)
 
     def delete_files(self, key):
-        # Удаление файлов, связанных с ключом
-        files = self.db.get_files(key)
-        dest_folder = os.path.join(self.config.get("files_folder", "files"), *key.split('/'))
-        for file_name in files:
-            file_path = os.path.join(dest_folder, file_name)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logging.info(f"Файл '{file_path}' удалён при удалении '{key}'.")
-                except Exception as e:
-                    logging.error(f"Ошибка при удалении файла '{file_path}': {e}")
+        # Удаление файлов, связанных с ключом; неиспользуемые блобы
+        # удаляются базой при сохранении
         self.db.delete_files(key)
 
     def open_context_menu(self, position):
-        selected_item = self.tree.itemAt(position)
-        if selected_item:
+        selected_item = self.tree.indexAt(position)
+        if selected_item.isValid():
             menu = QMenu()
             add_section_action = menu.addAction("Добавить раздел")
             add_category_action = menu.addAction("Добавить категорию")
@@ -600,106 +892,65 @@ class KnowledgeBaseApp(QMainWindow):
 
     def add_section(self):
         text, ok = QInputDialog.getText(self, "Добавить раздел", "Название раздела:")
-        if ok and text:
-            if self.db.add_section(text):
-                self.load_sections()
+        if ok and text and self.check_node_name(text):
+            self.db.add_section(text)
 
     def add_category(self, parent_item):
-        if parent_item:
-            section_name = parent_item.text(0)
+        # Категория добавляется внутрь выбранного элемента любой глубины
+        if parent_item.isValid():
+            parent_key = self.get_item_key(parent_item)
             text, ok = QInputDialog.getText(self, "Добавить категорию", "Название категории:")
-            if ok and text:
-                if self.db.add_category(section_name, text):
-                    self.load_sections()
+            if ok and text and self.check_node_name(text):
+                if self.db.add_node(join(parent_key, text)):
+                    self.tree.expand(parent_item)
+
+    def check_node_name(self, name):
+        if SEPARATOR in name:
+            QMessageBox.warning(self, "Ошибка", f"Имя не может содержать '{SEPARATOR}'.")
+            return False
+        return True
 
     def rename_item(self, item):
-        old_name = item.text(0)
+        # Переносимое содержимое должно быть уже записано
+        self.flush_autosave()
+        self.autosave.wait()
+        old_name = self.tree_model.name(item)
         text, ok = QInputDialog.getText(self, "Переименовать элемент", "Новое имя:", text=old_name)
-        if ok and text and text != old_name:
-            parent = item.parent()
-            if parent:
-                # Переименование категории
-                section_name = parent.text(0)
-                category_name = old_name
-                new_category_name = text
-
-                # Проверка, существует ли новая категория
-                if new_category_name in self.db.data["sections"][section_name]:
-                    QMessageBox.warning(self, "Ошибка", f"Категория '{new_category_name}' уже существует в разделе '{section_name}'.")
-                    return
-
-                # Добавляем новую категорию
-                if self.db.add_category(section_name, new_category_name):
-                    # Перенос содержимого
-                    old_key = f"{section_name}/{category_name}"
-                    new_key = f"{section_name}/{new_category_name}"
-                    content = self.db.load_content(old_key)
-                    self.db.save_content(new_key, content)
-                    self.db.delete_content(old_key)
-
-                    # Перенос файлов
-                    files = self.db.get_files(old_key)
-                    for file_name, file_content in files.items():
-                        self.db.add_file(new_key, file_name, file_content)
-                    self.db.delete_files(old_key)
-
-                    # Удаление старой категории
-                    self.db.delete_category(section_name, category_name)
-                    self.load_sections()
+        if ok and text and text != old_name and self.check_node_name(text):
+            key = self.get_item_key(item)
+            new_key = join(split(key)[0], text)
 
-            else:
-                # Переименование раздела
-                section_name = old_name
-                new_section_name = text
-
-                # Проверка, существует ли новый раздел
-                if new_section_name in self.db.data["sections"]:
-                    QMessageBox.warning(self, "Ошибка", f"Раздел '{new_section_name}' уже существует.")
-                    return
-
-                # Добавляем новый раздел
-                if self.db.add_section(new_section_name):
-                    # Перенос категорий
-                    old_categories = self.db.data["sections"].get(section_name, [])
-                    for category in old_categories:
-                        self.db.add_category(new_section_name, category)
-
-                    # Перенос содержимого раздела
-                    old_key = section_name
-                    new_key = new_section_name
-                    content = self.db.load_content(old_key)
-                    self.db.save_content(new_key, content)
-                    self.db.delete_content(old_key)
-
-                    # Перенос файлов раздела
-                    files = self.db.get_files(old_key)
-                    for file_name, file_content in files.items():
-                        self.db.add_file(new_key, file_name, file_content)
-                    self.db.delete_files(old_key)
-
-                    # Удаление старого раздела
-                    self.db.delete_section(section_name)
-                    self.load_sections()
+            # Проверка, существует ли элемент с новым именем
+            if self.db.has_node(new_key):
+                QMessageBox.warning(self, "Ошибка", f"Элемент '{text}' уже существует.")
+                return
+
+            # Поддерево, содержимое и файлы переносятся одной мутацией
+            if self.db.move_node(key, new_key):
+                self.rekey_current(key, new_key)
+
+    def rekey_current(self, old_prefix, new_prefix):
+        # Открытая страница переехала вместе с переименованным элементом
+        if in_subtree(self.current_key, old_prefix):
+            self.current_key = new_prefix + self.current_key[len(old_prefix):]
 
     def delete_item(self, item):
         reply = QMessageBox.question(
             self, 'Удалить элемент',
-            f"Вы уверены, что хотите удалить '{item.text(0)}'?",
+            f"Вы уверены, что хотите удалить '{self.tree_model.name(item)}'?",
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No
         )
         if reply == QMessageBox.Yes:
-            parent = item.parent()
-            if parent:
-                # Удаление категории
-                section_name = parent.text(0)
-                category_name = item.text(0)
-                if self.db.delete_category(section_name, category_name):
-                    self.load_sections()
-            else:
-                # Удаление раздела
-                section_name = item.text(0)
-                if self.db.delete_section(section_name):
-                    self.load_sections()
+            self.flush_autosave()
+            self.autosave.wait()
+            # Элемент удаляется вместе с вложенными категориями
+            key = self.get_item_key(item)
+            if self.db.delete_node(key) and in_subtree(self.current_key, key):
+                # Открытая страница удалена: правка или автосохранение
+                # создали бы её заново, поэтому редактор переходит на главную
+                self.autosave_timer.stop()
+                self.current_key = None
+                self.load_main_page()
 
     def select_font(self):
         font, ok = QFontDialog.getFont()
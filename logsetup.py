@@ -0,0 +1,236 @@
+import atexit
+import collections.abc
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# Логирование через очередь. Вызывающий поток только создаёт облегчённую
+# запись и кладёт её в очередь: форматирование, запись в файл и ротация —
+# в фоновом потоке LogWriter, который сбрасывает файл на диск один раз на
+# порцию накопившихся записей. Настройки читаются из config.json:
+#   log_level          — DEBUG, INFO, WARNING, ERROR (по умолчанию INFO);
+#   log_format         — 'text' (как раньше) или 'json' (объект на строку);
+#   log_max_bytes      — ротация по размеру файла (0 — без неё);
+#   log_rotate_hours   — ротация по времени (0 — без неё);
+#   log_backup_count   — сколько прежних файлов хранить (<файл>.1, .2, ...).
+# Несколько процессов с одним файлом (реплики asgi_server.py) дописывают
+# его независимо; ротацию при этом выполняет каждый процесс сам, поэтому
+# для них лучше отдельные файлы или только ротация по времени.
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DEFAULT_SETTINGS = {
+    "log_level": "INFO",
+    "log_format": "text",
+    "log_max_bytes": 10 * 1024 * 1024,
+    "log_rotate_hours": 24,
+    "log_backup_count": 5,
+}
+# Поля записи, которые заполняются в потоке записи, а не в вызывающем
+LAZY_FIELDS = frozenset((
+    'levelname', 'filename', 'module', 'msecs', 'relativeCreated', 'exc_text',
+    'threadName', 'processName', 'process', 'taskName'
+))
+# Стандартные поля LogRecord; остальное (extra=...) попадает в JSON как есть
+STANDARD_FIELDS = LAZY_FIELDS | {
+    'name', 'msg', 'args', 'levelno', 'pathname', 'lineno', 'funcName', 'stack_info',
+    'exc_info', 'created', 'thread', 'message', 'asctime'
+}
+START = time.time()
+
+_writer = None
+
+
+class QueuedLogRecord(logging.LogRecord):
+    # Запись, которую создаёт вызывающий поток: только то, что нельзя
+    # вычислить позже (время, поток, сообщение и аргументы). Остальные поля
+    # LogRecord вычисляются при первом обращении — обычно в потоке записи.
+
+    def __init__(self, name, level, pathname, lineno, msg, args, exc_info, func=None, sinfo=None, **kwargs):
+        self.name = name
+        self.levelno = level
+        self.pathname = pathname
+        self.lineno = lineno
+        self.msg = msg
+        if args and len(args) == 1 and isinstance(args[0], collections.abc.Mapping) and args[0]:
+            args = args[0]
+        self.args = args
+        self.exc_info = exc_info
+        self.funcName = func
+        self.stack_info = sinfo
+        self.created = time.time()
+        self.thread = threading.get_ident()
+
+    def __getattr__(self, name):
+        if name not in LAZY_FIELDS:
+            raise AttributeError(name)
+        self.complete()
+        return self.__dict__[name]
+
+    def complete(self):
+        self.levelname = logging.getLevelName(self.levelno)
+        self.filename = os.path.basename(self.pathname)
+        self.module = os.path.splitext(self.filename)[0]
+        self.msecs = int(self.created * 1000) % 1000
+        self.relativeCreated = (self.created - START) * 1000
+        self.exc_text = None
+        self.threadName = None
+        self.processName = None
+        self.process = os.getpid()
+        self.taskName = None
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    # Обработчик вызывающей стороны: без блокировки и без подготовки записи
+    # (SimpleQueue потокобезопасна, запись форматирует поток LogWriter)
+
+    def handle(self, record):
+        if self.filters and not self.filter(record):
+            return False
+        self.queue.put(record)
+        return True
+
+
+class RotatingLogFile(logging.handlers.RotatingFileHandler):
+    # Файл журнала с ротацией и по размеру, и по времени. Пишет в него
+    # только поток LogWriter; emit не сбрасывает буфер — это делает flush
+    # после порции записей. Размер считается сам, без seek на каждую запись.
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, interval=0):
+        super().__init__(filename, 'a', max_bytes, backup_count, encoding='utf-8')
+        self.interval = interval
+        self.size = os.path.getsize(filename)
+        self.rollover_at = time.time() + interval if interval else None
+
+    def shouldRollover(self, record):
+        if self.maxBytes and self.size >= self.maxBytes:
+            return True
+        return self.rollover_at is not None and record.created >= self.rollover_at
+
+    def doRollover(self):
+        super().doRollover()
+        self.size = 0
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            line = self.format(record) + self.terminator
+            self.stream.write(line)
+            self.size += len(line.encode('utf-8'))
+        except Exception:
+            self.handleError(record)
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна запись — один JSON-объект в строке; поля из extra=... добавляются
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.thread,
+        }
+        for name, value in record.__dict__.items():
+            if name not in STANDARD_FIELDS:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogWriter:
+    # Фоновый поток: забирает записи из очереди порциями, пишет их
+    # обработчиком и сбрасывает файл, когда очередь опустела
+    def __init__(self, handler):
+        self.handler = handler
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            while record is not None:
+                self.handler.handle(record)
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.handler.flush()
+            if record is None:
+                return
+
+    def close(self):
+        # Дописывает всё, что уже в очереди, и закрывает файл
+        self.queue.put(None)
+        self.thread.join()
+        self.handler.close()
+
+
+def load_settings(config_file='config.json'):
+    # Настройки логирования из config.json; отсутствующие — по умолчанию
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return settings
+    settings.update((key, config[key]) for key in DEFAULT_SETTINGS if key in config)
+    return settings
+
+
+def configure_logging(log_file, settings=None, force=False):
+    # Заменяет basicConfig: если логирование уже настроено (и не force),
+    # ничего не делает. С force прежний поток записи дописывает очередь
+    # и закрывается, корневой логгер переключается на новый файл.
+    global _writer
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    level = logging.getLevelName(str(settings["log_level"]).upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    handler = RotatingLogFile(
+        log_file, int(settings["log_max_bytes"]), int(settings["log_backup_count"]),
+        int(float(settings["log_rotate_hours"]) * 3600)
+    )
+    if settings["log_format"] == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    # Поиск строки вызова и имён потока и процесса — самая дорогая часть
+    # создания записи, а в журнал они не выводятся
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.setLogRecordFactory(QueuedLogRecord)
+    writer = LogWriter(handler)
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(QueueLogHandler(writer.queue))
+    root.setLevel(level)
+    if _writer is None:
+        atexit.register(shutdown_logging)
+    else:
+        _writer.close()
+    _writer = writer
+
+
+def shutdown_logging():
+    # Вызывается при выходе (раньше logging.shutdown): дописывает очередь
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
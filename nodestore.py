@@ -0,0 +1,300 @@
+import threading
+
+# Разделитель имён в ключе узла: ключ — путь от корня, 'Раздел/Категория/...'
+SEPARATOR = '/'
+
+
+class NodeStore:
+    # Дерево разделов: у каждого узла есть id, имя, ссылка на родителя и
+    # упорядоченные дети (словарь имя -> id в порядке добавления). Поиск по
+    # ключу и проверка существования — O(глубины), обход, перенос и удаление
+    # поддерева — O(размера поддерева). Корень (id 0) — без имени.
+    # Изменяет дерево только поток записи базы; чтения берут короткую
+    # блокировку и возвращают копии.
+
+    ROOT = 0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = {self.ROOT: ''}
+        self.parents = {self.ROOT: None}
+        self.children = {self.ROOT: {}}
+        self.next_id = 1
+        # Журнал отката между begin() и end(): действия, возвращающие
+        # прежнее состояние, в порядке изменений
+        self.undo = None
+
+    @classmethod
+    def from_sections(cls, sections):
+        # Из прежнего формата {раздел: [категории]}
+        store = cls()
+        for section_name, categories in sections.items():
+            store.add(section_name)
+            for category_name in categories:
+                store.add(join(section_name, category_name))
+        return store
+
+    @classmethod
+    def load(cls, entries):
+        # Из dump(): (id, id родителя, имя) в прямом порядке обхода
+        store = cls()
+        for node_id, parent_id, name in entries:
+            store._link(node_id, parent_id, name)
+            store.next_id = max(store.next_id, node_id + 1)
+        return store
+
+    def copy(self):
+        with self.lock:
+            store = NodeStore()
+            store.names = dict(self.names)
+            store.parents = dict(self.parents)
+            store.children = {node_id: dict(children) for node_id, children in self.children.items()}
+            store.next_id = self.next_id
+            return store
+
+    def begin(self):
+        # Точка отката: изменения до end() можно отменить rollback()
+        with self.lock:
+            self.undo = []
+
+    def end(self):
+        with self.lock:
+            self.undo = None
+
+    def rollback(self):
+        # Возвращает дерево к состоянию на begin(). id удалённых при откате
+        # узлов повторно не выдаются.
+        with self.lock:
+            for action in reversed(self.undo):
+                action()
+            self.undo = None
+
+    def _unlink(self, node_id):
+        del self.children[self.parents[node_id]][self.names[node_id]]
+        del self.names[node_id]
+        del self.parents[node_id]
+        del self.children[node_id]
+
+    def _restore(self, parent_id, siblings, entries):
+        # Обратно к состоянию до remove/move: дети родителя и записи узлов
+        self.children[parent_id] = siblings
+        for node_id, name, node_parent_id, children in entries:
+            self.names[node_id] = name
+            self.parents[node_id] = node_parent_id
+            self.children[node_id] = children
+
+    def dump(self):
+        with self.lock:
+            return [(node_id, self.parents[node_id], self.names[node_id]) for node_id in self._walk(self.ROOT)[1:]]
+
+    def _link(self, node_id, parent_id, name):
+        self.names[node_id] = name
+        self.parents[node_id] = parent_id
+        self.children[node_id] = {}
+        self.children[parent_id][name] = node_id
+
+    def _find(self, key):
+        node_id = self.ROOT
+        if not key:
+            return node_id
+        for name in key.split(SEPARATOR):
+            node_id = self.children[node_id].get(name)
+            if node_id is None:
+                return None
+        return node_id
+
+    def _key(self, node_id):
+        names = []
+        while node_id != self.ROOT:
+            names.append(self.names[node_id])
+            node_id = self.parents[node_id]
+        return SEPARATOR.join(reversed(names))
+
+    def _walk(self, node_id):
+        # id поддерева в прямом порядке обхода, начиная с самого узла
+        result = []
+        stack = [node_id]
+        while stack:
+            current = stack.pop()
+            result.append(current)
+            stack.extend(reversed(self.children[current].values()))
+        return result
+
+    def _subtree_keys(self, node_id, key):
+        # Ключи поддерева в прямом порядке, без повторного подъёма к корню
+        result = []
+        stack = [(node_id, key)]
+        while stack:
+            current, current_key = stack.pop()
+            result.append(current_key)
+            for name, child_id in reversed(self.children[current].items()):
+                stack.append((child_id, join(current_key, name)))
+        return result
+
+    def __contains__(self, key):
+        with self.lock:
+            return bool(key) and self._find(key) is not None
+
+    def __len__(self):
+        return len(self.names) - 1
+
+    def node_id(self, key):
+        with self.lock:
+            return self._find(key)
+
+    def key(self, node_id):
+        # Ключ узла по id; None, если узла уже нет
+        with self.lock:
+            return self._key(node_id) if node_id in self.names else None
+
+    def child_names(self, key=''):
+        with self.lock:
+            node_id = self._find(key)
+            return [] if node_id is None else list(self.children[node_id])
+
+    def child_entries(self, node_id):
+        # [(id, имя)] детей узла по порядку; пустой список, если узла уже нет
+        with self.lock:
+            children = self.children.get(node_id)
+            return [] if children is None else [(child_id, name) for name, child_id in children.items()]
+
+    def has_children(self, node_id):
+        with self.lock:
+            return bool(self.children.get(node_id))
+
+    def subtree_keys(self, key):
+        with self.lock:
+            node_id = self._find(key)
+            return [] if node_id is None else self._subtree_keys(node_id, key)
+
+    def can_add(self, key):
+        parent_key, name = split(key)
+        with self.lock:
+            parent_id = self._find(parent_key)
+            return bool(name) and parent_id is not None and name not in self.children[parent_id]
+
+    def add(self, key):
+        # Добавляет узел; родитель должен существовать. Возвращает id или None.
+        parent_key, name = split(key)
+        with self.lock:
+            parent_id = self._find(parent_key)
+            if not name or parent_id is None or name in self.children[parent_id]:
+                return None
+            node_id = self.next_id
+            self.next_id += 1
+            self._link(node_id, parent_id, name)
+            if self.undo is not None:
+                self.undo.append(lambda: self._unlink(node_id))
+            return node_id
+
+    def remove(self, key):
+        # Удаляет узел с поддеревом. Возвращает ключи удалённых узлов.
+        with self.lock:
+            node_id = self._find(key)
+            if not key or node_id is None:
+                return []
+            keys = self._subtree_keys(node_id, key)
+            parent_id = self.parents[node_id]
+            if self.undo is not None:
+                # Словари детей удалённых узлов больше не меняются: для отката
+                # достаточно ссылок на них и копии детей родителя
+                entries = [
+                    (removed_id, self.names[removed_id], self.parents[removed_id], self.children[removed_id])
+                    for removed_id in self._walk(node_id)
+                ]
+                siblings = dict(self.children[parent_id])
+                self.undo.append(lambda: self._restore(parent_id, siblings, entries))
+            del self.children[parent_id][self.names[node_id]]
+            for removed_id in self._walk(node_id):
+                del self.names[removed_id]
+                del self.parents[removed_id]
+                del self.children[removed_id]
+            return keys
+
+    def can_move(self, key, new_key):
+        new_parent_key, new_name = split(new_key)
+        with self.lock:
+            node_id = self._find(key)
+            new_parent_id = self._find(new_parent_key)
+            if not key or not new_name or node_id is None or new_parent_id is None:
+                return False
+            if new_name in self.children[new_parent_id]:
+                return False
+            # Нельзя перенести узел внутрь собственного поддерева
+            ancestor = new_parent_id
+            while ancestor is not None:
+                if ancestor == node_id:
+                    return False
+                ancestor = self.parents[ancestor]
+            return True
+
+    def move(self, key, new_key):
+        # Переносит и/или переименовывает узел с поддеревом. При смене только
+        # имени узел остаётся на своём месте среди детей, при переносе —
+        # встаёт последним. Возвращает пары (старый ключ, новый ключ).
+        if not self.can_move(key, new_key):
+            return []
+        new_parent_key, new_name = split(new_key)
+        with self.lock:
+            node_id = self._find(key)
+            new_parent_id = self._find(new_parent_key)
+            old_keys = self._subtree_keys(node_id, key)
+            parent_id = self.parents[node_id]
+            siblings = self.children[parent_id]
+            if self.undo is not None:
+                entry = [(node_id, self.names[node_id], parent_id, self.children[node_id])]
+                target = dict(self.children[new_parent_id])
+                saved = dict(siblings)
+                self.undo.append(lambda: self._restore(new_parent_id, target, []))
+                self.undo.append(lambda: self._restore(parent_id, saved, entry))
+            if parent_id == new_parent_id:
+                self.children[parent_id] = {
+                    new_name if child_id == node_id else name: child_id for name, child_id in siblings.items()
+                }
+            else:
+                del siblings[self.names[node_id]]
+                self.children[new_parent_id][new_name] = node_id
+                self.parents[node_id] = new_parent_id
+            self.names[node_id] = new_name
+            return [(old_key, new_key + old_key[len(key):]) for old_key in old_keys]
+
+    def sections(self):
+        # Прежнее представление {раздел: [категории]} — два верхних уровня
+        with self.lock:
+            return {
+                name: list(self.children[section_id])
+                for name, section_id in self.children[self.ROOT].items()
+            }
+
+    def tree(self, key=''):
+        # Вложенное представление поддерева для API и GUI:
+        # [{"name", "key", "children": [...]}, ...]
+        with self.lock:
+            node_id = self._find(key)
+            if node_id is None:
+                return None
+            result = []
+            stack = [(node_id, key, result)]
+            while stack:
+                current, current_key, siblings = stack.pop()
+                for name, child_id in self.children[current].items():
+                    child_key = join(current_key, name)
+                    node = {"name": name, "key": child_key, "children": []}
+                    siblings.append(node)
+                    stack.append((child_id, child_key, node["children"]))
+            return result
+
+
+def join(parent_key, name):
+    return f"{parent_key}{SEPARATOR}{name}" if parent_key else name
+
+
+def split(key):
+    # (ключ родителя, имя); у узла верхнего уровня родитель — корень ('')
+    parent_key, _, name = key.rpartition(SEPARATOR)
+    return parent_key, name
+
+
+def in_subtree(key, root_key):
+    # Узел key — сам root_key или его потомок
+    return key == root_key or key.startswith(root_key + SEPARATOR)
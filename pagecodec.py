@@ -0,0 +1,137 @@
+import random
+import re
+import zlib
+from collections import Counter
+
+# Сжатие HTML страниц в снимке: raw deflate с общим словарём. Почти всё
+# в выводе toHtml() повторяется от страницы к странице (DOCTYPE, <style>,
+# стиль <body>, стиль каждого абзаца), поэтому словарь, собранный по самому
+# корпусу, сжимает даже короткие страницы, которые zlib без словаря почти
+# не уменьшает. Окно deflate — 32 КБ, больше словарь быть не может.
+DICTIONARY_SIZE = 32 * 1024
+COMPRESSION_LEVEL = 6
+# Сколько страниц читается для сборки словаря
+TRAINING_SAMPLE = 2000
+# Фрагменты для словаря: теги целиком и слова с пробелом после них
+_SEGMENTS = re.compile(r'<[^>]*>\n?|[^<\s]+\s?')
+
+# Канонизация: служебные стили Qt в краткой записи. Вывод после обратного
+# setHtml()/toHtml() совпадает с исходным, так что страница не меняется.
+_MARGINS = re.compile(
+    r'margin-top: ?(-?\d+)px; margin-bottom: ?(-?\d+)px; margin-left: ?(-?\d+)px; margin-right: ?(-?\d+)px;'
+)
+_DEFAULT_INDENTS = re.compile(r' -qt-block-indent:0;| text-indent:0px;')
+
+
+class PageCodec:
+    # method 'raw' — тела страниц как есть в UTF-8 (снимки KBSNAP1),
+    # 'zlib' — raw deflate со словарём. trained_on — число страниц корпуса,
+    # по которому собран словарь (по нему решается, пора ли его пересобрать).
+
+    def __init__(self, method='zlib', dictionary=b'', trained_on=0):
+        if method not in ('raw', 'zlib'):
+            raise ValueError(f"Неизвестный метод сжатия страниц: '{method}'")
+        self.method = method
+        self.dictionary = dictionary
+        self.trained_on = trained_on
+        if method == 'zlib':
+            # Подготовленные объекты копируются на каждую страницу: так словарь
+            # не разбирается заново при каждом сжатии и распаковке
+            if dictionary:
+                self.compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, dictionary)
+                self.decompressor = zlib.decompressobj(-15, dictionary)
+            else:
+                self.compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+                self.decompressor = zlib.decompressobj(-15)
+
+    @classmethod
+    def from_state(cls, state):
+        if state is None:
+            return RAW
+        return cls(state["method"], state["dictionary"], state["trained_on"])
+
+    def state(self):
+        return {"method": self.method, "dictionary": self.dictionary, "trained_on": self.trained_on}
+
+    def same_as(self, other):
+        return self.method == other.method and self.dictionary == other.dictionary
+
+    def encode(self, body):
+        # body — страница в UTF-8
+        if self.method == 'raw':
+            return body
+        compressor = self.compressor.copy()
+        return compressor.compress(body) + compressor.flush()
+
+    def decode(self, data):
+        # Обратно в UTF-8; data может быть срезом отображённого файла
+        if self.method == 'raw':
+            return bytes(data)
+        decompressor = self.decompressor.copy()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def decode_chunks(self, data, size):
+        # То же, что decode, порциями не больше size байт UTF-8: первая
+        # порция готова без распаковки всей страницы
+        if self.method == 'raw':
+            for start in range(0, len(data), size):
+                yield bytes(data[start:start + size])
+            return
+        decompressor = self.decompressor.copy()
+        while data:
+            chunk = decompressor.decompress(data, size)
+            data = decompressor.unconsumed_tail
+            if chunk:
+                yield chunk
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+    @classmethod
+    def train(cls, pages, trained_on=0, size=DICTIONARY_SIZE):
+        # Словарь из фрагментов, которые встречаются в нескольких страницах.
+        # Вес фрагмента — экономия (длина * число страниц с ним); самые ценные
+        # кладутся в конец словаря, ближе к сжимаемым данным: ссылки на них
+        # короче. pages — итерируемое строк HTML.
+        counts = Counter()
+        sampled = 0
+        for html in pages:
+            counts.update(set(_SEGMENTS.findall(html)))
+            sampled += 1
+        if sampled < 2:
+            return cls('zlib', b'', trained_on)
+        candidates = ((len(segment) * count, segment) for segment, count in counts.items() if count > 1)
+        chosen = []
+        used = 0
+        for _, segment in sorted(candidates, reverse=True):
+            body = segment.encode('utf-8')
+            if used + len(body) > size:
+                continue
+            chosen.append(body)
+            used += len(body)
+        return cls('zlib', b''.join(reversed(chosen)), trained_on)
+
+
+RAW = PageCodec('raw')
+
+
+def sample_keys(keys, limit=TRAINING_SAMPLE, seed=0):
+    # Равномерная выборка ключей для сборки словаря
+    keys = list(keys)
+    if len(keys) <= limit:
+        return keys
+    return random.Random(seed).sample(keys, limit)
+
+
+def canonicalize_html(html):
+    # Сокращает повторяющиеся в каждом абзаце стили Qt: четыре поля — одним
+    # margin, нулевые отступы по умолчанию опускаются. Идемпотентна.
+    html = _MARGINS.sub(_short_margin, html)
+    return _DEFAULT_INDENTS.sub('', html)
+
+
+def _short_margin(match):
+    top, bottom, left, right = match.groups()
+    if top == bottom == left == right:
+        return f"margin:{top}px;"
+    return f"margin:{top}px {right}px {bottom}px {left}px;"
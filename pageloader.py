@@ -0,0 +1,359 @@
+import base64
+import logging
+import os
+import re
+import threading
+import time
+from PyQt5.QtCore import QEvent, QObject, QRunnable, QThreadPool, QTimer, QUrl, pyqtSignal
+from PyQt5.QtGui import QImage, QTextDocument
+
+# Страницы длиннее стольких символов HTML загружаются по частям (0 — все
+# страницы целиком)
+PROGRESSIVE_THRESHOLD = 256 * 1024
+# Первый экран — столько символов HTML от начала тела страницы (целыми
+# блоками верхнего уровня)
+FIRST_SCREEN_CHARS = 32 * 1024
+# Первый экран может кончиться внутри большой таблицы: её начало
+# показывается отдельной таблицей из стольких строк. Только в первом
+# экране — документ всей страницы строится из HTML без изменений.
+TABLE_ROWS_PER_PART = 50
+# Если <body> не нашёлся в стольких первых символах, страница — не вывод
+# toHtml() и грузится целиком, как раньше
+HEAD_LIMIT = 16 * 1024
+
+# Теги и комментарии; значения атрибутов в кавычках могут содержать '>'
+_TAG = re.compile(r'<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9]*)(?:[^>"\']|"[^"]*"|\'[^\']*\')*>', re.S)
+_IMAGE_SOURCE = re.compile(r'<img\b[^>]*?\bsrc="([^"]*)"', re.I)
+# Элементы, внутри которых страницу делить нельзя (кроме строк таблицы)
+_CONTAINERS = {'table', 'thead', 'tbody', 'tfoot', 'ul', 'ol', 'dl', 'div', 'blockquote'}
+_TABLE_TAGS = {'table', 'thead', 'tbody', 'tfoot'}
+# Конец блока верхнего уровня: после закрывающего тега или одиночного <hr />
+_BLOCKS = {'p', 'pre', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'ul', 'ol', 'dl', 'div', 'blockquote'}
+
+
+class HtmlSplitter:
+    # Делит HTML страницы на части по границам блоков верхнего уровня
+    # (абзац, заголовок, список, таблица). Части — подряд идущие куски
+    # исходного текста, так что вместе с head они дают страницу без
+    # изменений. При table_rows большие таблицы режутся по строкам: часть
+    # закрывает открытые теги таблицы, следующая открывает их заново.
+    # head — текст до <body ...> включительно; None, пока не найден.
+
+    def __init__(self, table_rows=None):
+        self.table_rows = table_rows
+        self.head = None
+        self.parts = []
+        self.size = 0
+        self.text = ''
+        # Начало текущей части в text и место, с которого ищутся теги
+        self.start = 0
+        self.scan = 0
+        # Открытые контейнеры: [(имя, открывающий тег)]
+        self.stack = []
+        self.rows = 0
+        self.reopen = ''
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self.head is None:
+            body = self.text.find('<body')
+            end = self.text.find('>', body) if body >= 0 else -1
+            if end < 0:
+                if len(self.text) > HEAD_LIMIT:
+                    self.head = ''
+                return
+            self.head = self.text[:end + 1]
+            self.text = self.text[end + 1:]
+        last = self.scan
+        for match in _TAG.finditer(self.text, self.scan):
+            last = match.end()
+            if match.group(2) is None:
+                continue
+            closing = bool(match.group(1))
+            name = match.group(2).lower()
+            if name in _CONTAINERS:
+                if not closing:
+                    self.stack.append((name, match.group()))
+                else:
+                    for index in range(len(self.stack) - 1, -1, -1):
+                        if self.stack[index][0] == name:
+                            del self.stack[index:]
+                            break
+            if self.stack:
+                if closing and name == 'tr' and self.table_rows and self.in_table():
+                    self.rows += 1
+                    if self.rows >= self.table_rows:
+                        self.cut(last, split=True)
+            elif (closing and name in _BLOCKS) or (not closing and name == 'hr'):
+                self.cut(last)
+        self.scan = last
+        # Разобранное отбрасывается: text начинается с текущей части
+        self.text = self.text[self.start:]
+        self.scan -= self.start
+        self.start = 0
+
+    def in_table(self):
+        # Внутри строк таблицы верхнего уровня (не вложенной и не в списке)
+        names = [name for name, _ in self.stack]
+        return names[0] == 'table' and names.count('table') == 1 and all(name in _TABLE_TAGS for name in names)
+
+    def cut(self, end, split=False):
+        part = self.reopen + self.text[self.start:end]
+        self.reopen = ''
+        if split:
+            part += ''.join(f'</{name}>' for name, _ in reversed(self.stack))
+            self.reopen = ''.join(tag for _, tag in self.stack)
+        self.parts.append(part)
+        self.size += len(part)
+        self.start = end
+        self.rows = 0
+
+    def finish(self):
+        # Остаток текста (закрывающие теги страницы и незакрытый блок) —
+        # последней частью
+        if self.head is None:
+            self.head = ''
+        rest = self.reopen + self.text[self.start:]
+        if rest:
+            self.parts.append(rest)
+            self.size += len(rest)
+        self.text = ''
+        self.reopen = ''
+
+    def html(self, count=None):
+        # head и первые count частей (все при None), с закрытием страницы
+        parts = self.parts if count is None else self.parts[:count]
+        tail = '</body></html>' if self.head and count is not None else ''
+        return self.head + ''.join(parts) + tail
+
+
+def load_images(document, html):
+    # Изображения страницы (файлы и data: URI) декодируются здесь, в рабочем
+    # потоке, и кладутся в ресурсы документа: иначе Qt читает их в GUI-потоке
+    # при первой разметке
+    for source in set(_IMAGE_SOURCE.findall(html)):
+        image = QImage()
+        if source.startswith('data:'):
+            header, _, data = source.partition(',')
+            if header.endswith(';base64'):
+                try:
+                    image.loadFromData(base64.b64decode(data))
+                except ValueError:
+                    pass
+        else:
+            url = QUrl(source)
+            path = url.toLocalFile() if url.isLocalFile() else source
+            if url.isLocalFile() or url.isRelative():
+                if os.path.isfile(path):
+                    image.load(path)
+        if not image.isNull():
+            document.addResource(QTextDocument.ImageResource, QUrl(source), image)
+
+
+class PageTask(QRunnable):
+    # Дочитывает страницу и разбирает её в QTextDocument в рабочем потоке.
+    # Готовый документ переносится в поток загрузчика и отдаётся ему.
+
+    def __init__(self, loader, generation, key, chunks, rest, font, style_sheet, margin):
+        super().__init__()
+        self.loader = loader
+        self.generation = generation
+        self.key = key
+        self.chunks = chunks
+        self.rest = rest
+        self.font = font
+        self.style_sheet = style_sheet
+        self.margin = margin
+
+    def run(self):
+        document = None
+        try:
+            for chunk in self.rest:
+                if not self.loader.is_current(self.generation):
+                    return
+                self.chunks.append(chunk)
+            html = ''.join(self.chunks)
+            if not self.loader.is_current(self.generation):
+                return
+            document = QTextDocument()
+            document.setDefaultFont(self.font)
+            document.setDefaultStyleSheet(self.style_sheet)
+            document.setDocumentMargin(self.margin)
+            document.setHtml(html)
+            load_images(document, html)
+            if not self.loader.is_current(self.generation):
+                return
+            # Дальше документ живёт в GUI-потоке, и удалять его можно только там
+            document.moveToThread(self.loader.thread())
+        except Exception as e:
+            logging.error(f"Не удалось загрузить страницу '{self.key}': {e}")
+            document = None
+        self.loader.deliver(self.generation, document)
+
+
+class PageLoader(QObject):
+    # Загрузка страниц в редактор. Небольшая страница ставится целиком, как
+    # раньше. Большая читается из базы порциями: первый экран (начало
+    # страницы целыми блоками) ставится сразу, а вся страница дочитывается и
+    # разбирается без изменений в отдельный QTextDocument в рабочем потоке и
+    # подменяет документ редактора с сохранением прокрутки. Пока страница грузится,
+    # редактор только для чтения. Время от выбора страницы до первой
+    # отрисовки редактора пишется в лог по каждому ключу.
+    # page_loaded(ключ) — страница в редакторе целиком.
+    page_loaded = pyqtSignal(str)
+    ready = pyqtSignal(int)
+
+    def __init__(self, db, editor, threshold=PROGRESSIVE_THRESHOLD, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.editor = editor
+        self.threshold = threshold
+        self.generation = 0
+        self.key = None
+        self.started = 0
+        self.loading = False
+        self.first_paint = None
+        self.paint_pending = False
+        self.lock = threading.Lock()
+        self.results = {}
+        self.pool = QThreadPool(self)
+        # Два потока: разбор брошенной страницы не задерживает следующую
+        self.pool.setMaxThreadCount(2)
+        self.ready.connect(self.on_ready)
+        editor.viewport().installEventFilter(self)
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def load(self, key, started=None):
+        # started — время выбора страницы (perf_counter)
+        self.cancel()
+        self.key = key
+        self.started = started or time.perf_counter()
+        self.first_paint = None
+        self.paint_pending = True
+        threshold = self.threshold or float('inf')
+        chunks = []
+        size = 0
+        stream = self.db.iter_content(key)
+        splitter = HtmlSplitter(TABLE_ROWS_PER_PART)
+        for chunk in stream:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > threshold:
+                break
+        else:
+            # Страница кончилась раньше порога
+            self.set_html(''.join(chunks))
+            self.page_loaded.emit(key)
+            return
+        # Первый экран — только для чтения и заменится документом всей
+        # страницы, поэтому таблицы в нём можно резать
+        for chunk in chunks:
+            if splitter.size >= FIRST_SCREEN_CHARS:
+                break
+            splitter.feed(chunk)
+        while splitter.size < FIRST_SCREEN_CHARS and splitter.head != '':
+            chunk = next(stream, None)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+            splitter.feed(chunk)
+        if not splitter.head or not splitter.parts:
+            # Не вывод toHtml() или без границ блоков — целиком, как раньше
+            self.set_html(''.join(chunks) + ''.join(stream))
+            self.page_loaded.emit(key)
+            return
+        count = 0
+        first_size = 0
+        while count < len(splitter.parts) and first_size < FIRST_SCREEN_CHARS:
+            first_size += len(splitter.parts[count])
+            count += 1
+        self.loading = True
+        self.editor.setReadOnly(True)
+        self.set_html(splitter.html(count))
+        document = self.editor.document()
+        self.pool.start(PageTask(
+            self, self.generation, key, chunks, stream,
+            document.defaultFont(), document.defaultStyleSheet(), document.documentMargin()
+        ))
+
+    def show(self, key, html):
+        # Страница, уже прочитанная целиком (например, восстановленная
+        # ревизия): незаконченная загрузка бросается
+        self.cancel()
+        self.key = key
+        self.set_html(html)
+
+    def set_html(self, html):
+        # Загрузка в редактор не считается правкой
+        self.editor.blockSignals(True)
+        self.editor.setText(html)
+        self.editor.blockSignals(False)
+
+    def cancel(self):
+        # Брошенная загрузка останавливается на границе порции, её документ
+        # не ставится
+        self.generation += 1
+        self.loading = False
+        self.pool.clear()
+        with self.lock:
+            self.results.clear()
+
+    def deliver(self, generation, document):
+        # Из рабочего потока: документ хранится здесь, пока его не заберёт
+        # GUI-поток (иначе Python удалит его вместе с задачей в чужом потоке).
+        # Документ брошенной загрузки удаляется там же, в on_ready.
+        with self.lock:
+            self.results[generation] = document
+        self.ready.emit(generation)
+
+    def on_ready(self, generation):
+        with self.lock:
+            if generation not in self.results:
+                return
+            document = self.results.pop(generation)
+        if generation != self.generation:
+            return
+        self.loading = False
+        if document is None:
+            # Разбор не удался: страница целиком, как раньше
+            self.set_html(self.db.load_content(self.key))
+        else:
+            self.install(document)
+        elapsed = (time.perf_counter() - self.started) * 1000
+        logging.info(f"Страница '{self.key}' загружена полностью через {elapsed:.0f} мс")
+        self.page_loaded.emit(self.key)
+
+    def install(self, document):
+        # Подменяет документ редактора, сохраняя прокрутку. Документ
+        # принадлежит редактору (через него же грузятся ресурсы); прежний
+        # документ загрузчика setDocument удаляет сам.
+        scrollbar = self.editor.verticalScrollBar()
+        position = scrollbar.value()
+        document.setParent(self.editor)
+        self.editor.blockSignals(True)
+        self.editor.setDocument(document)
+        self.editor.blockSignals(False)
+        scrollbar.setValue(position)
+
+    def wait(self):
+        # Дожидается загрузки текущей страницы (печать, сохранение в PDF)
+        self.pool.waitForDone()
+        self.on_ready(self.generation)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint and self.paint_pending:
+            self.paint_pending = False
+            # Замер — после самой отрисовки, на следующем проходе цикла событий
+            QTimer.singleShot(0, self.log_first_paint)
+        return False
+
+    def log_first_paint(self):
+        self.first_paint = (time.perf_counter() - self.started) * 1000
+        logging.info(f"Страница '{self.key}': первая отрисовка через {self.first_paint:.0f} мс"
+                     + (" (первый экран, остальное загружается)" if self.loading else ""))
+
+    def close(self):
+        self.cancel()
+        self.pool.waitForDone()
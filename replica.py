@@ -0,0 +1,167 @@
+import copy
+import os
+import logging
+from attachments import AttachmentExtractor
+from database import Database
+from generation import Generation
+from history import RevisionStore
+from journal import Journal, read_records
+from nodestore import NodeStore
+from search_index import SearchIndex
+from snapshot import PageStore, read_snapshot
+
+
+class ReadReplica(Database):
+    # Реплика базы только для чтения в другом процессе. Пишет в базу один
+    # процесс (Database в режиме 'journal'), реплики открывают тот же снимок
+    # через отображение в память — тела страниц общие для всех процессов
+    # через кэш ОС, прочитанные страницы не запоминаются. Зафиксированные
+    # мутации реплика дочитывает из журнала, как только база объявит новое
+    # поколение (generation.Generation), а при замене снимка переводит на
+    # него страницы. В памяти процесса — дерево, списки файлов, страницы,
+    # изменённые после последнего снимка, и поисковый индекс, если он нужен
+    # (search=True): индекс занимает больше всего памяти, поэтому по
+    # умолчанию поиск выполняет основной процесс.
+    # Только POSIX: в Windows отображённый репликой файл нельзя заменить.
+
+    def __init__(self, db_file='data.db', blobs_folder=None, search=False):
+        # Под self.lock реплика догоняет базу; читатели блокировок не берут
+        self._setup(db_file, 'replica', blobs_folder, 'raw', False)
+        self.generation = Generation(db_file + '.gen')
+        self.seen = self.generation.read()
+        self.journal = Journal(db_file)
+        # Читаемый сегмент журнала: номер, открытый файл и смещение
+        self.position = 0
+        self.segment = None
+        self.offset = 0
+        # Тексты вложений реплика берёт только из кэша, который заполняет
+        # основной процесс; ещё не извлечённые попадут в индекс при перезагрузке
+        self.attachments = AttachmentExtractor(db_file + '.text', workers=1, extract=False)
+        self.listeners.append(self.update_titles)
+        self.reload()
+        if search:
+            self.search_index = SearchIndex(db_file + '.index')
+            self.search_index.load()
+            self.sync_search_index()
+            self.listeners.append(self.update_search_index)
+            self.listeners.append(self.update_attachment_index)
+        self.history = RevisionStore(db_file + '.history', readonly=True)
+        self.history.load()
+
+    def refresh(self):
+        # Догоняет базу, если она объявила новое поколение. После возврата
+        # видны все изменения, зафиксированные до вызова (и, возможно, позже).
+        if self.generation.read() == self.seen:
+            return
+        with self.lock:
+            state = self.generation.read()
+            if state == self.seen:
+                return
+            events = self.tail()
+            if state[1] != self.seen[1]:
+                self.remap()
+            self.history.refresh()
+            for op, args in events:
+                for listener in self.listeners:
+                    try:
+                        listener(op, args)
+                    except Exception as e:
+                        logging.error(f"Ошибка слушателя реплики для '{op}': {e}")
+            self.seen = state
+
+    def tail(self):
+        # Применяет новые записи журнала с текущей позиции, возвращает события.
+        # Следующий сегмент появляется только после закрытия текущего, поэтому
+        # при его наличии текущий дочитывается до конца и закрывается.
+        events = []
+        while True:
+            if self.segment is None:
+                try:
+                    self.segment = open(self.journal.segment_path(self.position), 'rb')
+                except FileNotFoundError:
+                    return events
+                self.offset = 0
+            last = not os.path.exists(self.journal.segment_path(self.position + 1))
+            self.segment.seek(self.offset)
+            for (op, args), end in read_records(self.segment):
+                events.extend(self.apply(op, args))
+                self.offset = end
+            if last:
+                return events
+            self.segment.close()
+            self.segment = None
+            self.position += 1
+
+    def remap(self):
+        # Файл данных заменён новым снимком. Если журнал уже дочитан дальше
+        # точки снимка, всё из снимка в состоянии реплики есть: страницы
+        # переходят на новый файл, дерево и списки файлов не меняются. Иначе
+        # (сегменты удалены раньше, чем реплика их прочитала, или база без
+        # журнала) состояние загружается заново.
+        try:
+            data, seq = read_snapshot(self.db_file)
+        except Exception as e:
+            logging.error(f"Реплика не смогла открыть новый снимок: {e}")
+            return
+        if self.segment is not None and seq < self.position:
+            self.data["content"].rebase(data["content"])
+            self.snapshot_seq = seq
+            return
+        data["content"].release()
+        self.reload()
+        if self.search_index is not None:
+            self.sync_search_index()
+
+    def reload(self):
+        # Полная загрузка: снимок и сегменты журнала после него. Состояние
+        # собирается в копии реплики и подменяется целиком; если снимок за
+        # это время заменили (и могли удалить сегменты), загрузка повторяется.
+        # Версии ключей начинаются заново, поэтому меняется и эпоха ETag.
+        while True:
+            snapshots = self.generation.read()[1]
+            state = copy.copy(self)
+            state.data = {"tree": NodeStore(), "content": PageStore(), "files": {}}
+            state.snapshot_seq = 0
+            state.load_data()
+            state.data["content"].cache = False
+            state.versions = {}
+            state.version_seq = 0
+            state.text_cache = {}
+            state.position = state.snapshot_seq + 1
+            state.segment = None
+            state.tail()
+            if self.generation.read()[1] == snapshots:
+                break
+            if state.segment is not None:
+                state.segment.close()
+            state.data["content"].release()
+        if self.segment is not None:
+            self.segment.close()
+        # Прежнее отображение закроется сборщиком мусора, когда его отпустят
+        # читатели, которые ещё держат старые данные
+        self.data = state.data
+        self.snapshot_seq = state.snapshot_seq
+        self.position, self.segment, self.offset = state.position, state.segment, state.offset
+        self.versions = state.versions
+        self.version_seq = state.version_seq
+        self.epoch = os.urandom(4).hex()
+        self.text_cache = {}
+        self.titles = None
+        logging.info(f"Реплика загружена: снимок {self.snapshot_seq}, сегмент журнала {self.position}.")
+
+    def commit(self, op, *args):
+        raise PermissionError("Реплика базы только для чтения: изменения вносятся через основной процесс")
+
+    def close(self):
+        # Поисковый индекс не сохраняется: его файл принадлежит базе
+        if self.closed:
+            return
+        self.closed = True
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+        self.attachments.close()
+        self.history.close()
+        self.data["content"].release()
+        self.generation.close()
@@ -1,39 +1,167 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file
 from database import Database
+from bulk import EXPORT_FORMATS, import_items, export_stream, read_jsonl, read_tar
+from httpcache import ResponseCache, cached_json
+from logsetup import configure_logging, load_settings
+from replica import ReadReplica
+from search_index import decode_cursor
+from textextract import html_to_text
+import atexit
 import logging
+import os
+import urllib.error
+import urllib.request
 
-# Настройка логирования
-logging.basicConfig(
-    filename='server.log',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
+# Настройка логирования (фоновая запись, уровень и ротация — в config.json).
+# database.py при импорте уже направил журнал в app.log, сервер пишет в свой
+configure_logging('server.log', load_settings(), force=True)
 
 app = Flask(__name__)
-db = Database('data.db')
+# KB_ROLE=replica — процесс-реплика для чтения (asgi_server.py --replicas):
+# читает базу основного процесса, запросы на изменение пересылает ему по
+# адресу KB_WRITER_URL, как и поиск, если у реплики нет своего индекса
+# (KB_REPLICA_SEARCH=1 — держать индекс в каждой реплике).
+# KB_STORAGE — режим хранения основного процесса.
+WRITER_URL = os.environ.get('KB_WRITER_URL', '')
+if os.environ.get('KB_ROLE') == 'replica':
+    db = ReadReplica('data.db', search=os.environ.get('KB_REPLICA_SEARCH') == '1')
+else:
+    db = Database('data.db', os.environ.get('KB_STORAGE', 'pickle'))
+# Сохраняем поисковый индекс при остановке сервера
+atexit.register(db.close)
+# Сериализованные ответы эндпоинтов чтения; сбрасываются по версиям ключей в базе
+cache = ResponseCache()
+
+# Заголовки, которые реплика переносит в запрос к основному процессу и обратно
+FORWARDED_HEADERS = ('Content-Type', 'Content-Length')
+RETURNED_HEADERS = ('content-type', 'etag', 'location')
+
+@app.before_request
+def follow_writer():
+    # Реплика перед чтением догоняет базу; изменения выполняет основной процесс
+    if not isinstance(db, ReadReplica):
+        return None
+    if request.method not in ('GET', 'HEAD') or (request.endpoint in ('search', 'suggest') and db.search_index is None):
+        return forward_to_writer()
+    db.refresh()
+    return None
+
+def forward_to_writer():
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    # Тело с известной длиной передаётся потоком (загрузка больших файлов)
+    data = request.stream if request.content_length is not None else (request.get_data() or None)
+    forwarded = urllib.request.Request(WRITER_URL + request.full_path, data=data, headers=headers, method=request.method)
+    try:
+        response = urllib.request.urlopen(forwarded, timeout=60)
+    except urllib.error.HTTPError as e:
+        response = e
+    except OSError as e:
+        logging.error(f"Основной процесс недоступен для '{request.method} {request.path}': {e}")
+        return jsonify({'error': 'Основной процесс базы недоступен'}), 503
+    with response:
+        body = response.read()
+        headers = [(name, value) for name, value in response.getheaders() if name.lower() in RETURNED_HEADERS]
+        return Response(body, status=response.status, headers=headers)
+
+def parse_rev(value):
+    # Номер ревизии из параметра запроса; None, если параметра нет
+    return None if value is None or value == '' else int(value)
 
 @app.route('/api/sections', methods=['GET'])
 def get_sections():
     try:
-        sections = db.get_sections()
-        return jsonify(sections)
+        return cached_json(cache, request, ('sections',), db.version('tree'), db.get_sections)
     except Exception as e:
         logging.error(f"Ошибка при получении разделов: {e}")
         return jsonify({'error': 'Ошибка при получении разделов'}), 500
 
+@app.route('/api/tree', methods=['GET'])
+def get_tree():
+    # Дерево разделов любой глубины; key — корень выдаваемого поддерева
+    key = request.args.get('key', '')
+
+    def build():
+        tree = db.get_tree(key)
+        if tree is None:
+            raise LookupError(key)
+        return {'key': key, 'children': tree}
+
+    try:
+        return cached_json(cache, request, ('tree', key), db.version('tree'), build)
+    except LookupError:
+        return jsonify({'error': 'Узел не найден'}), 404
+    except Exception as e:
+        logging.error(f"Ошибка при получении дерева '{key}': {e}")
+        return jsonify({'error': 'Ошибка при получении дерева'}), 500
+
 @app.route('/api/content', methods=['GET'])
 def get_content():
     key = request.args.get('key')
     if not key:
         return jsonify({'error': 'Не указан ключ'}), 400
     try:
-        content = db.load_content(key)
-        return jsonify({'key': key, 'content': content})
+        rev = parse_rev(request.args.get('rev'))
+    except ValueError:
+        return jsonify({'error': 'Некорректный номер ревизии'}), 400
+    # format=text — простой текст страницы вместо HTML
+    text = request.args.get('format') == 'text'
+
+    def build():
+        # rev — ревизия из истории страницы вместо текущего содержимого
+        if rev is not None:
+            content = db.load_revision(key, rev)
+            if content is None:
+                raise LookupError(rev)
+            if text:
+                return {'key': key, 'rev': rev, 'text': html_to_text(content)}
+            return {'key': key, 'rev': rev, 'content': content}
+        if text:
+            return {'key': key, 'text': db.load_text(key)}
+        return {'key': key, 'content': db.load_content(key)}
+
+    try:
+        # Ревизии тоже привязаны к версии страницы: история переезжает и
+        # удаляется вместе с ней
+        return cached_json(cache, request, ('content', key, rev, text), db.version('content', key), build)
+    except LookupError:
+        return jsonify({'error': 'Ревизия не найдена'}), 404
     except Exception as e:
         logging.error(f"Ошибка при загрузке содержимого для ключа '{key}': {e}")
         return jsonify({'error': 'Ошибка при загрузке содержимого'}), 500
 
+@app.route('/api/revisions', methods=['GET'])
+def get_revisions():
+    key = request.args.get('key')
+    if not key:
+        return jsonify({'error': 'Не указан ключ'}), 400
+    try:
+        return jsonify({'key': key, 'revisions': db.get_revisions(key)})
+    except Exception as e:
+        logging.error(f"Ошибка при получении ревизий для ключа '{key}': {e}")
+        return jsonify({'error': 'Ошибка при получении ревизий'}), 500
+
+@app.route('/api/diff', methods=['GET'])
+def get_diff():
+    # Разница простого текста ревизий from и to; без to — с текущим содержимым
+    key = request.args.get('key')
+    if not key:
+        return jsonify({'error': 'Не указан ключ'}), 400
+    try:
+        old_rev = parse_rev(request.args.get('from'))
+        new_rev = parse_rev(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Некорректный номер ревизии'}), 400
+    if old_rev is None:
+        return jsonify({'error': 'Не указана ревизия from'}), 400
+    try:
+        diff = db.diff_revisions(key, old_rev, new_rev)
+        if diff is None:
+            return jsonify({'error': 'Ревизия не найдена'}), 404
+        return jsonify({'key': key, 'from': old_rev, 'to': new_rev, 'diff': diff})
+    except Exception as e:
+        logging.error(f"Ошибка при сравнении ревизий для ключа '{key}': {e}")
+        return jsonify({'error': 'Ошибка при сравнении ревизий'}), 500
+
 @app.route('/api/save_content', methods=['POST'])
 def save_content():
     data = request.json
@@ -41,6 +169,8 @@ def save_content():
     content = data.get('content')
     if not key or content is None:
         return jsonify({'error': 'Не указаны ключ или содержимое'}), 400
+    if not isinstance(content, str):
+        return jsonify({'error': 'Содержимое должно быть строкой'}), 400
     try:
         db.save_content(key, content)
         return jsonify({'status': 'success'})
@@ -54,12 +184,52 @@ def get_files():
     if not key:
         return jsonify({'error': 'Не указан ключ'}), 400
     try:
-        files = db.get_files(key)
-        return jsonify({'files': list(files.keys())})
+        return cached_json(
+            cache, request, ('files', key), db.version('files', key),
+            lambda: {'files': list(db.get_files(key).keys())}
+        )
     except Exception as e:
         logging.error(f"Ошибка при получении файлов для ключа '{key}': {e}")
         return jsonify({'error': 'Ошибка при получении файлов'}), 500
 
+@app.route('/api/search', methods=['GET'])
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Не указан поисковый запрос'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        snippets = min(max(int(request.args.get('snippets', 3)), 0), 10)
+    except ValueError:
+        return jsonify({'error': 'Некорректные параметры limit или snippets'}), 400
+    prefix = request.args.get('prefix') or None
+    cursor = request.args.get('cursor') or None
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except (ValueError, TypeError) as e:
+            logging.warning(f"Некорректный курсор поиска '{cursor}': {e}")
+            return jsonify({'error': 'Некорректный курсор'}), 400
+    try:
+        return jsonify(db.search_page(query, prefix, limit, cursor, snippets))
+    except Exception as e:
+        logging.error(f"Ошибка при поиске '{query}': {e}")
+        return jsonify({'error': 'Ошибка при поиске'}), 500
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    # Подсказки при наборе: /api/suggest?q=отчёт сро&limit=10
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр limit'}), 400
+    try:
+        return jsonify(db.suggest(query, limit))
+    except Exception as e:
+        logging.error(f"Ошибка подсказок для '{query}': {e}")
+        return jsonify({'error': 'Ошибка подсказок'}), 500
+
 @app.route('/api/upload_file', methods=['POST'])
 def upload_file():
     key = request.form.get('key')
@@ -68,12 +238,80 @@ def upload_file():
         return jsonify({'error': 'Не указаны ключ или файл'}), 400
     try:
         file_name = file.filename
-        file_content = file.read()
-        db.add_file(key, file_name, file_content)
+        # werkzeug держит в памяти не больше 500 КБ части, остальное — во
+        # временном файле; оттуда содержимое потоково копируется в хранилище блобов
+        db.add_file(key, file_name, file.stream)
         return jsonify({'status': 'success'})
     except Exception as e:
         logging.error(f"Ошибка при загрузке файла '{file.filename}' для ключа '{key}': {e}")
         return jsonify({'error': 'Ошибка при загрузке файла'}), 500
 
+@app.route('/api/bulk', methods=['POST'])
+def bulk_import():
+    # Тело — tar-архив (format=tar, любое сжатие) или JSONL (format=jsonl),
+    # читается потоком; ответ — счётчики и скорость импорта
+    fmt = request.args.get('format', 'tar')
+    if fmt not in ('tar', 'jsonl'):
+        return jsonify({'error': 'Формат импорта: tar или jsonl'}), 400
+    try:
+        items = read_jsonl(request.stream) if fmt == 'jsonl' else read_tar(request.stream)
+        return jsonify(import_items(db, items).as_dict())
+    except Exception as e:
+        logging.error(f"Ошибка при массовом импорте: {e}")
+        return jsonify({'error': 'Ошибка при массовом импорте'}), 500
+
+@app.route('/api/bulk', methods=['GET'])
+def bulk_export():
+    # Вся база архивом tar/tgz или JSONL; ответ отдаётся по мере чтения
+    fmt = request.args.get('format', 'tar')
+    if fmt not in EXPORT_FORMATS or fmt == 'dir':
+        return jsonify({'error': 'Формат экспорта: tar, tgz или jsonl'}), 400
+    mimetypes = {'tar': 'application/x-tar', 'tgz': 'application/gzip', 'jsonl': 'application/jsonl'}
+    extension = 'tar.gz' if fmt == 'tgz' else fmt
+    return Response(
+        export_stream(db, fmt), mimetype=mimetypes[fmt],
+        headers={'Content-Disposition': f'attachment; filename=knowledge_base.{extension}'}
+    )
+
+@app.route('/api/file', methods=['PUT'])
+def put_file():
+    # Тело запроса — само содержимое файла; копируется в хранилище блобов
+    # порциями с подсчётом sha256, без буферизации целиком и без multipart
+    key = request.args.get('key')
+    file_name = request.args.get('name')
+    if not key or not file_name:
+        return jsonify({'error': 'Не указаны ключ или имя файла'}), 400
+    try:
+        record = db.add_file(key, file_name, request.stream)
+        return jsonify({'status': 'success', 'digest': record['digest'], 'size': record['size']})
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке файла '{file_name}' для ключа '{key}': {e}")
+        return jsonify({'error': 'Ошибка при загрузке файла'}), 500
+
+@app.route('/api/file', methods=['GET'])
+def download_file():
+    key = request.args.get('key')
+    file_name = request.args.get('name')
+    if not key or not file_name:
+        return jsonify({'error': 'Не указаны ключ или имя файла'}), 400
+    record = db.get_files(key).get(file_name)
+    if record is None:
+        return jsonify({'error': 'Файл не найден'}), 404
+    try:
+        # ETag — sha256 содержимого. Range, If-None-Match и If-Range обрабатывает
+        # send_file; без Range файл отдаётся через wsgi.file_wrapper (sendfile
+        # в серверах, которые его поддерживают) или X-Sendfile при USE_X_SENDFILE.
+        return send_file(
+            db.file_path(record),
+            mimetype=record['mime'],
+            as_attachment=True,
+            download_name=file_name,
+            conditional=True,
+            etag=record['digest']
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при выдаче файла '{file_name}' для ключа '{key}': {e}")
+        return jsonify({'error': 'Ошибка при выдаче файла'}), 500
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,726 @@
+import base64
+import bisect
+import functools
+import heapq
+import html
+import json
+import math
+import os
+import pickle
+import re
+import threading
+import zlib
+import logging
+from array import array
+from collections import Counter, OrderedDict
+from journal import pack_record, read_records
+
+# Слово — последовательность букв (включая кириллицу), цифр и '_'
+_TOKEN = re.compile(r'\w+')
+# Часть запроса: фраза в кавычках или отдельное слово
+_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+INDEX_VERSION = 2
+# Позиция слова хранится вместе с id документа: (id << POSITION_BITS) | позиция
+POSITION_BITS = 24
+POSITION_MASK = (1 << POSITION_BITS) - 1
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+# Сколько позиций ранжированных результатов держать в кэше запросов
+RANK_CACHE_ENTRIES = 1000000
+# Сколько лучших результатов держать отсортированными для первых страниц
+RANK_HEAD_SIZE = 100
+# Нечёткие подсказки (complete, correct): слово словаря подходит, если в
+# нём есть такая доля триграмм введённого. Перестановка соседних букв
+# портит до четырёх триграмм, и у набираемого слова (без триграммы конца)
+# доля бывает меньше половины, поэтому кандидатов для дополнения отбирает
+# низкий порог, а решает число правок (TYPO_LETTERS).
+FUZZY_THRESHOLD = 0.3
+CORRECT_THRESHOLD = 0.4
+# Набираемое слово с опечаткой дополняется словом, начало которого отличается
+# от него не больше чем на одну правку на каждые TYPO_LETTERS букв
+TYPO_LETTERS = 4
+# Более короткое начало слова не дополняется по словарю: однобуквенный
+# префикс покрывает слишком большую его часть
+MIN_PREFIX = 2
+# Сколько слов словаря с общим префиксом просматривать не больше
+PREFIX_SCAN = 2000
+# Опечатки ищутся в словах не короче этого: у коротких слишком мало триграмм
+FUZZY_MIN = 4
+# Текст вложения — отдельный документ индекса с ключом
+# '<ключ страницы>\x1f<имя файла>'; в ключах узлов и именах файлов этого
+# символа нет
+ATTACHMENT_SEPARATOR = '\x1f'
+
+
+def fold(word):
+    # Приведение регистра с учётом кириллицы: 'Ёлка' и 'елка' совпадают
+    return word.casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    return [fold(match.group()) for match in _TOKEN.finditer(text)]
+
+
+def fingerprint(content):
+    return zlib.crc32(content.encode('utf-8'))
+
+
+def attachment_key(key, file_name):
+    return key + ATTACHMENT_SEPARATOR + file_name
+
+
+def split_attachment_key(doc_key):
+    # (ключ страницы, имя файла или None для самой страницы)
+    key, separator, file_name = doc_key.partition(ATTACHMENT_SEPARATOR)
+    return (key, file_name) if separator else (doc_key, None)
+
+
+def highlight_spans(text, parts):
+    # Позиции (начало, конец) всех слов текста, совпавших со словами запроса.
+    # Слова запроса ищутся буквально: текст приводится к регистру целиком, и
+    # один проход регулярного выражения из экранированных слов находит
+    # совпадения без разбора текста на слова в Python.
+    exact = frozenset(term for part in parts for term, prefix in part if not prefix)
+    prefixes = frozenset(term for part in parts for term, prefix in part if prefix)
+    if not exact and not prefixes:
+        return []
+    folded = fold(text)
+    if len(folded) == len(text):
+        return [match.span() for match in _words_pattern(exact, prefixes).finditer(folded)]
+    # Приведение регистра изменило длину текста ('ß' -> 'ss'), и смещения в
+    # нём не совпадают с исходными: слова сравниваются по одному
+    prefixes = tuple(prefixes)
+    spans = []
+    for match in _TOKEN.finditer(text):
+        word = fold(match.group())
+        if word in exact or (prefixes and word.startswith(prefixes)):
+            spans.append((match.start(), match.end()))
+    return spans
+
+
+@functools.lru_cache(maxsize=64)
+def _words_pattern(exact, prefixes):
+    # Слово целиком или начало слова. Граница слова слева проверяется после
+    # слова (просмотр назад фиксированной длины): выражение начинается со
+    # слов, и re пропускает неподходящие места текста без попыток
+    # совпадения. Длинные варианты раньше коротких.
+    alternatives = []
+    for term in sorted(exact | prefixes, key=len, reverse=True):
+        escaped = re.escape(term)
+        ending = r'\w*' if term in prefixes else r'(?!\w)'
+        alternatives.append(rf'{escaped}(?<!\w{escaped}){ending}')
+    return re.compile('|'.join(alternatives))
+
+
+def make_snippets(text, spans, count=3, width=60):
+    # Фрагменты текста вокруг совпадений: совпадения, попавшие в окно
+    # предыдущего фрагмента, подсвечиваются в нём же
+    windows = []
+    for start, end in spans:
+        if windows and start < windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], min(len(text), end + width))
+            windows[-1][2].append((start, end))
+            continue
+        if len(windows) == count:
+            break
+        windows.append([max(0, start - width), min(len(text), end + width), [(start, end)]])
+    snippets = []
+    for window_start, window_end, window_spans in windows:
+        highlights = [(start - window_start, end - window_start) for start, end in window_spans]
+        fragment = text[window_start:window_end]
+        marked = []
+        last = 0
+        for start, end in highlights:
+            marked.append(html.escape(fragment[last:start]))
+            marked.append('<mark>' + html.escape(fragment[start:end]) + '</mark>')
+            last = end
+        marked.append(html.escape(fragment[last:]))
+        snippets.append({'text': fragment, 'highlights': highlights, 'html': ''.join(marked)})
+    return snippets
+
+
+def encode_cursor(entry):
+    # Курсор — последний выданный результат (-оценка, ключ); следующая
+    # страница начинается строго после него, даже если индекс изменился
+    return base64.urlsafe_b64encode(json.dumps(list(entry), ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    negative_score, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return (float(negative_score), str(key))
+
+
+def parse_query(query):
+    # Возвращает список частей запроса; каждая часть — список (слово, префикс?).
+    # Несколько слов в части ищутся как фраза, 'слово*' — поиск по префиксу.
+    parts = []
+    for match in _QUERY.finditer(query):
+        phrase, word = match.groups()
+        prefix = False
+        if word is not None:
+            prefix = word.endswith('*')
+            phrase = word.rstrip('*')
+        terms = tokenize(phrase)
+        if terms:
+            part = [(term, False) for term in terms]
+            part[-1] = (terms[-1], prefix)
+            parts.append(part)
+    return parts
+
+
+def prefix_distance(word, term):
+    # Наименьшее число правок (вставка, удаление, замена, перестановка
+    # соседних букв), превращающих word в какое-нибудь начало term
+    before = None
+    previous = list(range(len(term) + 1))
+    for i in range(1, len(word) + 1):
+        current = [i] + [0] * len(term)
+        for j in range(1, len(term) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word[i - 1] != term[j - 1]))
+            if i > 1 and j > 1 and word[i - 1] == term[j - 2] and word[i - 2] == term[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        before, previous = previous, current
+    return min(previous)
+
+
+def trigrams(word, complete=True):
+    # Триграммы слова с границами: '  с', ' се', 'сер', ... и 'ер ' для
+    # законченного слова. У незаконченного (набираемого) слова конца нет.
+    padded = f"  {word} " if complete else f"  {word}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    # Нечёткий поиск по словарю: триграмма -> слова, в которых она есть.
+    # Списки, а не множества: большинство триграмм встречается в одном-двух
+    # словах, и пустое множество заняло бы втрое больше памяти.
+    def __init__(self, words=()):
+        self.grams = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        # Слово добавляется один раз: вызывающий добавляет только новые слова
+        for gram in trigrams(word):
+            words = self.grams.get(gram)
+            if words is None:
+                self.grams[gram] = [word]
+            else:
+                words.append(word)
+
+    def remove(self, word):
+        for gram in trigrams(word):
+            words = self.grams.get(gram)
+            if words is not None and word in words:
+                words.remove(word)
+                if not words:
+                    del self.grams[gram]
+
+    def similar(self, word, complete=True, threshold=FUZZY_THRESHOLD):
+        # {слово: доля общих триграмм} для слов словаря, похожих на word.
+        # Законченное слово не должно отличаться от кандидата по длине больше
+        # чем на две буквы; набираемое может быть началом более длинного.
+        grams = trigrams(word, complete)
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.grams.get(gram, ()))
+        needed = threshold * len(grams)
+        result = {}
+        for candidate, shared in counts.items():
+            if shared < needed or len(candidate) < len(word) - 2:
+                continue
+            if complete and len(candidate) > len(word) + 2:
+                continue
+            result[candidate] = shared / len(grams)
+        return result
+
+
+class SearchIndex:
+    # Инвертированный индекс по простому тексту страниц.
+    # Для каждого слова хранится пара массивов: docs = [id, tf, id, tf, ...]
+    # (номера документов и число вхождений) и positions — вхождения слова,
+    # закодированные вместе с id документа. Шаг 2 в docs позволяет получать
+    # id и tf срезами, а проверка фразы сводится к пересечению множеств,
+    # без циклов по документам на Python. Изменённый документ получает новый
+    # id, старый помечается удалённым и вычищается при уплотнении.
+    # Сохраняется целиком в index_file (save), а изменения после сохранения
+    # дописываются в журнал <index_file>.log и при загрузке применяются
+    # заново: после сбоя переиндексировать почти ничего не нужно.
+    # Первая запись журнала — ("log", log_id) того сохранения, к которому он
+    # относится; журнал от другого сохранения не применяется.
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.log_file = index_file + '.log'
+        self.lock = threading.Lock()
+        # Журнал изменений открывает только основной процесс (open_log),
+        # реплики его лишь читают при загрузке
+        self.log = None
+        self.log_id = 0
+        self.clear()
+
+    def clear(self):
+        self.keys = []             # id -> ключ (None для удалённых)
+        self.ids = {}              # ключ -> id
+        self.dead_ids = set()      # id удалённых документов до уплотнения
+        self.lengths = array('I')  # id -> число слов в документе
+        self.fingerprints = {}     # ключ -> crc32 страницы (digest для вложения)
+        self.postings = {}         # слово -> (docs, positions)
+        self.terms = []            # отсортированный словарь для префиксных запросов
+        self.total_length = 0      # сумма длин живых документов (для BM25)
+        self.norms = array('d')    # id -> знаменатель BM25 при norms_average
+        self.norms_average = 0.0
+        self.dirty = False
+        self.generation = 0
+        self.rank_cache = OrderedDict()
+        self.rank_cache_entries = 0
+        # Триграммы словаря для подсказок; строятся при первой подсказке
+        self.term_grams = None
+
+    def load(self):
+        try:
+            if os.path.exists(self.index_file):
+                self._load_state()
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке поискового индекса, он будет перестроен: {e}")
+            self.clear()
+            self.log_id = None
+        self._replay_log()
+
+    def _load_state(self):
+        with open(self.index_file, 'rb') as f:
+            state = pickle.load(f)
+        if state.get("version") != INDEX_VERSION:
+            raise ValueError(f"версия индекса {state.get('version')}")
+        with self.lock:
+            self.keys = state["keys"]
+            self.ids = {key: doc_id for doc_id, key in enumerate(self.keys) if key is not None}
+            self.dead_ids = {doc_id for doc_id, key in enumerate(self.keys) if key is None}
+            self.lengths = state["lengths"]
+            self.fingerprints = state["fingerprints"]
+            self.postings = state["postings"]
+            self.terms = sorted(self.postings)
+            self.term_grams = None
+            self.total_length = sum(self.lengths[doc_id] for doc_id in self.ids.values())
+            self.log_id = state.get("log_id", 0)
+        logging.info(f"Поисковый индекс загружен: документов {len(self.ids)}.")
+
+    def _replay_log(self):
+        # Применяет журнал изменений к загруженному индексу. Журнал не
+        # изменяется: его может в это время дописывать основной процесс.
+        # Оборванная запись в конце (сбой или запись ещё идёт) пропускается.
+        if self.log_id is None or not os.path.exists(self.log_file):
+            return
+        try:
+            with open(self.log_file, 'rb') as f:
+                records = read_records(f)
+                first = next(records, None)
+                if first is None or first[0] != ("log", self.log_id):
+                    return
+                replayed = 0
+                for (op, *args), _ in records:
+                    getattr(self, op)(*args)
+                    replayed += 1
+        except Exception as e:
+            logging.error(f"Ошибка при чтении журнала поискового индекса: {e}")
+            return
+        if replayed:
+            logging.info(f"Из журнала поискового индекса применено изменений: {replayed}.")
+
+    def open_log(self):
+        # Начинает дописывать изменения в журнал. Журнал текущего сохранения
+        # продолжается (повреждённый хвост отрезается), любой другой — заменяется.
+        with self.lock:
+            try:
+                if self.log_id is not None and os.path.exists(self.log_file):
+                    with open(self.log_file, 'rb+') as f:
+                        good = 0
+                        records = read_records(f)
+                        first = next(records, None)
+                        if first is not None and first[0] == ("log", self.log_id):
+                            good = first[1]
+                            for _, good in records:
+                                pass
+                            f.truncate(good)
+                    if good:
+                        self.log = open(self.log_file, 'ab')
+                        return
+                self._start_log(self.log_id or 0)
+            except OSError as e:
+                logging.error(f"Не удалось открыть журнал поискового индекса: {e}")
+
+    def _start_log(self, log_id):
+        # Под self.lock
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        self.log = open(self.log_file, 'wb')
+        self.log.write(pack_record(("log", log_id)))
+        self.log.flush()
+        self.log_id = log_id
+
+    def _append_log(self, *record):
+        # Под self.lock. Запись сразу уходит в ОС: падение процесса её не
+        # теряет. Если журнал писать не удалось, изменение всё равно попадёт
+        # в индекс при следующем сохранении.
+        if self.log is None:
+            return
+        try:
+            self.log.write(pack_record(record))
+            self.log.flush()
+        except OSError as e:
+            logging.error(f"Ошибка записи журнала поискового индекса: {e}")
+            self.log.close()
+            self.log = None
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_file = self.index_file + '.tmp'
+            log_id = (self.log_id or 0) + 1
+            try:
+                with open(tmp_file, 'wb') as f:
+                    pickle.dump({
+                        "version": INDEX_VERSION,
+                        "keys": self.keys,
+                        "lengths": self.lengths,
+                        "fingerprints": self.fingerprints,
+                        "postings": self.postings,
+                        "log_id": log_id
+                    }, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_file, self.index_file)
+                self.dirty = False
+                self.log_id = log_id
+                logging.info("Поисковый индекс сохранён.")
+                # Всё записанное вошло в сохранение: журнал начинается заново
+                if self.log is not None:
+                    self._start_log(log_id)
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении поискового индекса: {e}")
+
+    def log_size(self):
+        # Размер журнала изменений в байтах (0, если журнал не ведётся)
+        with self.lock:
+            return self.log.tell() if self.log is not None else 0
+
+    def close(self):
+        self.save()
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+    def fingerprint(self, key):
+        return self.fingerprints.get(key)
+
+    def indexed_keys(self):
+        with self.lock:
+            return list(self.ids)
+
+    def update(self, key, text, fingerprint):
+        with self.lock:
+            self._remove(key)
+            doc_id = len(self.keys)
+            self.keys.append(key)
+            self.ids[key] = doc_id
+            self.fingerprints[key] = fingerprint
+            positions = {}
+            length = 0
+            for length, match in enumerate(_TOKEN.finditer(text), 1):
+                positions.setdefault(fold(match.group()), []).append(length - 1)
+            self.lengths.append(length)
+            self.total_length += length
+            for term, term_positions in positions.items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = (array('I'), array('Q'))
+                    bisect.insort(self.terms, term)
+                    if self.term_grams is not None:
+                        self.term_grams.add(term)
+                posting[0].append(doc_id)
+                posting[0].append(len(term_positions))
+                base = doc_id << POSITION_BITS
+                posting[1].extend(base | position for position in term_positions if position <= POSITION_MASK)
+            self._append_log("update", key, text, fingerprint)
+            self.dirty = True
+            self.generation += 1
+            self._maybe_compact()
+
+    def remove(self, key):
+        with self.lock:
+            if self._remove(key):
+                self._append_log("remove", key)
+                self.dirty = True
+                self.generation += 1
+                self._maybe_compact()
+
+    def rename(self, old_key, new_key):
+        # Переименование ключа без переиндексации текста
+        with self.lock:
+            doc_id = self.ids.pop(old_key, None)
+            if doc_id is None:
+                return
+            self._remove(new_key)
+            self.ids[new_key] = doc_id
+            self.keys[doc_id] = new_key
+            self.fingerprints[new_key] = self.fingerprints.pop(old_key)
+            self._append_log("rename", old_key, new_key)
+            self.dirty = True
+            self.generation += 1
+
+    def _remove(self, key):
+        doc_id = self.ids.pop(key, None)
+        if doc_id is None:
+            return False
+        self.keys[doc_id] = None
+        self.dead_ids.add(doc_id)
+        self.fingerprints.pop(key, None)
+        self.total_length -= self.lengths[doc_id]
+        return True
+
+    def _maybe_compact(self):
+        if len(self.dead_ids) > 1000 and len(self.dead_ids) * 4 > len(self.keys):
+            self._compact()
+
+    def _compact(self):
+        # Перенумеровываем живые документы и вычищаем удалённые из всех списков
+        remap = {}
+        keys = []
+        lengths = array('I')
+        for doc_id, key in enumerate(self.keys):
+            if key is not None:
+                remap[doc_id] = len(keys)
+                keys.append(key)
+                lengths.append(self.lengths[doc_id])
+        postings = {}
+        for term, (docs, positions) in self.postings.items():
+            new_docs = array('I')
+            for i in range(0, len(docs), 2):
+                new_id = remap.get(docs[i])
+                if new_id is not None:
+                    new_docs.append(new_id)
+                    new_docs.append(docs[i + 1])
+            new_positions = array('Q')
+            for encoded in positions:
+                new_id = remap.get(encoded >> POSITION_BITS)
+                if new_id is not None:
+                    new_positions.append((new_id << POSITION_BITS) | (encoded & POSITION_MASK))
+            if new_docs:
+                postings[term] = (new_docs, new_positions)
+        self.keys = keys
+        self.ids = {key: doc_id for doc_id, key in enumerate(keys)}
+        self.dead_ids = set()
+        self.lengths = lengths
+        self.postings = postings
+        self.terms = sorted(postings)
+        self.term_grams = None
+        self.norms = array('d')
+        self.generation += 1
+        logging.info(f"Поисковый индекс уплотнён: документов {len(keys)}.")
+
+    def _expand(self, term, prefix):
+        # Слово запроса или все слова словаря с данным префиксом
+        if prefix:
+            start = bisect.bisect_left(self.terms, term)
+            end = bisect.bisect_left(self.terms, term + '\uffff')
+            return self.terms[start:end]
+        return [term] if term in self.postings else []
+
+    def complete(self, word, limit=10):
+        # Слова словаря для набираемого слова: начинающиеся с него — по числу
+        # страниц, затем начинающиеся почти с него (опечатки) — по числу
+        # правок, доле общих триграмм и числу страниц
+        if len(word) < MIN_PREFIX:
+            return []
+        with self.lock:
+            start = bisect.bisect_left(self.terms, word)
+            prefixed = []
+            for term in self.terms[start:start + PREFIX_SCAN]:
+                if not term.startswith(word):
+                    break
+                prefixed.append(term)
+            result = heapq.nlargest(limit, prefixed, key=self._frequency)
+            if len(result) < limit and len(word) >= FUZZY_MIN:
+                similar = self._term_grams().similar(word, complete=False)
+                for term in prefixed:
+                    similar.pop(term, None)
+                typos = {}
+                for term in similar:
+                    distance = prefix_distance(word, term)
+                    if distance <= len(word) // TYPO_LETTERS:
+                        typos[term] = distance
+                fuzzy = sorted(typos, key=lambda term: (typos[term], -similar[term], -self._frequency(term)))
+                result.extend(fuzzy[:limit - len(result)])
+            return result
+
+    def correct(self, word):
+        # Законченное слово запроса или самое похожее слово словаря (None)
+        with self.lock:
+            if word in self.postings:
+                return word
+            if len(word) < FUZZY_MIN:
+                return None
+            similar = self._term_grams().similar(word, threshold=CORRECT_THRESHOLD)
+            return max(similar, key=lambda term: (similar[term], self._frequency(term)), default=None)
+
+    def prepare_complete(self):
+        # Строит триграммы словаря заранее, чтобы первая подсказка не ждала
+        with self.lock:
+            self._term_grams()
+
+    def _frequency(self, term):
+        # Число страниц со словом (удалённые до уплотнения тоже считаются)
+        return len(self.postings[term][0]) // 2
+
+    def _term_grams(self):
+        if self.term_grams is None:
+            self.term_grams = TrigramIndex(self.terms)
+        return self.term_grams
+
+    def _phrase(self, part):
+        # id документов, где слова части идут подряд. Вхождение i-го слова
+        # сдвигается на i назад, и начала фразы — пересечение этих множеств.
+        # Множество строится только для самого редкого слова, остальные
+        # лишь проверяются на вхождение в него.
+        shifted = []
+        for offset, (term, prefix) in enumerate(part):
+            lists = [self.postings[matched_term][1] for matched_term in self._expand(term, prefix)]
+            shifted.append((sum(map(len, lists)), offset, lists))
+        shifted.sort(key=lambda entry: entry[0])
+        starts = None
+        for _, offset, lists in shifted:
+            matched = set()
+            for positions in lists:
+                values = map((-offset).__add__, positions) if offset else positions
+                if starts is None:
+                    matched.update(values)
+                else:
+                    matched.update(starts.intersection(values))
+            starts = matched
+            if not starts:
+                return set()
+        return {encoded >> POSITION_BITS for encoded in starts} - self.dead_ids
+
+    def _frequencies(self, term, prefix):
+        # Возвращает {id: tf} по живым документам без декодирования позиций
+        frequencies = None
+        for matched_term in self._expand(term, prefix):
+            docs = self.postings[matched_term][0]
+            if frequencies is None:
+                frequencies = dict(zip(docs[0::2], docs[1::2]))
+            else:
+                for doc_id, count in zip(docs[0::2], docs[1::2]):
+                    frequencies[doc_id] = frequencies.get(doc_id, 0) + count
+        if frequencies is None:
+            return {}
+        for doc_id in self.dead_ids.intersection(frequencies):
+            del frequencies[doc_id]
+        return frequencies
+
+    def _part_cost(self, part):
+        return min(sum(len(self.postings[term][0]) for term in self._expand(term, prefix)) for term, prefix in part)
+
+    def _update_norms(self):
+        # Длина документа в BM25 нормируется на среднюю; пересчитываем
+        # знаменатели, только когда средняя сдвинулась больше чем на 1%
+        average = self.total_length / len(self.ids) or 1.0
+        if abs(average - self.norms_average) > 0.01 * average:
+            self.norms = array('d', (K1 * (1 - B + B * length / average) for length in self.lengths))
+            self.norms_average = average
+        elif len(self.norms) < len(self.lengths):
+            average = self.norms_average
+            self.norms.extend(K1 * (1 - B + B * length / average) for length in self.lengths[len(self.norms):])
+
+    def _ranking(self, query, key_prefix):
+        # Результат ранжирования из кэша или заново. entries — все найденные
+        # (-оценка, ключ) без сортировки, head — отсортированные лучшие;
+        # полная сортировка откладывается до запроса дальних страниц.
+        cache_key = (query, key_prefix)
+        ranking = self.rank_cache.get(cache_key)
+        if ranking is not None and ranking["generation"] == self.generation:
+            self.rank_cache.move_to_end(cache_key)
+            return ranking
+        if ranking is not None:
+            self.rank_cache_entries -= len(ranking["entries"])
+        entries = self._rank(parse_query(query), key_prefix)
+        ranking = {
+            "generation": self.generation,
+            "entries": entries,
+            "sorted": False,
+            "head": heapq.nsmallest(RANK_HEAD_SIZE, entries)
+        }
+        self.rank_cache[cache_key] = ranking
+        self.rank_cache_entries += len(entries)
+        while self.rank_cache_entries > RANK_CACHE_ENTRIES and len(self.rank_cache) > 1:
+            _, evicted = self.rank_cache.popitem(last=False)
+            self.rank_cache_entries -= len(evicted["entries"])
+        return ranking
+
+    def _sorted_entries(self, ranking):
+        if not ranking["sorted"]:
+            ranking["entries"].sort()
+            ranking["sorted"] = True
+        return ranking["entries"]
+
+    def rank(self, query, key_prefix=None):
+        # Все документы, содержащие все части запроса, по убыванию BM25:
+        # отсортированный список (-оценка, ключ)
+        with self.lock:
+            return self._sorted_entries(self._ranking(query, key_prefix))
+
+    def page(self, query, key_prefix=None, after=None, limit=20):
+        # Страница результатов строго после записи after (-оценка, ключ).
+        # Возвращает (страница, всего найдено).
+        with self.lock:
+            ranking = self._ranking(query, key_prefix)
+            total = len(ranking["entries"])
+            head = ranking["head"]
+            start = bisect.bisect_right(head, after) if after is not None else 0
+            if start + limit <= len(head) or len(head) == total:
+                return head[start:start + limit], total
+            entries = self._sorted_entries(ranking)
+            start = bisect.bisect_right(entries, after) if after is not None else 0
+            return entries[start:start + limit], total
+
+    def _rank(self, parts, key_prefix):
+        if not parts or not self.ids:
+            return []
+        documents = len(self.ids)
+        scored = []
+        candidates = None
+        # Пересечение по частотам идёт на уровне множеств; позиции нужны
+        # только для проверки фраз, и только у оставшихся кандидатов
+        for part in sorted(parts, key=self._part_cost):
+            for term, prefix in part:
+                frequencies = self._frequencies(term, prefix)
+                scored.append((len(frequencies), frequencies))
+                candidates = frequencies.keys() if candidates is None else candidates & frequencies.keys()
+                if not candidates:
+                    return []
+            if len(part) > 1:
+                candidates = candidates & self._phrase(part)
+                if not candidates:
+                    return []
+        if key_prefix:
+            key_prefix = key_prefix.rstrip('/')
+            # Вложения узла относятся к нему самому
+            nested = (key_prefix + '/', key_prefix + ATTACHMENT_SEPARATOR)
+            candidates = {
+                doc_id for doc_id in candidates
+                if self.keys[doc_id] == key_prefix or self.keys[doc_id].startswith(nested)
+            }
+        self._update_norms()
+        norms = self.norms
+        (df, frequencies), rest = scored[0], scored[1:]
+        weight = math.log(1 + (documents - df + 0.5) / (df + 0.5)) * (K1 + 1)
+        scores = {doc_id: weight * frequencies[doc_id] / (frequencies[doc_id] + norms[doc_id]) for doc_id in candidates}
+        for df, frequencies in rest:
+            weight = math.log(1 + (documents - df + 0.5) / (df + 0.5)) * (K1 + 1)
+            for doc_id in scores:
+                tf = frequencies[doc_id]
+                scores[doc_id] += weight * tf / (tf + norms[doc_id])
+        keys = self.keys
+        return [(-score, keys[doc_id]) for doc_id, score in scores.items()]
@@ -0,0 +1,142 @@
+import threading
+import time
+import logging
+
+# Первая порция результатов — маленькая, чтобы список появился сразу;
+# следующие крупнее, чтобы реже перерисовывать список
+FIRST_BATCH = 10
+BATCH_SIZE = 50
+# Прогресс сообщается не чаще, чем раз в столько секунд
+PROGRESS_INTERVAL = 0.1
+
+
+class SearchExecutor:
+    # Поиск в отдельном потоке без Qt: результаты отдаются порциями по
+    # страницам ранжирования (Database.search_page с курсором), так что
+    # первая порция не ждёт фрагментов для всех найденных страниц. Выполняется
+    # только последний запрос: новый submit() отменяет текущий, и тот
+    # останавливается на границе порции. Обратные вызовы приходят из потока
+    # поиска; для GUI их нужно переправить в свой поток (сигналом Qt).
+    # В том же потоке считаются подсказки при наборе (suggest): они идут
+    # раньше и между порциями поиска, так что GUI не ждёт ни блокировок
+    # базы, ни ранжирования.
+
+    def __init__(self, db, first_batch=FIRST_BATCH, batch_size=BATCH_SIZE, progress_interval=PROGRESS_INTERVAL):
+        self.db = db
+        self.first_batch = first_batch
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        # Номер последнего запроса; выполняемый запрос с другим номером отменён
+        self.current = 0
+        self.pending = None
+        # То же для подсказок: номер последней и ожидающая
+        self.suggest_current = 0
+        self.pending_suggest = None
+        self.closed = False
+        self.worker = threading.Thread(target=self._run, name='search', daemon=True)
+        self.worker.start()
+
+    def submit(self, query, on_results, on_progress=None, on_done=None):
+        # on_results(номер, [(ключ, имя вложения или None, фрагмент)]) — очередная порция;
+        # on_progress(номер, выдано, всего) — не чаще progress_interval;
+        # on_done(номер, всего) — запрос выполнен (у отменённого не вызывается).
+        # Возвращает номер запроса.
+        with self.lock:
+            self.current += 1
+            self.pending = (self.current, query, on_results, on_progress, on_done)
+            self.changed.notify_all()
+            return self.current
+
+    def suggest(self, query, on_suggestions):
+        # on_suggestions(номер, подсказки Database.suggest). Ожидающая
+        # подсказка заменяется новой, у заменённой обратный вызов не
+        # вызывается. Возвращает номер.
+        with self.lock:
+            self.suggest_current += 1
+            self.pending_suggest = (self.suggest_current, query, on_suggestions)
+            self.changed.notify_all()
+            return self.suggest_current
+
+    def cancel(self):
+        # Отменяет текущий и ожидающий запросы
+        with self.lock:
+            self.current += 1
+            self.pending = None
+
+    def is_current(self, search_id):
+        return search_id == self.current
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.current += 1
+            self.pending = None
+            self.pending_suggest = None
+            self.changed.notify_all()
+        self.worker.join()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while self.pending is None and self.pending_suggest is None and not self.closed:
+                    self.changed.wait()
+                if self.closed:
+                    return
+                task, self.pending = self.pending, None
+            self._suggest()
+            if task is None:
+                continue
+            try:
+                self._search(*task)
+            except Exception as e:
+                logging.error(f"Ошибка поиска '{task[1]}': {e}")
+
+    def _suggest(self):
+        with self.lock:
+            task, self.pending_suggest = self.pending_suggest, None
+        if task is None:
+            return
+        suggest_id, query, on_suggestions = task
+        try:
+            suggestions = self.db.suggest(query)
+        except Exception as e:
+            logging.error(f"Ошибка подсказок для '{query}': {e}")
+            return
+        if suggest_id == self.suggest_current:
+            on_suggestions(suggest_id, suggestions)
+
+    def _search(self, search_id, query, on_results, on_progress, on_done):
+        cursor = None
+        delivered = 0
+        limit = self.first_batch
+        reported = time.monotonic()
+        while True:
+            self._suggest()
+            if not self.is_current(search_id):
+                logging.info(f"Поиск '{query}' отменён после {delivered} результатов.")
+                return
+            page = self.db.search_page(query, limit=limit, cursor=cursor, snippets=1)
+            batch = [
+                (result['key'], result['file'], result['snippets'][0]['text'] if result['snippets'] else '')
+                for result in page['results']
+            ]
+            total = page['total']
+            if batch and self.is_current(search_id):
+                on_results(search_id, batch)
+            delivered += len(batch)
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+            limit = self.batch_size
+            now = time.monotonic()
+            if on_progress is not None and now - reported >= self.progress_interval:
+                reported = now
+                on_progress(search_id, delivered, total)
+        if not self.is_current(search_id):
+            return
+        if on_progress is not None:
+            on_progress(search_id, delivered, total)
+        if on_done is not None:
+            on_done(search_id, delivered)
@@ -1,25 +1,58 @@
 from flask import Flask, jsonify, request
 from database import Database
+from httpcache import ResponseCache, cached_json
+import atexit
 
 app = Flask(__name__)
 db = Database('data.db')
+# Сохраняем поисковый индекс при остановке сервера
+atexit.register(db.close)
+cache = ResponseCache()
 
 @app.route('/sections', methods=['GET'])
 def get_sections():
-    sections = db.get_sections()
-    return jsonify(sections)
+    return cached_json(cache, request, ('sections',), db.version('tree'), db.get_sections)
+
+@app.route('/tree', methods=['GET'])
+def get_tree():
+    key = request.args.get('key', '')
+    if key and not db.has_node(key):
+        return jsonify({'error': 'Узел не найден'}), 404
+    return cached_json(
+        cache, request, ('tree', key), db.version('tree'),
+        lambda: {'key': key, 'children': db.get_tree(key) or []}
+    )
 
 @app.route('/content', methods=['GET'])
 def get_content():
     key = request.args.get('key')
-    content = db.load_content(key)
-    return jsonify({'key': key, 'content': content})
+    rev = request.args.get('rev')
+    if rev:
+        try:
+            rev = int(rev)
+        except ValueError:
+            return jsonify({'error': 'Некорректный номер ревизии'}), 400
+        content = db.load_revision(key, rev)
+        if content is None:
+            return jsonify({'error': 'Ревизия не найдена'}), 404
+        return jsonify({'key': key, 'rev': rev, 'content': content})
+    if request.args.get('format') == 'text':
+        return cached_json(
+            cache, request, ('content', key, 'text'), db.version('content', key),
+            lambda: {'key': key, 'text': db.load_text(key)}
+        )
+    return cached_json(
+        cache, request, ('content', key), db.version('content', key),
+        lambda: {'key': key, 'content': db.load_content(key)}
+    )
 
 @app.route('/content', methods=['POST'])
 def save_content():
     data = request.json
     key = data.get('key')
     content = data.get('content')
+    if not key or not isinstance(content, str):
+        return jsonify({'error': 'Не указаны ключ или содержимое'}), 400
     db.save_content(key, content)
     return jsonify({'status': 'success'})
 
@@ -0,0 +1,343 @@
+import codecs
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+from collections.abc import MutableMapping
+from nodestore import NodeStore
+from pagecodec import RAW, PageCodec
+
+# Формат файла данных:
+#   MAGIC | тела страниц подряд | pickle оглавления | трейлер
+# Оглавление — {"tree", "files", "pages": {ключ: (смещение, длина, crc32)}, "wal_seq", "codec"},
+# где tree — NodeStore.dump(), codec — PageCodec.state(): чем сжаты тела
+# страниц (длина — сжатая, crc32 — от страницы в UTF-8 до сжатия),
+# трейлер — смещение и длина оглавления и ещё раз MAGIC. При открытии читается
+# только оглавление, тела страниц отображаются в память и распаковываются при
+# первом обращении. В снимках KBSNAP1 тела не сжаты и codec нет.
+MAGIC = b'KBSNAP2\n'
+MAGICS = (MAGIC, b'KBSNAP1\n')
+_TRAILER = struct.Struct('<QQ8s')
+# Размер порции при копировании тел страниц в новый снимок
+_COPY_CHUNK = 1024 * 1024
+# Нет записи (в журнале отката PageStore)
+_MISSING = object()
+
+
+class PageStore(MutableMapping):
+    # Словарь ключ -> HTML страницы. Страницы из снимка лежат сжатыми
+    # (codec) в отображённом файле (directory) до первого чтения; прочитанные
+    # и изменённые — в pages, пока очередной снимок не вернёт их в directory.
+
+    def __init__(self, pages=None, buffer=None, directory=None, codec=RAW):
+        self.lock = threading.Lock()
+        self.pages = dict(pages or {})
+        self.buffer = buffer
+        self.directory = dict(directory or {})
+        self.codec = codec
+        # False — прочитанные страницы не запоминаются (реплики: память
+        # процесса не растёт, тела страниц общие через кэш ОС)
+        self.cache = True
+        # Журнал отката между begin() и end(): (ключ, прежнее значение в
+        # pages, прежняя запись в directory) в порядке изменений
+        self.undo = None
+
+    def __getitem__(self, key):
+        try:
+            return self.pages[key]
+        except KeyError:
+            pass
+        with self.lock:
+            if key in self.pages:
+                return self.pages[key]
+            value = self._decode(self.directory[key])
+            if not self.cache:
+                return value
+            # Декодированная страница запоминается до следующего снимка:
+            # повторные чтения возвращают тот же объект
+            self.pages[key] = value
+            del self.directory[key]
+            return value
+
+    def _decode(self, entry):
+        offset, length, _ = entry
+        return self.codec.decode(self.buffer[offset:offset + length]).decode('utf-8')
+
+    def chunks(self, key, size):
+        # Страница порциями текста (около size символов) без запоминания.
+        # Тело из снимка копируется сразу (оно сжато и невелико, а файл могут
+        # переотобразить при сворачивании журнала), распаковывается — по мере
+        # чтения порций. KeyError, если страницы нет.
+        with self.lock:
+            value = self.pages.get(key)
+            if value is None:
+                offset, length, _ = self.directory[key]
+                data = bytes(self.buffer[offset:offset + length])
+                codec = self.codec
+        if value is not None:
+            return (value[start:start + size] for start in range(0, len(value), size))
+        return _text_chunks(codec.decode_chunks(data, size))
+
+    def peek(self, key):
+        # Чтение без запоминания (для сборки словаря по всему корпусу)
+        with self.lock:
+            if key in self.pages:
+                return self.pages[key]
+            return self._decode(self.directory[key])
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self._remember(key)
+            self.pages[key] = value
+            self.directory.pop(key, None)
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._remember(key)
+            found = self.pages.pop(key, None) is not None
+            found = self.directory.pop(key, None) is not None or found
+        if not found:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.pages or key in self.directory
+
+    def __iter__(self):
+        with self.lock:
+            keys = list(self.pages) + list(self.directory)
+        return iter(keys)
+
+    def __len__(self):
+        return len(self.pages) + len(self.directory)
+
+    def rename(self, old_key, new_key):
+        # Переносит страницу под новый ключ, не декодируя её
+        with self.lock:
+            self._remember(old_key)
+            self._remember(new_key)
+            if old_key in self.pages:
+                self.directory.pop(new_key, None)
+                self.pages[new_key] = self.pages.pop(old_key)
+            elif old_key in self.directory:
+                self.pages.pop(new_key, None)
+                self.directory[new_key] = self.directory.pop(old_key)
+
+    def begin(self):
+        # Точка отката: изменения до end() можно отменить rollback()
+        with self.lock:
+            self.undo = []
+
+    def end(self):
+        with self.lock:
+            self.undo = None
+
+    def rollback(self):
+        # Возвращает страницы к состоянию на begin(); возвращает затронутые ключи
+        with self.lock:
+            keys = set()
+            for key, value, entry in reversed(self.undo):
+                self.pages.pop(key, None)
+                self.directory.pop(key, None)
+                if value is not _MISSING:
+                    self.pages[key] = value
+                if entry is not _MISSING:
+                    self.directory[key] = entry
+                keys.add(key)
+            self.undo = None
+            return keys
+
+    def _remember(self, key):
+        # Под self.lock
+        if self.undo is not None:
+            self.undo.append((key, self.pages.get(key, _MISSING), self.directory.get(key, _MISSING)))
+
+    def crc32(self, key):
+        # crc32 тела страницы в UTF-8 (то же, что search_index.fingerprint);
+        # для ещё не прочитанных страниц берётся из оглавления без декодирования
+        with self.lock:
+            entry = self.directory.get(key)
+            if entry is not None:
+                return entry[2]
+        return zlib.crc32(self[key].encode('utf-8'))
+
+    def loaded(self):
+        return len(self.pages)
+
+    def snapshot(self):
+        # Неизменяемая копия для записи снимка: ссылки на строки и на тот же
+        # отображённый файл, без декодирования страниц
+        with self.lock:
+            return PageStore(self.pages, self.buffer, self.directory, self.codec)
+
+    def detach(self, path):
+        # Копия только для чтения со своим отображением path — файла, из
+        # которого читается этот PageStore. Остаётся читаемой, даже если базу
+        # тем временем свернут в новый снимок (прежний файл живёт, пока
+        # отображён). Прочитанные страницы не запоминаются.
+        with self.lock:
+            buffer = map_file(path) if self.buffer is not None else None
+            store = PageStore(self.pages, buffer, self.directory, self.codec)
+        store.cache = False
+        return store
+
+    def remap(self, tmp_file, db_file, snapshot, pages, codec):
+        # Подменяет файл данных новым снимком и переводит ещё не прочитанные
+        # страницы на смещения в нём. snapshot — копия, по которой записан
+        # снимок, pages — его оглавление, codec — чем в нём сжаты страницы.
+        # Страницу могли переименовать после снятия копии, поэтому соответствие
+        # ищется по записи в старом оглавлении, а для страниц из памяти — по
+        # самому объекту строки. Страницы из памяти, не изменённые с момента
+        # копии, отпускаются: теперь они читаются из снимка.
+        # Отображение старого файла закрывается до замены, чтобы os.replace
+        # работал и в Windows.
+        moved = {entry: pages[key] for key, entry in snapshot.directory.items()}
+        written = {id(value): pages[key] for key, value in snapshot.pages.items()}
+        with self.lock:
+            self.release()
+            os.replace(tmp_file, db_file)
+            self.buffer = map_file(db_file)
+            self.codec = codec
+            directory = {key: moved[entry] for key, entry in self.directory.items()}
+            released = [key for key, value in self.pages.items() if id(value) in written]
+            for key in released:
+                directory[key] = written[id(self.pages[key])]
+            # Сначала оглавление, потом удаление из pages: читатель без
+            # блокировки всегда находит страницу хотя бы в одном из них
+            self.directory = directory
+            for key in released:
+                del self.pages[key]
+            # Записи журнала отката тоже переходят на новый файл: копия для
+            # снимка снята до начала пачки, так что все они в ней есть
+            if self.undo is not None:
+                self.undo = [
+                    (key, value, entry if entry is _MISSING else moved[entry])
+                    for key, value, entry in self.undo
+                ]
+
+    def rebase(self, other):
+        # Реплика: переводит страницы на более новый снимок той же базы
+        # (other — его PageStore). Страница берётся из снимка, если её crc32
+        # там совпадает с текущим; остальные (изменённые позже) остаются в
+        # памяти. Отображение прежнего файла закрывается.
+        with self.lock:
+            directory = {}
+            pages = {}
+            for key, entry in self.directory.items():
+                target = other.directory.get(key)
+                if target is not None and target[2] == entry[2]:
+                    directory[key] = target
+                else:
+                    pages[key] = self._decode(entry)
+            for key, value in self.pages.items():
+                target = other.directory.get(key)
+                if target is not None and target[2] == zlib.crc32(value.encode('utf-8')):
+                    directory[key] = target
+                else:
+                    pages[key] = value
+            self.release()
+            self.buffer = other.buffer
+            self.codec = other.codec
+            # Как в remap: сначала оглавление, потом страницы в памяти
+            self.directory = directory
+            self.pages = pages
+
+    def release(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+
+def _text_chunks(chunks):
+    # Порции UTF-8 -> порции текста; символ на границе порций не рвётся
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def map_file(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def is_snapshot(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) in MAGICS
+
+
+def read_snapshot(path):
+    # Возвращает (data, wal_seq); data["content"] — PageStore поверх файла
+    buffer = map_file(path)
+    try:
+        if buffer[:len(MAGIC)] not in MAGICS or len(buffer) < len(MAGIC) + _TRAILER.size:
+            raise ValueError(f"'{path}' не является снимком базы")
+        offset, length, magic = _TRAILER.unpack(buffer[-_TRAILER.size:])
+        if magic != buffer[:len(MAGIC)]:
+            raise ValueError(f"Снимок '{path}' обрезан")
+        header = pickle.loads(buffer[offset:offset + length])
+    except Exception:
+        buffer.close()
+        raise
+    if "tree" in header:
+        tree = NodeStore.load(header["tree"])
+    else:
+        tree = NodeStore.from_sections(header["sections"])
+    data = {
+        "tree": tree,
+        "content": PageStore(buffer=buffer, directory=header["pages"], codec=PageCodec.from_state(header.get("codec"))),
+        "files": header["files"]
+    }
+    return data, header["wal_seq"]
+
+
+def write_snapshot(path, data, wal_seq=0, codec=None):
+    # Пишет снимок в path с fsync и возвращает оглавление страниц.
+    # data["content"] — PageStore (обычно snapshot()) или обычный словарь.
+    # codec — чем сжимать страницы; по умолчанию тем же, что в исходном снимке.
+    content = data["content"]
+    if not isinstance(content, PageStore):
+        content = PageStore(content)
+    if codec is None:
+        codec = content.codec
+    pages = {}
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        offset = len(MAGIC)
+        for key, value in content.pages.items():
+            body = value.encode('utf-8')
+            crc = zlib.crc32(body)
+            body = codec.encode(body)
+            f.write(body)
+            pages[key] = (offset, len(body), crc)
+            offset += len(body)
+        same_codec = codec.same_as(content.codec)
+        for key, (source, length, crc) in content.directory.items():
+            if same_codec:
+                # Непрочитанные страницы копируются байтами из старого снимка
+                for start in range(source, source + length, _COPY_CHUNK):
+                    f.write(content.buffer[start:min(start + _COPY_CHUNK, source + length)])
+            else:
+                # Сменился словарь или старый снимок без сжатия: перекодируем
+                body = codec.encode(content.codec.decode(content.buffer[source:source + length]))
+                f.write(body)
+                length = len(body)
+            pages[key] = (offset, length, crc)
+            offset += length
+        header = pickle.dumps({
+            "tree": data["tree"],
+            "files": data["files"],
+            "pages": pages,
+            "wal_seq": wal_seq,
+            "codec": codec.state()
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+        f.write(header)
+        f.write(_TRAILER.pack(offset, len(header), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    return pages
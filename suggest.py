@@ -0,0 +1,108 @@
+import bisect
+import heapq
+import threading
+from search_index import FUZZY_MIN, MIN_PREFIX, PREFIX_SCAN, TrigramIndex, tokenize
+
+# Подсказки при наборе в строке поиска: названия узлов дерева (TitleIndex)
+# и дополнения последнего слова запроса по словарю страниц
+# (SearchIndex.complete). Опечатки прощаются через триграммы
+# (search_index.TrigramIndex).
+
+
+class TitleIndex:
+    # Слова названий узлов дерева. Узлы хранятся по id NodeStore: id не
+    # меняется при переносе, поэтому перенос или переименование узла
+    # переиндексирует только его собственное имя. Удалённые узлы
+    # вычищаются при поиске, когда их id перестаёт находиться в дереве.
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.lock = threading.Lock()
+        self.names = {}        # id узла -> слова имени
+        self.nodes = {}        # слово -> id узлов
+        self.words = []        # отсортированный словарь для префиксов
+        self.fuzzy = TrigramIndex()
+        for node_id, _, name in tree.dump():
+            self.add(node_id, name)
+
+    def add(self, node_id, name):
+        with self.lock:
+            self._remove(node_id)
+            words = tuple(dict.fromkeys(tokenize(name)))
+            self.names[node_id] = words
+            for word in words:
+                ids = self.nodes.get(word)
+                if ids is None:
+                    ids = self.nodes[word] = set()
+                    bisect.insort(self.words, word)
+                    self.fuzzy.add(word)
+                ids.add(node_id)
+
+    def remove(self, node_id):
+        with self.lock:
+            self._remove(node_id)
+
+    def _remove(self, node_id):
+        for word in self.names.pop(node_id, ()):
+            ids = self.nodes[word]
+            ids.discard(node_id)
+            if not ids:
+                del self.nodes[word]
+                del self.words[bisect.bisect_left(self.words, word)]
+                self.fuzzy.remove(word)
+
+    def _matches(self, word, complete):
+        # {id узла: оценка} для одного слова запроса: точное совпадение — 2,
+        # начало слова — 1, похожее слово — доля общих триграмм. Оценки
+        # записываются по возрастанию, так что у узла остаётся лучшая.
+        scores = {}
+        if len(word) >= FUZZY_MIN:
+            similar = self.fuzzy.similar(word, complete)
+            for candidate in sorted(similar, key=similar.get):
+                if complete or not candidate.startswith(word):
+                    scores.update(dict.fromkeys(self.nodes[candidate], similar[candidate]))
+        if not complete and len(word) >= MIN_PREFIX:
+            start = bisect.bisect_left(self.words, word)
+            for candidate in self.words[start:start + PREFIX_SCAN]:
+                if not candidate.startswith(word):
+                    break
+                scores.update(dict.fromkeys(self.nodes[candidate], 1.0))
+        scores.update(dict.fromkeys(self.nodes.get(word, ()), 2.0))
+        return scores
+
+    def lookup(self, query, limit=10):
+        # Ключи узлов, в имени которых есть все слова запроса (набираемое —
+        # как начало слова), лучшие первыми
+        done, partial = split_query(query)
+        words = [(word, True) for word in done] + ([(partial, False)] if partial else [])
+        if not words:
+            return []
+        with self.lock:
+            # Пересечение начинается с самого короткого списка совпадений
+            matches = sorted((self._matches(word, complete) for word, complete in words), key=len)
+            total = matches[0]
+            for scores in matches[1:]:
+                if not total:
+                    break
+                total = {node_id: score + scores[node_id] for node_id, score in total.items() if node_id in scores}
+            # Лучшие по оценке, при равной — в порядке совпадений; id
+            # удалённых узлов вычищаются, и выборка повторяется
+            result = []
+            while total and len(result) < limit:
+                ranked = heapq.nlargest(limit - len(result), total, key=total.get)
+                for node_id in ranked:
+                    del total[node_id]
+                    key = self.tree.key(node_id)
+                    if key is None:
+                        self._remove(node_id)
+                    else:
+                        result.append(key)
+            return result
+
+
+def split_query(query):
+    # (законченные слова, набираемое слово или '') в форме словаря индекса
+    words = tokenize(query)
+    if not words or not (query[-1:].isalnum() or query[-1:] == '_'):
+        return words, ''
+    return words[:-1], words[-1]
@@ -0,0 +1,258 @@
+import re
+from collections import Counter
+from html.parser import HTMLParser
+
+# Преобразование HTML страницы в простой текст по тем же правилам, что и
+# QTextDocument.toPlainText() после setHtml(): текст — блоки документа через
+# перевод строки. Блок — абзац, пункт списка, ячейка таблицы; пустой блок
+# занимает следующий блочный тег, а не остаётся пустой строкой. Таблица
+# (рамка) сама разделяет блоки: перед ней пустой блок появляется, только если
+# она открывает документ или ячейку, после неё — всегда (в него попадает
+# следующий за таблицей текст без тега). <br /> — перевод строки,
+# изображение — символ U+FFFC, неразрывный пробел — обычный пробел.
+
+# Теги, открывающие новый блок
+BLOCK_TAGS = {'p', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'hr', 'dt', 'dd'}
+# Контейнеры: открывают блок, который вложенный <p> использует, а не дублирует
+CONTAINER_TAGS = {'td', 'th', 'div', 'blockquote', 'center'}
+# Ячейки таблицы: всегда новый блок, даже если предыдущий пуст
+CELL_TAGS = {'td', 'th'}
+# Теги, содержимое которых в текст не попадает
+SKIP_TAGS = {'head', 'style', 'script', 'title'}
+# Теги, в которых пробелы сохраняются как есть
+PRE_TAGS = {'pre'}
+
+_SPACES = re.compile(r'[ \t\n\r\f]+')
+_PRE_WRAP = re.compile(r'([\w\s,]+)\{[^}]*white-space:\s*pre(?:-wrap)?', re.IGNORECASE)
+
+
+class TextExtractor(HTMLParser):
+    # Потоковый разбор: feed() можно вызывать по частям, text() — в конце
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        # Текущий блок (None — блока нет: предыдущий закрыт или начата таблица).
+        # Документ начинается с пустого блока, который занимает что угодно.
+        self.current = []
+        self.initial = True
+        # Текущий пустой блок займёт следующий блочный тег: в блок ничего не
+        # записано с тех пор, как его открыл блочный тег. Пустой абзац Qt
+        # такого блока не оставляет; блок после таблицы наследует признак от
+        # её последней ячейки.
+        self.merge = True
+        # Сколько раз открыт каждый блочный тег: закрывающий тег без
+        # открывающего Qt пропускает
+        self.open_tags = Counter()
+        # Открытые таблицы (вложенная — последняя)
+        self.tables = []
+        self.skip = 0
+        self.style = []
+        self.pre_tags = set(PRE_TAGS)
+        self.pre = False
+        self.empty_paragraph = False
+        # HTML записан QTextDocument.toHtml() (<meta name="qrichtext">)
+        self.rich_text = False
+
+    def open_block(self, tag, attrs):
+        style = dict(attrs).get('style') or ''
+        # Qt помечает пустые абзацы так и кладёт в них <br />, который не считается текстом
+        fixed = '-qt-paragraph-type:empty' in style
+        if self.current is not None:
+            reuse = tag not in CELL_TAGS and (self.initial or self.merge and not fixed)
+            if not reuse:
+                self.close_block()
+        self.current = self.current if self.current is not None else []
+        self.initial = False
+        self.merge = not fixed
+        self.pre = tag in self.pre_tags or 'white-space:pre' in style.replace(' ', '')
+        self.empty_paragraph = fixed
+
+    def close_block(self):
+        if self.current is not None:
+            self.blocks.append(''.join(self.current))
+            self.current = None
+            self.initial = False
+            self.pre = False
+            self.empty_paragraph = False
+
+    def end_block(self):
+        # Закрывающий тег: непустой блок закончен, пустой ещё может занять
+        # следующий блочный тег. Перевод строки перед закрывающим тегом не считается.
+        if self.pre and not self.rich_text and self.current and self.current[-1].endswith('\n'):
+            self.current[-1] = self.current[-1][:-1]
+        if self.current:
+            self.close_block()
+
+    def append(self, text):
+        if self.current is None:
+            self.open_block(None, [])
+        self.current.append(text)
+        self.initial = False
+        self.merge = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'meta':
+            # <meta> лежит в <head>, содержимое которого пропускается
+            attrs = dict(attrs)
+            if attrs.get('name') == 'qrichtext' and attrs.get('content') == '1':
+                self.rich_text = True
+        elif tag in SKIP_TAGS:
+            self.skip += 1
+        elif self.skip:
+            return
+        elif tag in BLOCK_TAGS or tag in CONTAINER_TAGS:
+            if tag in CELL_TAGS and self.tables:
+                self.tables[-1].add_cell(dict(attrs))
+            self.open_block(tag, attrs)
+            if tag == 'hr':
+                # Блок линии закрыт сразу, и следующий блочный тег его не займёт
+                self.close_block()
+                self.merge = False
+            else:
+                self.open_tags[tag] += 1
+        elif tag == 'table':
+            # Начало рамки таблицы заменяет разделитель блоков
+            self.close_block()
+            self.merge = False
+            self.tables.append(_Table())
+        elif tag == 'tr' and self.tables:
+            self.end_row()
+            self.tables[-1].start_row()
+        elif tag == 'br':
+            # Разрыв строки Qt (U+2028); normalize() заменит его переводом строки
+            if not self.empty_paragraph:
+                self.append('\u2028')
+        elif tag == 'img':
+            self.append('\ufffc')
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in SKIP_TAGS:
+            self.skip = max(self.skip - 1, 0)
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip = max(self.skip - 1, 0)
+            if tag == 'style':
+                self.parse_style(''.join(self.style))
+                self.style = []
+        elif self.skip:
+            return
+        elif tag in BLOCK_TAGS or tag in CONTAINER_TAGS:
+            if self.open_tags[tag]:
+                self.open_tags[tag] -= 1
+                self.end_block()
+        elif tag == 'tr' and self.tables:
+            self.end_row()
+        elif tag == 'table' and self.tables:
+            self.end_row()
+            table = self.tables.pop()
+            if table.cells:
+                # Конец рамки таблицы, за ним всегда блок
+                table.pad(self.blocks)
+                self.current = []
+
+    def end_row(self):
+        table = self.tables[-1]
+        if table.row is not None:
+            self.close_block()
+            if not table.row_cells:
+                # Строка без ячеек: блок после таблицы не займёт следующий тег
+                self.merge = False
+            table.end_row(len(self.blocks))
+
+    def handle_data(self, data):
+        if self.skip:
+            if self.lasttag == 'style':
+                self.style.append(data)
+            return
+        if self.pre and self.current is not None:
+            if self.rich_text:
+                # В HTML из toHtml() переводы строк только оформляют разметку,
+                # настоящие записаны как <br />
+                data = data.replace('\n', '')
+            elif not self.current and data.startswith('\n'):
+                # Перевод строки сразу после открывающего тега не считается
+                data = data[1:]
+            if data:
+                self.append(data)
+            return
+        data = _SPACES.sub(' ', data)
+        if self.current is None or not self.current or self.current[-1].endswith(('\u2028', ' ')):
+            data = data.lstrip(' ')
+        if data:
+            self.append(data)
+
+    def parse_style(self, css):
+        # Теги из правил вида 'p, li { white-space: pre-wrap; }'
+        for selectors in _PRE_WRAP.findall(css):
+            self.pre_tags.update(selector.strip().lower() for selector in selectors.split(','))
+
+    def text(self):
+        self.close_block()
+        return normalize('\n'.join(self.blocks))
+
+
+class _Table:
+    # Сетка таблицы: Qt дополняет каждую строку пустыми ячейками до числа
+    # столбцов таблицы, учитывая colspan и rowspan
+
+    def __init__(self):
+        self.cells = False
+        self.row = None    # занятые столбцы текущей строки
+        self.row_cells = 0
+        self.column = 0
+        self.spans = {}    # столбец -> сколько следующих строк занимает ячейка сверху
+        self.rows = []     # (число блоков после строки, занятые столбцы)
+
+    def start_row(self):
+        self.row = {column for column, rows in self.spans.items() if rows}
+        self.row_cells = 0
+        self.spans = {column: rows - 1 for column, rows in self.spans.items() if rows > 1}
+        self.column = 0
+
+    def add_cell(self, attrs):
+        if self.row is None:
+            self.start_row()
+        while self.column in self.row:
+            self.column += 1
+        colspan = _span(attrs.get('colspan'))
+        rowspan = _span(attrs.get('rowspan'))
+        for column in range(self.column, self.column + colspan):
+            self.row.add(column)
+            if rowspan > 1:
+                self.spans[column] = max(self.spans.get(column, 0), rowspan - 1)
+        self.column += colspan
+        self.row_cells += 1
+        self.cells = True
+
+    def end_row(self, blocks):
+        self.rows.append((blocks, self.row))
+        self.row = None
+
+    def pad(self, blocks):
+        # Ячейки заполняют строку слева, пропуская занятые rowspan столбцы,
+        # поэтому свободные столбцы (пустые блоки) всегда в конце строки
+        columns = max((max(row) + 1 for _, row in self.rows if row), default=0)
+        for index, row in reversed(self.rows):
+            blocks[index:index] = [''] * (columns - len(row))
+
+
+def _span(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def normalize(text):
+    return text.replace('\xa0', ' ').replace('\u2028', '\n').replace('\u2029', '\n')
+
+
+def html_to_text(html, chunk_size=65536):
+    extractor = TextExtractor()
+    for start in range(0, len(html), chunk_size):
+        extractor.feed(html[start:start + chunk_size])
+    extractor.close()
+    return extractor.text()
@@ -0,0 +1,105 @@
+import os
+import logging
+from collections import OrderedDict
+from PyQt5.QtCore import QObject, QRunnable, QSize, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QImageReader, QPixmap
+
+# Размер миниатюр в списке изображений
+THUMBNAIL_SIZE = QSize(100, 100)
+
+
+class ThumbnailTask(QRunnable):
+    # Декодирует изображение в рабочем потоке пула. QImage (в отличие от
+    # QPixmap) можно создавать вне GUI-потока; в QPixmap он превращается в слоте.
+
+    def __init__(self, loader, digest, file_path, cache_path):
+        super().__init__()
+        self.loader = loader
+        self.digest = digest
+        self.file_path = file_path
+        self.cache_path = cache_path
+
+    def run(self):
+        image = QImage()
+        if os.path.exists(self.cache_path):
+            image = QImage(self.cache_path)
+        if image.isNull():
+            image = self.decode()
+            if not image.isNull():
+                try:
+                    os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                    tmp_path = self.cache_path + '.tmp'
+                    if image.save(tmp_path, 'PNG'):
+                        os.replace(tmp_path, self.cache_path)
+                except OSError as e:
+                    logging.error(f"Не удалось сохранить миниатюру '{self.cache_path}': {e}")
+        self.loader.decoded.emit(self.digest, image)
+
+    def decode(self):
+        reader = QImageReader(self.file_path)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid():
+            # Для JPEG декодер сразу выдаёт уменьшенное изображение
+            reader.setScaledSize(size.scaled(THUMBNAIL_SIZE, Qt.KeepAspectRatio))
+        image = reader.read()
+        if image.isNull():
+            logging.warning(f"Не удалось прочитать изображение '{self.file_path}': {reader.errorString()}")
+        elif image.width() > THUMBNAIL_SIZE.width() or image.height() > THUMBNAIL_SIZE.height():
+            image = image.scaled(THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        return image
+
+
+class ThumbnailLoader(QObject):
+    # Миниатюры вложений: LRU в памяти, кэш на диске по digest блоба (блоб
+    # с тем же digest — то же содержимое, его mtime меняется при повторной
+    # загрузке) и пул потоков для декодирования. Готовая миниатюра приходит сигналом
+    # thumbnail_ready(digest, pixmap) в GUI-потоке.
+    thumbnail_ready = pyqtSignal(str, QPixmap)
+    decoded = pyqtSignal(str, QImage)
+
+    def __init__(self, cache_folder, memory_entries=512, parent=None):
+        super().__init__(parent)
+        self.cache_folder = cache_folder
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.pending = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(QThreadPool.globalInstance().maxThreadCount() - 1, 1))
+        self.decoded.connect(self.on_decoded)
+
+    def cache_path(self, digest):
+        return os.path.join(self.cache_folder, digest[:2], f"{digest}.png")
+
+    def get(self, digest):
+        # Миниатюра из памяти или None
+        pixmap = self.memory.get(digest)
+        if pixmap is not None:
+            self.memory.move_to_end(digest)
+        return pixmap
+
+    def request(self, digest, file_path):
+        if digest in self.pending:
+            return
+        self.pending.add(digest)
+        self.pool.start(ThumbnailTask(self, digest, file_path, self.cache_path(digest)))
+
+    def cancel_pending(self):
+        # Снимает из очереди ещё не начатые задачи (например, при уходе из категории)
+        self.pool.clear()
+        self.pending.clear()
+
+    def on_decoded(self, digest, image):
+        self.pending.discard(digest)
+        if image.isNull():
+            return
+        pixmap = QPixmap.fromImage(image)
+        self.memory[digest] = pixmap
+        self.memory.move_to_end(digest)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+        self.thumbnail_ready.emit(digest, pixmap)
+
+    def close(self):
+        self.cancel_pending()
+        self.pool.waitForDone()
@@ -0,0 +1,250 @@
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, QPersistentModelIndex, Qt, pyqtSignal
+from nodestore import NodeStore, join, split
+
+ROOT = NodeStore.ROOT
+
+
+class SectionTreeModel(QAbstractItemModel):
+    # Модель дерева разделов поверх NodeStore базы. Дети узла загружаются при
+    # первом раскрытии (fetchMore), изменения приходят уведомлениями базы и
+    # применяются построчно: вставка, удаление, перенос строки или смена
+    # имени. internalId индекса — id узла в NodeStore. Для загруженных узлов
+    # хранится ключ -> id и id -> QPersistentModelIndex, который Qt сам
+    # сдвигает при изменении строк, так что индекс по ключу находится за O(1).
+    node_changed = pyqtSignal(str, object)
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.store = db.data["tree"]
+        self.node_changed.connect(self.on_node_changed)
+        db.add_listener(self.on_db_change)
+        self.reload()
+
+    def reload(self):
+        self.beginResetModel()
+        self.names = {ROOT: ''}
+        self.keys = {ROOT: ''}
+        self.parents = {ROOT: None}
+        # id -> список id детей по порядку строк; None — дети ещё не загружены
+        self.rows = {ROOT: None}
+        self.ids = {'': ROOT}
+        self.persistent = {}
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    # Интерфейс QAbstractItemModel
+
+    def index(self, row, column, parent=QModelIndex()):
+        if column != 0:
+            return QModelIndex()
+        rows = self.rows.get(self.node(parent))
+        if not rows or not 0 <= row < len(rows):
+            return QModelIndex()
+        return self.createIndex(row, 0, rows[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.index_of(self.parents.get(index.internalId(), ROOT))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self.rows.get(self.node(parent)) or ())
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        node_id = self.node(parent)
+        rows = self.rows.get(node_id)
+        if rows is None:
+            return self.store.has_children(node_id)
+        return bool(rows)
+
+    def canFetchMore(self, parent):
+        node_id = self.node(parent)
+        return node_id in self.rows and self.rows[node_id] is None
+
+    def fetchMore(self, parent):
+        node_id = self.node(parent)
+        if not self.canFetchMore(parent):
+            return
+        entries = self.store.child_entries(node_id)
+        if not entries:
+            self.rows[node_id] = []
+            return
+        self.beginInsertRows(parent, 0, len(entries) - 1)
+        self.rows[node_id] = []
+        for child_id, name in entries:
+            self.register(child_id, node_id, name)
+        self.endInsertRows()
+        for row, (child_id, _) in enumerate(entries):
+            self.persistent[child_id] = QPersistentModelIndex(self.createIndex(row, 0, child_id))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node_id = index.internalId()
+        if role == Qt.DisplayRole:
+            return self.names.get(node_id)
+        if role == Qt.UserRole:
+            return self.keys.get(node_id)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section == 0:
+            return "Разделы и Категории"
+        return None
+
+    # Вспомогательные методы
+
+    def node(self, index):
+        return index.internalId() if index.isValid() else ROOT
+
+    def key(self, index):
+        return self.keys.get(self.node(index), '')
+
+    def name(self, index):
+        return self.names.get(self.node(index), '')
+
+    def index_of(self, node_id):
+        if node_id == ROOT:
+            return QModelIndex()
+        persistent = self.persistent.get(node_id)
+        return QModelIndex(persistent) if persistent is not None else QModelIndex()
+
+    def index_for_key(self, key):
+        # Индекс узла по ключу; незагруженные предки подгружаются (O(глубины))
+        node_id = self.ids.get(key)
+        if node_id is None:
+            parent_key, _ = split(key)
+            if not key or self.index_for_key(parent_key) is None:
+                return None
+            parent_id = self.ids[parent_key]
+            if self.rows[parent_id] is None:
+                self.fetchMore(self.index_of(parent_id))
+            node_id = self.ids.get(key)
+            if node_id is None:
+                return None
+        return self.index_of(node_id)
+
+    def register(self, node_id, parent_id, name):
+        key = join(self.keys[parent_id], name)
+        self.names[node_id] = name
+        self.keys[node_id] = key
+        self.parents[node_id] = parent_id
+        self.rows[node_id] = None
+        self.ids[key] = node_id
+        self.rows[parent_id].append(node_id)
+
+    def unregister(self, node_id):
+        # Забывает загруженное поддерево узла
+        stack = [node_id]
+        while stack:
+            current = stack.pop()
+            stack.extend(self.rows.pop(current, None) or ())
+            self.ids.pop(self.keys.pop(current, None), None)
+            self.names.pop(current, None)
+            self.parents.pop(current, None)
+            self.persistent.pop(current, None)
+
+    def rekey(self, node_id, key):
+        stack = [(node_id, key)]
+        while stack:
+            current, current_key = stack.pop()
+            self.ids.pop(self.keys[current], None)
+            self.keys[current] = current_key
+            self.ids[current_key] = current
+            for child_id in self.rows[current] or ():
+                stack.append((child_id, join(current_key, self.names[child_id])))
+
+    def touch(self, node_id):
+        # У узла могла появиться или пропасть стрелка раскрытия
+        index = self.index_of(node_id)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+    # Уведомления базы
+
+    def on_db_change(self, op, args):
+        # Вызывается в потоке записи базы: только передаём событие в GUI-поток
+        if op in ("add_node", "delete_node", "move_node"):
+            self.node_changed.emit(op, args)
+
+    def on_node_changed(self, op, args):
+        # События могут отставать от дерева базы (например, узел уже подгружен
+        # fetchMore после изменения), поэтому каждое применяется идемпотентно
+        if op == "add_node":
+            self.insert_node(args[0])
+        elif op == "delete_node":
+            self.remove_node(args[0])
+        elif op == "move_node":
+            self.move_node(*args)
+
+    def insert_node(self, key):
+        parent_key, name = split(key)
+        parent_id = self.ids.get(parent_key)
+        if parent_id is None or key in self.ids:
+            return
+        rows = self.rows[parent_id]
+        if rows is None:
+            self.touch(parent_id)
+            return
+        node_id = self.store.node_id(key)
+        if node_id is None:
+            return
+        row = len(rows)
+        self.beginInsertRows(self.index_of(parent_id), row, row)
+        self.register(node_id, parent_id, name)
+        self.endInsertRows()
+        self.persistent[node_id] = QPersistentModelIndex(self.createIndex(row, 0, node_id))
+
+    def remove_node(self, key):
+        node_id = self.ids.get(key)
+        if node_id is None:
+            parent_id = self.ids.get(split(key)[0])
+            if parent_id is not None:
+                self.touch(parent_id)
+            return
+        parent_id = self.parents[node_id]
+        row = self.rows[parent_id].index(node_id)
+        self.beginRemoveRows(self.index_of(parent_id), row, row)
+        del self.rows[parent_id][row]
+        self.unregister(node_id)
+        self.endRemoveRows()
+        self.touch(parent_id)
+
+    def move_node(self, key, new_key):
+        node_id = self.ids.get(key)
+        new_parent_key, new_name = split(new_key)
+        new_parent_id = self.ids.get(new_parent_key)
+        if node_id is None:
+            # Исходный узел не загружен: для модели это появление нового
+            self.remove_node(key)
+            self.insert_node(new_key)
+            return
+        parent_id = self.parents[node_id]
+        if parent_id == new_parent_id:
+            # Переименование: строка остаётся на месте
+            self.names[node_id] = new_name
+            self.rekey(node_id, new_key)
+            self.touch(node_id)
+            return
+        if new_parent_id is None or self.rows[new_parent_id] is None:
+            self.remove_node(key)
+            if new_parent_id is not None:
+                self.touch(new_parent_id)
+            return
+        row = self.rows[parent_id].index(node_id)
+        destination = len(self.rows[new_parent_id])
+        self.beginMoveRows(self.index_of(parent_id), row, row, self.index_of(new_parent_id), destination)
+        del self.rows[parent_id][row]
+        self.rows[new_parent_id].append(node_id)
+        self.parents[node_id] = new_parent_id
+        self.names[node_id] = new_name
+        self.rekey(node_id, new_key)
+        self.endMoveRows()
+        self.touch(parent_id)
+        self.touch(new_parent_id)